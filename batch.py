@@ -0,0 +1,313 @@
+'''
+Batch execution of one program over many input cases with NumPy
+
+Runs the same program block for every case at once. Memory is a 2-D array
+with one row per case and one column per address the program uses (columns
+are allocated on first use and stored column-major, so a column is
+contiguous), and a boolean array of the same shape tells which words were
+written. Arithmetic and ASSIGN are column-wise vector operations.
+
+Cases that take the same path run in lockstep as a group. A JPF whose
+outcome differs between the cases of a group (or an indirect JP with
+different targets) splits the group, and groups that reach the same
+instruction are merged again; the group at the lowest instruction index
+runs first, so groups that split at a branch meet again behind it.
+
+Every case has the semantics of vm.VirtualMachine, with its own output,
+error and step budget. NumPy is only needed for this module.
+'''
+
+from code_gen import Opcode, DIRECT, IMMEDIATE, INDIRECT
+from vm import (MemoryAccessError, InvalidCommandError, StepLimitError, MAX_STEPS, MEMORY_SIZE,
+                INT_MIN, decode)
+
+try:
+    import numpy as np
+except ImportError: # batch execution is optional, the rest of the compiler runs without NumPy
+    np = None
+
+# opcodes that create their result word before reading their operands
+creates_result = frozenset([Opcode.ADD, Opcode.SUB, Opcode.MULT, Opcode.LT, Opcode.ASSIGN])
+
+
+def _wrap(values):
+    return ((values - INT_MIN) & 0xFFFFFFFF) + INT_MIN
+
+
+_binary = {
+    Opcode.ADD: lambda x, y: _wrap(x + y),
+    Opcode.SUB: lambda x, y: _wrap(x - y),
+    Opcode.MULT: lambda x, y: _wrap(x * y),
+    Opcode.EQ: lambda x, y: (x == y).astype(np.int64),
+    Opcode.LT: lambda x, y: (x < y).astype(np.int64),
+}
+
+
+class BatchMachine(object):
+    ''' Runs one program for cases inputs. inputs maps an address to the
+        initial value of that word in every case. After run(), outputs[c],
+        errors[c] and steps[c] are the printed values, the VMError (or None)
+        and the executed instructions of case c '''
+
+    def __init__(self, program_block, inputs, cases, max_steps=MAX_STEPS, memory_size=MEMORY_SIZE):
+        if np is None:
+            raise ImportError("batch execution needs NumPy")
+        self.program = [decode(instruction) for instruction in program_block]
+        self.cases = cases
+        self.max_steps = max_steps
+        self.memory_size = memory_size
+        self.columns = {} # address -> column of values and written
+        self.values = np.zeros((cases, 16), dtype=np.int64, order="F")
+        self.written = np.zeros((cases, 16), dtype=bool, order="F")
+        self.steps = np.zeros(cases, dtype=np.int64)
+        self.errors = [None] * cases
+        self.outputs = [[] for _ in range(cases)]
+        self.prints = [] # (cases, values) of every executed PRINT, in order
+        self.groups = {} # instruction index -> cases waiting there
+        self.splits = 0
+        for address, column_values in inputs.items():
+            if not 0 <= address < memory_size:
+                raise ValueError(f"input address {address} outside the memory")
+            column = self.column(address)
+            self.values[:, column] = _wrap(np.asarray(column_values, dtype=np.int64))
+            self.written[:, column] = True
+
+
+    def column(self, address):
+        column = self.columns.get(address)
+        if column is None:
+            column = self.columns[address] = len(self.columns)
+            if column == self.values.shape[1]:
+                self.grow()
+        return column
+
+
+    def columns_of(self, addresses):
+        ''' columns of an array of addresses '''
+        unique, inverse = np.unique(addresses, return_inverse=True)
+        return np.array([self.column(int(address)) for address in unique], dtype=np.int64)[inverse]
+
+
+    def grow(self):
+        cases, width = self.values.shape
+        values = np.zeros((cases, 2 * width), dtype=np.int64, order="F")
+        written = np.zeros((cases, 2 * width), dtype=bool, order="F")
+        values[:, :width] = self.values
+        written[:, :width] = self.written
+        self.values, self.written = values, written
+
+
+    def run(self):
+        if self.cases:
+            self.groups[0] = np.arange(self.cases)
+        while self.groups:
+            pc = min(self.groups)
+            self.run_group(pc, self.groups.pop(pc))
+        for cases, values in self.prints:
+            for case, value in zip(cases.tolist(), values.tolist()):
+                self.outputs[case].append(value)
+        return self.outputs
+
+
+    def report(self, case):
+        ''' the lines the tester prints for one case '''
+        lines = [f"PRINT    {value}" for value in self.outputs[case]]
+        if self.errors[case] is not None:
+            lines.append(str(self.errors[case]))
+        return "\n".join(lines)
+
+
+    def wait(self, pc, rows):
+        ''' queues cases at pc, merging them with the cases already waiting there '''
+        if not len(rows):
+            return
+        if pc in self.groups:
+            rows = np.sort(np.concatenate([self.groups[pc], rows]))
+        self.groups[pc] = rows
+
+
+    def fail(self, rows, error):
+        for case in rows.tolist():
+            self.errors[case] = error
+
+
+    def run_group(self, pc, rows):
+        ''' runs the cases in rows from pc until the next jump, the end of the program or an error '''
+        n = len(self.program)
+        remaining = self.max_steps - int(self.steps[rows].max())
+        executed = 0
+        while len(rows):
+            if pc >= n:
+                self.steps[rows] += executed
+                return
+            if executed == remaining:
+                self.steps[rows] += executed
+                remaining -= executed
+                executed = 0
+                out_of_steps = self.steps[rows] == self.max_steps
+                self.fail(rows[out_of_steps], StepLimitError())
+                rows = rows[~out_of_steps]
+                if not len(rows):
+                    return
+                remaining = self.max_steps - int(self.steps[rows].max())
+            executed += 1
+            decoded = self.program[pc]
+            if decoded is None:
+                self.steps[rows] += executed
+                self.fail(rows, InvalidCommandError())
+                return
+            opcode, operands = decoded
+            bad = np.zeros(len(rows), dtype=bool)
+
+            if opcode == Opcode.JP or opcode == Opcode.JPF:
+                taken = np.ones(len(rows), dtype=bool)
+                if opcode == Opcode.JPF:
+                    condition = self.read(rows, operands[0], bad)
+                    taken = (condition == 0) & ~bad
+                targets = self.address(rows, operands[-1])
+                invalid = taken & (targets < 0)
+                self.steps[rows] += executed
+                self.fail(rows[bad], MemoryAccessError())
+                self.fail(rows[invalid], InvalidCommandError())
+                jumping = taken & ~invalid
+                staying = rows[~bad & ~taken]
+                self.wait(pc + 1, staying)
+                targets, jumpers = targets[jumping], rows[jumping]
+                if len(jumpers) and (targets == targets[0]).all():
+                    paths = [int(targets[0])]
+                else:
+                    paths = np.unique(targets).tolist()
+                for target in paths:
+                    self.wait(target, jumpers if len(paths) == 1 else jumpers[targets == target])
+                if len(paths) + bool(len(staying)) > 1:
+                    self.splits += 1
+                return
+
+            if opcode == Opcode.PRINT:
+                values = self.read(rows, operands[0], bad)
+                self.prints.append((rows[~bad], values[~bad]))
+            else:
+                self.execute(rows, opcode, operands, bad)
+            if bad.any():
+                self.steps[rows] += executed
+                self.fail(rows[bad], MemoryAccessError())
+                rows = rows[~bad]
+                remaining -= executed
+                executed = 0
+                if not len(rows):
+                    return
+            pc += 1
+            if pc in self.groups:
+                # cases that took another path wait here, continue together
+                self.steps[rows] += executed
+                self.wait(pc, rows)
+                return
+
+
+    def indexer(self, rows):
+        ''' a slice where rows are all the cases, so that columns are read as views '''
+        return slice(None) if len(rows) == self.cases else rows
+
+
+    def pointer(self, rows, address):
+        ''' the addresses held by the word at address, 0 where it was never written '''
+        if not 0 <= address < self.memory_size:
+            return np.zeros(len(rows), dtype=np.int64)
+        column = self.column(address)
+        index = self.indexer(rows)
+        return np.where(self.written[index, column], self.values[index, column], 0)
+
+
+    def address(self, rows, operand):
+        ''' the address an operand writes to or jumps to in every case, the tester ignores a # there '''
+        mode, value = operand
+        if mode == INDIRECT:
+            return self.pointer(rows, value)
+        return np.full(len(rows), value, dtype=np.int64)
+
+
+    def read(self, rows, operand, bad):
+        ''' the value of operand in every case, marking the cases where it fails in bad '''
+        mode, value = operand
+        if mode == IMMEDIATE:
+            return np.full(len(rows), value, dtype=np.int64)
+        if mode == DIRECT:
+            return self.load(rows, value, bad)
+        addresses = self.pointer(rows, value)
+        if (addresses == addresses[0]).all():
+            # usually every case has the same stack frame
+            return self.load(rows, int(addresses[0]), bad)
+        return self.gather(rows, addresses, bad)
+
+
+    def load(self, rows, address, bad):
+        if not 0 <= address < self.memory_size:
+            bad[:] = True
+            return np.zeros(len(rows), dtype=np.int64)
+        column = self.column(address)
+        index = self.indexer(rows)
+        bad |= ~self.written[index, column]
+        return self.values[index, column].copy()
+
+
+    def gather(self, rows, addresses, bad):
+        inside = (addresses >= 0) & (addresses < self.memory_size)
+        values = np.zeros(len(rows), dtype=np.int64)
+        if inside.any():
+            columns = self.columns_of(addresses[inside])
+            inner = rows[inside]
+            found = self.written[inner, columns]
+            values[inside] = np.where(found, self.values[inner, columns], 0)
+            inside[inside] = found
+        bad |= ~inside
+        return values
+
+
+    def execute(self, rows, opcode, operands, bad):
+        sources, dest = operands[:-1], operands[-1]
+        addresses = self.address(rows, dest)
+        inside = (addresses >= 0) & (addresses < self.memory_size)
+        direct = inside.all() and (addresses == addresses[0]).all()
+        if direct:
+            column = self.column(int(addresses[0]))
+        if opcode in creates_result:
+            bad |= ~inside
+            if direct:
+                index = self.indexer(rows)
+                fresh = ~self.written[index, column]
+                if fresh.any():
+                    self.values[index, column] = np.where(fresh, 0, self.values[index, column])
+                    self.written[index, column] = True
+            elif inside.any():
+                inner = rows[inside]
+                columns = self.columns_of(addresses[inside])
+                self.values[inner, columns] = np.where(self.written[inner, columns], self.values[inner, columns], 0)
+                self.written[inner, columns] = True
+        if opcode == Opcode.ASSIGN:
+            result = self.read(rows, sources[0], bad)
+        else:
+            result = _binary[opcode](self.read(rows, sources[0], bad), self.read(rows, sources[1], bad))
+        bad |= ~inside
+        if direct:
+            if bad.any():
+                ok = ~bad
+                self.values[rows[ok], column] = result[ok]
+                self.written[rows[ok], column] = True
+            else:
+                index = self.indexer(rows)
+                self.values[index, column] = result
+                self.written[index, column] = True
+        else:
+            ok = ~bad
+            if ok.any():
+                inner = rows[ok]
+                columns = self.columns_of(addresses[ok])
+                self.values[inner, columns] = result[ok]
+                self.written[inner, columns] = True
+
+
+def run_batch(program_block, inputs, cases, max_steps=MAX_STEPS, memory_size=MEMORY_SIZE):
+    ''' runs program_block for every case and returns the finished BatchMachine '''
+    machine = BatchMachine(program_block, inputs, cases, max_steps, memory_size)
+    machine.run()
+    return machine
@@ -6,71 +6,151 @@ Date:               1 April 2020
 '''
 
 import os
-from scanner import SymbolTableManager
+from enum import IntEnum
+from functools import partial
+from scanner import number_value
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
 script_dir = os.path.join(script_dir, "compiler-st")
+
+
+class Opcode(IntEnum):
+    ''' Instruction set of the three-address code '''
+    ADD = 0
+    MULT = 1
+    SUB = 2
+    EQ = 3
+    LT = 4
+    ASSIGN = 5
+    JPF = 6
+    JP = 7
+    PRINT = 8
+    PLACEHOLDER = 9 # reserved slot, backpatched later or left empty
+
+
+# addressing modes of an operand, which is a (mode, value) pair
+DIRECT, IMMEDIATE, INDIRECT = range(3)
+mode_prefix = ("", "#", "@")
+
+
+# value of a logical constant
+logical_values = {"true": 1, "false": 0}
+
+# operators without an opcode of their own: (opcode, swap the operands, test the result for 0)
+derived_ops = {
+    "NE": (Opcode.EQ, False, True),
+    "GT": (Opcode.LT, True, False),
+    "GE": (Opcode.LT, False, True),
+    "LE": (Opcode.LT, True, True),
+}
+
+
+def imm(value):
+    return (IMMEDIATE, value)
+
+
+def ind(value):
+    return (INDIRECT, value)
+
+
+class Instruction(object):
+    ''' One three-address code instruction: an opcode and up to three
+        (mode, value) operands. Rendered as text only when the output is saved '''
+    __slots__ = ("opcode", "operands")
+
+    def __init__(self, opcode, operands=()):
+        self.opcode = opcode
+        self.operands = operands
+
+    def __str__(self):
+        if self.opcode == Opcode.PLACEHOLDER:
+            return "PLACEHOLDER"
+        args = [mode_prefix[mode] + str(value) for mode, value in self.operands]
+        args += [""] * (3 - len(args))
+        return f"({self.opcode.name}, {', '.join(args)})"
+
+    def __repr__(self):
+        return f"<Instruction {self}>"
+
+
 class MemoryManager(object):
-    ''' Manages shared information about memory locations '''
+    ''' Manages shared information about memory locations of one compilation '''
 
-    @classmethod
-    def init(cls):
-        cls.static_base_ptr = 1000
-        cls.temp_base_ptr   = 5000
-        cls.stack_base_ptr  = 10008
+    def __init__(self, symbols):
+        self.symbols = symbols # temp allocations are also counted per function in the symbol table
+        self.init()
 
-        cls.static_offset   = 0
-        cls.temp_offset     = 0
+    def init(self):
+        self.static_base_ptr = 1000
+        self.temp_base_ptr   = 5000
+        self.stack_base_ptr  = 10008
 
-        cls.args_field_offset   = 4
-        cls.locals_field_offset = 0
-        cls.arrays_field_offset = 0
-        cls.temps_field_offset  = 0
+        self.static_offset   = 0
+        self.temp_offset     = 0
 
-        cls.pb_index = 0  # program block index
+        self.args_field_offset   = 4
+        self.locals_field_offset = 0
+        self.arrays_field_offset = 0
+        self.temps_field_offset  = 0
 
+        self.pb_index = 0  # program block index
 
-    @classmethod
-    def reset(cls):
+
+    def reset(self):
         ''' call this when finished creating stack frame '''
-        cls.args_field_offset  = 4
-        cls.locals_field_offset = 0
-        cls.array_field_offset = 0
-        cls.temp_field_offset  = 0
+        self.args_field_offset  = 4
+        self.locals_field_offset = 0
+        self.array_field_offset = 0
+        self.temp_field_offset  = 0
 
 
-    @classmethod
-    def get_temp(cls):
-        temp = cls.temp_base_ptr + cls.temp_offset
-        cls.temp_offset += 4
-        SymbolTableManager.temp_stack[-1] += 4
+    def get_temp(self):
+        temp = self.temp_base_ptr + self.temp_offset
+        self.temp_offset += 4
+        self.symbols.temp_stack[-1] += 4
         return temp 
 
 
-    @classmethod
-    def get_static(cls, arity=1):
-        temp = cls.static_base_ptr + cls.static_offset
-        cls.static_offset += 4 * arity
+    def get_static(self, arity=1):
+        temp = self.static_base_ptr + self.static_offset
+        self.static_offset += 4 * arity
         return temp
 
 
-    @classmethod
-    def get_param_offset(cls, arity=1):
-        offset = cls.args_field_offset
-        cls.args_field_offset += 4
+    def reallocate_temps(self, program_block):
+        ''' packs the temps of the finished program into as few words as are live at once '''
+        from linear_scan import LinearScanAllocator # works on the instruction classes of this module
+        allocator = LinearScanAllocator(program_block, self.temp_base_ptr, self.temp_base_ptr + self.temp_offset)
+        if allocator.allocate():
+            self.temp_offset = 4 * allocator.size
+        return allocator
+
+
+    def get_param_offset(self, arity=1):
+        offset = self.args_field_offset
+        self.args_field_offset += 4
         return offset
 
 
 class CodeGen(object):
-    def __init__(self):
+    def __init__(self, context, optimize=True):
+        self.context = context
+        self.optimize = optimize # run the peephole optimizer on the finished program
+        self.removed_instructions = 0
+        self.symbols = context.symbols
+        self.memory = context.memory
         self.semantic_stack = []
         self.call_seq_stack = []
         self.cont_label_stack = []
         self.break_loc_stack = []
+        self.constant_pool = {} # (type, value) of a literal -> its shared static slot, reals by their lexeme
+        self.code_addresses = [] # instructions whose immediate source is a program block index
+        self.main_address = None
 
         self.semantic_routines = {
             "INIT_PROGRAM" : self.init_program_routine,
             "FINISH_PROGRAM" : self.finish_program_routine,
+            "#CG_MAIN_PROGRAM" : self.main_program_routine,
 
             "#CG_CALC_STACKFRAME_SIZE" : self.calc_stackframe_size_routine,
 
@@ -90,6 +170,8 @@ class CodeGen(object):
             "#CG_SAVE_OP" : self.save_op_routine,
             "#CG_RELOP" : self.relop_routine,
             "#CG_ADDOP" : self.addop_routine,
+            "#CG_NOT" : self.not_routine,
+            "#CG_PRINT" : self.print_routine,
 
             "#CG_LABEL" : self.label_routine,
             "#CG_SAVE" : self.save_routine,
@@ -97,6 +179,10 @@ class CodeGen(object):
 
             "#CG_IF_ELSE" : self.if_else_routine,
             "#CG_ELSE" : self.else_routine,
+            "#CG_IF" : self.if_routine,
+
+            "#CG_FOR_COND" : self.for_cond_routine,
+            "#CG_FOR" : self.for_routine,
 
             "#CG_INIT_WHILE_STACKS" : self.init_while_stacks_routine,
             "#CG_CONT_JP" : self.cont_jp_routine,
@@ -105,13 +191,24 @@ class CodeGen(object):
         }
 
         self.token_to_op = {
-            "+"  : "ADD",
-            "-"  : "SUB",
-            "==" : "EQ",
-            "<"  : "LT"
+            "+"  : Opcode.ADD,
+            "-"  : Opcode.SUB,
+            "==" : Opcode.EQ,
+            "<"  : Opcode.LT,
+            "plus" : Opcode.ADD,
+            "min"  : Opcode.SUB,
+            "mult" : Opcode.MULT,
+            "EQ"   : Opcode.EQ,
+            "LT"   : Opcode.LT,
+            "NE"   : "NE",
+            "LE"   : "LE",
+            "GT"   : "GT",
+            "GE"   : "GE",
+            "or"   : "or",
+            "and"  : "and",
         }
 
-        self.program_block = []
+        self.program_block = [] # Instruction objects, indexed by program block index
 
         self.output_file = os.path.join(os.path.dirname(script_dir), "output", "output.txt")
 
@@ -119,76 +216,70 @@ class CodeGen(object):
     @property
     def stack_frame_ptr_addr(self):
         ''' memory location for runtime stack frame pointer variable '''
-        return MemoryManager.static_base_ptr
+        return self.memory.static_base_ptr
 
 
     @property
     def print_addr(self):
-        return MemoryManager.static_base_ptr + 4
+        return self.memory.static_base_ptr + 4
 
 
     @property
     def arg_counter(self):
-        return [len(l) for l in SymbolTableManager.arg_list_stack]
+        return [len(l) for l in self.symbols.arg_list_stack]
 
 
     def _add_three_addr_code(self, three_addr_code, idx=None, insert=False, increment=True):
         if idx is None:
-            idx = MemoryManager.pb_index
+            idx = self.memory.pb_index
         if isinstance(three_addr_code, tuple):
             three_addr_code = self._get_three_addr_code(three_addr_code[0], *three_addr_code[1:])
         if insert:
-            self.program_block[idx] = (idx, three_addr_code)
+            self.program_block[idx] = three_addr_code
         else:
-            self.program_block.append((idx, three_addr_code))
+            self.program_block.append(three_addr_code)
         if increment:
-            MemoryManager.pb_index += 1
+            self.memory.pb_index += 1
 
 
     def _add_placeholder(self):
-        self._add_three_addr_code("PLACEHOLDER")
+        self._add_three_addr_code(Instruction(Opcode.PLACEHOLDER))
 
     
     def _add_print_code(self, t):
-        self._add_three_addr_code(self._get_three_addr_code("print", t))
+        self._add_three_addr_code(self._get_three_addr_code(Opcode.PRINT, t))
 
     
     def _get_three_addr_code(self, opcode, *args):
-        three_addr_code = "(" + opcode.upper()
-        for i in range(3):
-            try:
-                arg = args[i]
-                three_addr_code = three_addr_code + ", " + str(arg)
-            except IndexError:
-                three_addr_code = three_addr_code + ", "
-        return three_addr_code + ")"
+        ''' plain int arguments are direct addresses, the others (mode, value) operands '''
+        return Instruction(opcode, tuple((DIRECT, arg) if type(arg) is int else arg for arg in args))
 
 
     def _get_context_info(self):
-        scope_stack = SymbolTableManager.scope_stack
-        symbol_table = SymbolTableManager.symbol_table
+        scope_stack = self.symbols.scope_stack
+        symbol_table = self.symbols.symbol_table
         return scope_stack, symbol_table
 
 
     def _get_enclosing_fun(self, level=1):
         try:
-            scope_stack = SymbolTableManager.scope_stack
-            symbol_table = SymbolTableManager.symbol_table
+            scope_stack = self.symbols.scope_stack
+            symbol_table = self.symbols.symbol_table
             return symbol_table[scope_stack[-level] - 1]
         except IndexError:
             return None
 
 
     def _get_add_code(self, *args):
-        return self._get_three_addr_code("ADD", *args)
+        return self._get_three_addr_code(Opcode.ADD, *args)
 
     
     def _get_sub_code(self, *args):
-        return self._get_three_addr_code("SUB", *args)
+        return self._get_three_addr_code(Opcode.SUB, *args)
 
     
     def _get_static_addr(self, offset):
-        return MemoryManager.static_base_ptr + offset
+        return self.memory.static_base_ptr + offset
 
     
     def _resolve_addr(self, operand):
@@ -198,17 +289,42 @@ class CodeGen(object):
             addr = operand["address"] # static address
         else:
             # need to calculate dynamic address
-            t_arg_addr = MemoryManager.get_temp()
-            self._add_three_addr_code(self._get_add_code(self.stack_frame_ptr_addr, f"#{operand['offset']}", t_arg_addr))
-            addr = f"@{t_arg_addr}"
+            t_arg_addr = self.memory.get_temp()
+            self._add_three_addr_code(self._get_add_code(self.stack_frame_ptr_addr, imm(operand['offset']), t_arg_addr))
+            addr = ind(t_arg_addr)
         return addr
 
 
+    def _relocate(self, idx, instructions):
+        ''' inserts instructions before index idx and moves the jump targets and
+            the code address immediates at or after idx along with their code '''
+        shift = len(instructions)
+        for instruction in self.program_block:
+            if instruction.opcode in (Opcode.JP, Opcode.JPF):
+                mode, target = instruction.operands[-1]
+                if mode == DIRECT and target >= idx:
+                    instruction.operands = instruction.operands[:-1] + ((DIRECT, target + shift),)
+        for instruction in self.code_addresses:
+            (mode, target), dest = instruction.operands
+            if target >= idx:
+                instruction.operands = ((mode, target + shift), dest)
+        self.program_block[idx:idx] = instructions
+        self.memory.pb_index += shift
+
+
+    def _emit_constant_pool(self):
+        ''' hoists the initialization of the pooled constants right after the stack pointer setup '''
+        inits = [self._get_three_addr_code(Opcode.ASSIGN, imm(value), addr)
+                 for (_, value), addr in self.constant_pool.items()]
+        if inits:
+            self._relocate(1, inits)
+
+
     def save_output(self):
         with open(self.output_file, "w") as f:
             if self.program_block:
-                for lineno, three_addr_code in self.program_block:
-                    f.write(f"{lineno}\t{three_addr_code}\n")
+                for lineno, instruction in enumerate(self.program_block):
+                    f.write(f"{lineno}\t{instruction}\n")
             else:
                 f.write("Failed to generate output program.\n")
 
@@ -217,32 +333,46 @@ class CodeGen(object):
 
 
     def push_const_routine(self, input_token):
-        addr = MemoryManager.get_static()
-        const = "#" + input_token[1]
-        self._add_three_addr_code(self._get_three_addr_code("assign", const, addr))
+        # equal literals (12, 0012, 1100b, true and 1) share one slot, initialized once at program start
+        if input_token[1] in logical_values:
+            value = logical_values[input_token[1]]
+        else:
+            value = number_value(input_token[1])
+        if type(value) is float:
+            # the machine reads the leading digits of the text of an immediate, so a real keeps
+            # its lexeme (#0.00001 is 0 and #1e5 is 1, #1e-05 and #100000.0 would not be)
+            value = input_token[1]
+        key = (type(value), value)
+        addr = self.constant_pool.get(key)
+        if addr is None:
+            addr = self.constant_pool[key] = self.memory.get_static()
         self.semantic_stack.append(addr)
 
 
     def push_id_routine(self, input_token):
-        id_row = SymbolTableManager.symbol_table[input_token[1]]
+        id_row = self.symbols.symbol_table[input_token[1]]
         self.semantic_stack.append(id_row)
 
     
     def init_program_routine(self, input_token):
-        three_addr_code = self._get_three_addr_code("assign", f"#{MemoryManager.stack_base_ptr}", 
+        three_addr_code = self._get_three_addr_code(Opcode.ASSIGN, imm(self.memory.stack_base_ptr), 
                                   self.stack_frame_ptr_addr)
         self._add_three_addr_code(three_addr_code)
         # allocate space for stack ptr and print address (+0 and +4)
-        MemoryManager.static_offset += 8
+        self.memory.static_offset += 8
         for _ in range(3):
             self._add_placeholder()
         
 
+    def main_program_routine(self, input_token):
+        self.main_address = self.memory.pb_index
+
+
     def assign_routine(self, input_token):
         try:
             A = self._resolve_addr(self.semantic_stack.pop())
             R = self._resolve_addr(self.semantic_stack[-1])
-            self._add_three_addr_code(("assign", A, R))
+            self._add_three_addr_code((Opcode.ASSIGN, A, R))
         except IndexError:
             pass
 
@@ -253,7 +383,11 @@ class CodeGen(object):
 
 
     def mult_routine(self, input_token):
-        self.binary_op_routine("MULT")
+        try:
+            op = self.semantic_stack.pop(-2)
+            self.binary_op_routine(op)
+        except IndexError:
+            pass
 
 
     def relop_routine(self, input_token):
@@ -274,21 +408,68 @@ class CodeGen(object):
 
     def binary_op_routine(self, op):
         try:
-            R = MemoryManager.get_temp()
+            R = self.memory.get_temp()
             A2 = self._resolve_addr(self.semantic_stack.pop())
             A1 = self._resolve_addr(self.semantic_stack.pop())
+            self._add_operation(op, A1, A2, R)
+            self.semantic_stack.append(R)
+        except IndexError:
+            pass
+
+
+    def _add_operation(self, op, A1, A2, R):
+        ''' R = A1 op A2, the operators without an opcode are built from EQ and LT '''
+        if op == "and" or op == "or":
+            # a and b = not (a == 0) + (b == 0), a or b = not (a == 0) * (b == 0)
+            t1, t2 = self.memory.get_temp(), self.memory.get_temp()
+            self._add_three_addr_code((Opcode.EQ, A1, imm(0), t1))
+            self._add_three_addr_code((Opcode.EQ, A2, imm(0), t2))
+            self._add_three_addr_code((Opcode.ADD if op == "and" else Opcode.MULT, t1, t2, t1))
+            self._add_three_addr_code((Opcode.EQ, t1, imm(0), R))
+        elif op in derived_ops:
+            opcode, swap, negate = derived_ops[op]
+            if swap:
+                A1, A2 = A2, A1
+            if negate:
+                t = self.memory.get_temp()
+                self._add_three_addr_code((opcode, A1, A2, t))
+                self._add_three_addr_code((Opcode.EQ, t, imm(0), R))
+            else:
+                self._add_three_addr_code((opcode, A1, A2, R))
+        else:
             self._add_three_addr_code((op, A1, A2, R))
+
+
+    def not_routine(self, input_token):
+        try:
+            R = self.memory.get_temp()
+            A = self._resolve_addr(self.semantic_stack.pop())
+            self._add_three_addr_code((Opcode.EQ, A, imm(0), R))
             self.semantic_stack.append(R)
         except IndexError:
             pass
 
 
+    def print_routine(self, input_token):
+        try:
+            self._add_print_code(self._resolve_addr(self.semantic_stack.pop()))
+        except IndexError:
+            pass
+
+
     def finish_program_routine(self, input_token):
         # back patch main jump here
-        t_ret_addr = MemoryManager.get_temp()
-        self.program_block[1] = (1, self._get_sub_code(self.stack_frame_ptr_addr, "#4", t_ret_addr))
-        self.program_block[2] = (2, self._get_three_addr_code("assign", f"#{MemoryManager.pb_index}", f"@{t_ret_addr}"))
-        self.program_block[3] = (3, self._get_three_addr_code("jp", SymbolTableManager.findrow("main")["address"]))
+        t_ret_addr = self.memory.get_temp()
+        self.program_block[1] = self._get_sub_code(self.stack_frame_ptr_addr, imm(4), t_ret_addr)
+        self.program_block[2] = self._get_three_addr_code(Opcode.ASSIGN, imm(self.memory.pb_index), ind(t_ret_addr))
+        self.program_block[3] = self._get_three_addr_code(Opcode.JP, self.main_address)
+        self.code_addresses.append(self.program_block[2])
+        self._emit_constant_pool()
+        if self.optimize:
+            from peephole import optimize # peephole builds on the instruction classes of this module
+            self.removed_instructions = optimize(self.program_block, self.code_addresses)
+            self.memory.pb_index = len(self.program_block)
+            self.memory.reallocate_temps(self.program_block)
 
 
     def call_seq_caller_routine(self, input_token, backpatch=False):
@@ -304,38 +485,38 @@ class CodeGen(object):
 
         if backpatch:
             callee = stack.pop()
-            store_idx = MemoryManager.pb_index
+            store_idx = self.memory.pb_index
             t_ret_val = stack.pop()
             self.arg_counter[-1] = stack.pop()
-            MemoryManager.pb_index = stack.pop()
+            self.memory.pb_index = stack.pop()
         else:
             callee = stack[-(self.arg_counter[-1] + 1)]
         
-        caller = SymbolTableManager.get_enclosing_fun()
+        caller = self.symbols.get_enclosing_fun()
 
         if callee["lexim"] == "output":
             arg = stack.pop()
             stack.pop() # pop output row off the stack
             arg_addr = self._resolve_addr(arg)
-            self._add_three_addr_code(self._get_three_addr_code("assign", arg_addr, self.print_addr))
-            self._add_three_addr_code(self._get_three_addr_code("PRINT", self.print_addr))
+            self._add_three_addr_code(self._get_three_addr_code(Opcode.ASSIGN, arg_addr, self.print_addr))
+            self._add_three_addr_code(self._get_three_addr_code(Opcode.PRINT, self.print_addr))
             self.arg_counter[-1] = 0
             self.semantic_stack.append("void")
             return
 
         if not backpatch:
-            t_ret_val = MemoryManager.get_temp()
+            t_ret_val = self.memory.get_temp()
         
         if "frame_size" in caller:
             # current top_sp and access link pointer
             top_sp = self.stack_frame_ptr_addr
             frame_size = caller["frame_size"]
-            t_new_top_sp = MemoryManager.get_temp()
-            self._add_three_addr_code(self._get_add_code(top_sp, f"#{frame_size}", t_new_top_sp), insert=backpatch)
+            t_new_top_sp = self.memory.get_temp()
+            self._add_three_addr_code(self._get_add_code(top_sp, imm(frame_size), t_new_top_sp), insert=backpatch)
             # assign access link address to new stack frame
-            self._add_three_addr_code(self._get_three_addr_code("assign", top_sp, f"@{t_new_top_sp}"), insert=backpatch)
-            t_args = MemoryManager.get_temp()
-            self._add_three_addr_code(self._get_add_code(t_new_top_sp, "#4", t_args), insert=backpatch)
+            self._add_three_addr_code(self._get_three_addr_code(Opcode.ASSIGN, top_sp, ind(t_new_top_sp)), insert=backpatch)
+            t_args = self.memory.get_temp()
+            self._add_three_addr_code(self._get_add_code(t_new_top_sp, imm(4), t_args), insert=backpatch)
             n_args = callee["arity"]
             args = stack[-n_args:]
             for i in range(n_args):
@@ -347,34 +528,35 @@ class CodeGen(object):
                     arg_addr = arg["address"]  # static address
                 else:
                     # need to calculate dynamic address
-                    t_arg_addr = MemoryManager.get_temp()
-                    self._add_three_addr_code(self._get_add_code(self.stack_frame_ptr_addr, f"#{arg['offset']}", t_arg_addr), 
+                    t_arg_addr = self.memory.get_temp()
+                    self._add_three_addr_code(self._get_add_code(self.stack_frame_ptr_addr, imm(arg['offset']), t_arg_addr), 
                                               insert=backpatch)
-                    arg_addr = f"@{t_arg_addr}"
+                    arg_addr = ind(t_arg_addr)
                 if callee["params"][-i-1] == "array":
-                    arg_addr = f"#{arg}" # pass by reference
-                self._add_three_addr_code(self._get_three_addr_code("assign", arg_addr, f"@{t_args}"), insert=backpatch)
-                self._add_three_addr_code(self._get_add_code(t_args, "#4", t_args), insert=backpatch)
+                    arg_addr = imm(arg) # pass by reference
+                self._add_three_addr_code(self._get_three_addr_code(Opcode.ASSIGN, arg_addr, ind(t_args)), insert=backpatch)
+                self._add_three_addr_code(self._get_add_code(t_args, imm(4), t_args), insert=backpatch)
             fun_addr = stack.pop()["address"] 
             # put pointers for return address and return value in temp variables 
-            t_ret_addr = MemoryManager.get_temp()
-            t_ret_val_callee = MemoryManager.get_temp()
-            self._add_three_addr_code(self._get_sub_code(t_new_top_sp, "#4", t_ret_addr), insert=backpatch)
-            self._add_three_addr_code(self._get_sub_code(t_new_top_sp, "#8", t_ret_val_callee), insert=backpatch)
+            t_ret_addr = self.memory.get_temp()
+            t_ret_val_callee = self.memory.get_temp()
+            self._add_three_addr_code(self._get_sub_code(t_new_top_sp, imm(4), t_ret_addr), insert=backpatch)
+            self._add_three_addr_code(self._get_sub_code(t_new_top_sp, imm(8), t_ret_val_callee), insert=backpatch)
             # increment stack frame pointer by frame size TODO: update stack pointer via access link and static offset
-            # self._add_three_addr_code(self._get_add_code(top_sp, f"#{frame_size}", top_sp), insert=backpatch)
-            self._add_three_addr_code(self._get_three_addr_code("assign", t_new_top_sp, top_sp), insert=backpatch)
-            # self._add_three_addr_code(self._get_three_addr_code("print", top_sp), insert=backpatch)
+            # self._add_three_addr_code(self._get_add_code(top_sp, imm(frame_size), top_sp), insert=backpatch)
+            self._add_three_addr_code(self._get_three_addr_code(Opcode.ASSIGN, t_new_top_sp, top_sp), insert=backpatch)
+            # self._add_three_addr_code(self._get_three_addr_code(Opcode.PRINT, top_sp), insert=backpatch)
             # assign value for return address in callee stack frame
-            self._add_three_addr_code(self._get_three_addr_code("assign", f"#{MemoryManager.pb_index + 2}", f"@{t_ret_addr}"), 
-                                      insert=backpatch)
+            ret_addr_code = self._get_three_addr_code(Opcode.ASSIGN, imm(self.memory.pb_index + 2), ind(t_ret_addr))
+            self.code_addresses.append(ret_addr_code)
+            self._add_three_addr_code(ret_addr_code, insert=backpatch)
             # jump to function address
-            self._add_three_addr_code(self._get_three_addr_code("jp", fun_addr), insert=backpatch)
+            self._add_three_addr_code(self._get_three_addr_code(Opcode.JP, fun_addr), insert=backpatch)
             # fetch the return value to a temporary and push it to the stack
-            self._add_three_addr_code(self._get_three_addr_code("assign", f"@{t_ret_val_callee}", t_ret_val), insert=backpatch)
+            self._add_three_addr_code(self._get_three_addr_code(Opcode.ASSIGN, ind(t_ret_val_callee), t_ret_val), insert=backpatch)
             # decrement stack frame pointer by frame size
-            self._add_three_addr_code(self._get_sub_code(top_sp, f"#{frame_size}", top_sp), insert=backpatch)
-            # self._add_three_addr_code(self._get_three_addr_code("print", top_sp), insert=backpatch)
+            self._add_three_addr_code(self._get_sub_code(top_sp, imm(frame_size), top_sp), insert=backpatch)
+            # self._add_three_addr_code(self._get_three_addr_code(Opcode.PRINT, top_sp), insert=backpatch)
         else: # in recursive calls we need to backpatch
             callee = stack[-(self.arg_counter[-1] + 1)]
             self.call_seq_stack += self.semantic_stack[-(self.arg_counter[-1] + 1):]
@@ -384,7 +566,7 @@ class CodeGen(object):
                 if not isinstance(arg, int) and "offset" in arg:
                     num_offset_vars += 1
             self.semantic_stack = self.semantic_stack[:-(self.arg_counter[-1] + 1)]
-            self.call_seq_stack.append(MemoryManager.pb_index)
+            self.call_seq_stack.append(self.memory.pb_index)
             self.call_seq_stack.append(self.arg_counter[-1])
             self.call_seq_stack.append(t_ret_val)
             self.call_seq_stack.append(callee)
@@ -393,7 +575,7 @@ class CodeGen(object):
                 self._add_placeholder()
 
         if backpatch:
-            MemoryManager.pb_index = store_idx
+            self.memory.pb_index = store_idx
         else:
             if callee["type"] == "void":
                 self.semantic_stack.append("void")
@@ -409,13 +591,13 @@ class CodeGen(object):
         ''' Calculates size of callee's stack frame and local variable field 
             and stores it into symbol table '''
         scope_stack, symbol_table = self._get_context_info()
-        fun_row = SymbolTableManager.get_enclosing_fun()
+        fun_row = self.symbols.get_enclosing_fun()
         fun_row["args_size"] = 0
         fun_row["locals_size"] = 0
         fun_row["arrays_size"] = 0
-        fun_row["temps_size"] = SymbolTableManager.temp_stack.pop()
-        if not SymbolTableManager.temp_stack:
-            SymbolTableManager.temp_stack = [0]
+        fun_row["temps_size"] = self.symbols.temp_stack.pop()
+        if not self.symbols.temp_stack:
+            self.symbols.temp_stack = [0]
         for i in range(scope_stack[-1], len(symbol_table)):
             if symbol_table[i]["role"] == "local_var":
                 if symbol_table[i]["type"] == "array":
@@ -435,30 +617,30 @@ class CodeGen(object):
         while self.call_seq_stack:
             self.call_seq_caller_routine(input_token, backpatch=True)
 
-        MemoryManager.reset()
+        self.memory.reset()
 
     
     def set_retval_routine(self, input_token):
         # save return value address into temp variable
-        t = MemoryManager.get_temp()
-        self._add_three_addr_code(self._get_sub_code(self.stack_frame_ptr_addr, "#8", t))
+        t = self.memory.get_temp()
+        self._add_three_addr_code(self._get_sub_code(self.stack_frame_ptr_addr, imm(8), t))
         try:
             retval_addr = self._resolve_addr(self.semantic_stack.pop())
         except IndexError:
-            ta_code = self._get_three_addr_code("assign", "#0", f"@{t}")
+            ta_code = self._get_three_addr_code(Opcode.ASSIGN, imm(0), ind(t))
             self._add_three_addr_code(ta_code)
         else:
-            ta_code = self._get_three_addr_code("assign", retval_addr, f"@{t}")
+            ta_code = self._get_three_addr_code(Opcode.ASSIGN, retval_addr, ind(t))
             self._add_three_addr_code(ta_code)
 
 
     def return_seq_callee_routine(self, input_token):
-        t = MemoryManager.get_temp()
+        t = self.memory.get_temp()
         # save return address into temp variable
-        self._add_three_addr_code(self._get_sub_code(self.stack_frame_ptr_addr, "#4", t))
-        t2 = MemoryManager.get_temp()
-        self._add_three_addr_code(self._get_three_addr_code("assign", f"@{t}", t2))
-        self._add_three_addr_code(self._get_three_addr_code("jp", f"@{t2}"))
+        self._add_three_addr_code(self._get_sub_code(self.stack_frame_ptr_addr, imm(4), t))
+        t2 = self.memory.get_temp()
+        self._add_three_addr_code(self._get_three_addr_code(Opcode.ASSIGN, ind(t), t2))
+        self._add_three_addr_code(self._get_three_addr_code(Opcode.JP, ind(t2)))
     
 
     def close_stmt_routine(self, input_token):
@@ -467,11 +649,11 @@ class CodeGen(object):
 
     
     def label_routine(self, input_token):
-        self.semantic_stack.append(MemoryManager.pb_index)
+        self.semantic_stack.append(self.memory.pb_index)
 
 
     def save_routine(self, input_token):
-        self.semantic_stack.append(MemoryManager.pb_index)
+        self.semantic_stack.append(self.memory.pb_index)
         self._add_placeholder()
 
 
@@ -480,8 +662,8 @@ class CodeGen(object):
             saved_idx = self.semantic_stack.pop()
             cond = self._resolve_addr(self.semantic_stack.pop())
             jp_target = self.semantic_stack.pop()
-            self._add_three_addr_code(("jp", jp_target))
-            self._add_three_addr_code(("jpf", cond, MemoryManager.pb_index), 
+            self._add_three_addr_code((Opcode.JP, jp_target))
+            self._add_three_addr_code((Opcode.JPF, cond, self.memory.pb_index), 
                                       idx=saved_idx, insert=True, increment=False)
         except IndexError:
             pass
@@ -490,42 +672,82 @@ class CodeGen(object):
             self.cont_label_stack.pop()
             break_locs = self.break_loc_stack.pop()
             for bloc in break_locs:
-                self._add_three_addr_code(("jp", MemoryManager.pb_index), 
+                self._add_three_addr_code((Opcode.JP, self.memory.pb_index), 
                                            idx=bloc, insert=True, increment=False)
         except IndexError:
             pass
         
 
     def init_while_stacks_routine(self, input_token):
-        self.cont_label_stack.append(MemoryManager.pb_index)
+        self.cont_label_stack.append(self.memory.pb_index)
         self.break_loc_stack.append([])
 
 
     def cont_jp_routine(self, input_token):
-        self._add_three_addr_code(("jp", self.cont_label_stack[-1]))
+        self._add_three_addr_code((Opcode.JP, self.cont_label_stack[-1]))
 
 
     def break_jp_save_routine(self, input_token):
-        self.break_loc_stack[-1].append(MemoryManager.pb_index)
+        self.break_loc_stack[-1].append(self.memory.pb_index)
         self._add_placeholder()
 
 
     def if_else_routine(self, input_token):
         try:
             saved_idx = self.semantic_stack.pop()
-            self._add_three_addr_code(("jp", MemoryManager.pb_index), 
+            self._add_three_addr_code((Opcode.JP, self.memory.pb_index), 
+                                        idx=saved_idx, insert=True, increment=False)
+        except IndexError:
+            pass
+
+
+    def if_routine(self, input_token):
+        try:
+            saved_idx = self.semantic_stack.pop()
+            cond = self._resolve_addr(self.semantic_stack.pop())
+            self._add_three_addr_code((Opcode.JPF, cond, self.memory.pb_index),
                                         idx=saved_idx, insert=True, increment=False)
         except IndexError:
             pass
 
 
+    def for_cond_routine(self, input_token):
+        ''' expects semantic stack to contain:
+            ----------------------------------
+            ss(top)     = limit addr
+            ss(top - 1) = loop label
+            ss(top - 2) = loop variable row
+        '''
+        try:
+            limit = self.semantic_stack.pop()
+            self.semantic_stack.append(self.semantic_stack[-2])
+            self.semantic_stack.append(limit)
+            self.binary_op_routine("LE")
+        except IndexError:
+            pass
+
+
+    def for_routine(self, input_token):
+        try:
+            saved_idx = self.semantic_stack.pop()
+            cond = self._resolve_addr(self.semantic_stack.pop())
+            jp_target = self.semantic_stack.pop()
+            var = self._resolve_addr(self.semantic_stack.pop())
+            self._add_three_addr_code((Opcode.ADD, var, imm(1), var))
+            self._add_three_addr_code((Opcode.JP, jp_target))
+            self._add_three_addr_code((Opcode.JPF, cond, self.memory.pb_index),
+                                      idx=saved_idx, insert=True, increment=False)
+        except IndexError:
+            pass
+
+
     def else_routine(self, input_token):
         try:
             saved_idx = self.semantic_stack.pop()
             cond = self._resolve_addr(self.semantic_stack.pop())
-            self.semantic_stack.append(MemoryManager.pb_index)
+            self.semantic_stack.append(self.memory.pb_index)
             self._add_placeholder()
-            self._add_three_addr_code(("jpf", cond, MemoryManager.pb_index), 
+            self._add_three_addr_code((Opcode.JPF, cond, self.memory.pb_index), 
                                         idx=saved_idx, insert=True, increment=False)
         except IndexError:
             pass
@@ -535,8 +757,23 @@ class CodeGen(object):
 
 
     def code_gen(self, action_symbol, input_token):
-        if not SymbolTableManager.error_flag:
+        if not self.symbols.error_flag:
             try:
                 self.semantic_routines[action_symbol](input_token)
             except Exception as e:
-                print(f"Error in semantic routine {action_symbol}:", str(e))
\ No newline at end of file
+                print(f"Error in semantic routine {action_symbol}:", str(e))
+
+
+    def bind_routine(self, action_symbol):
+        ''' returns code_gen pre-bound to the routine of action_symbol '''
+        routine = self.semantic_routines.get(action_symbol)
+        if routine is None:
+            return partial(self.code_gen, action_symbol)
+
+        def gen(input_token):
+            if not self.symbols.error_flag:
+                try:
+                    routine(input_token)
+                except Exception as e:
+                    print(f"Error in semantic routine {action_symbol}:", str(e))
+        return gen
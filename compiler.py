@@ -1,26 +1,18 @@
 import os
 import sys
 import time
-import platform
-import subprocess as sp
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, os.path.join(script_dir, "modules"))
 
 from parser import Parser
-from scanner import Scanner, SymbolTableManager
-from semantic_analyser import SemanticAnalyser
-from code_gen import CodeGen, MemoryManager
-
-# Maximal virtual memory for compiled program process (in bytes).
-MAX_VIRTUAL_MEMORY = 50 * 1024 * 1024 # 50 MB
-
-def limit_virtual_memory():
-    import resource
-    resource.setrlimit(resource.RLIMIT_AS, (MAX_VIRTUAL_MEMORY, MAX_VIRTUAL_MEMORY))
+from context import CompilationContext
+import vm
+import translator
 
 def compile(source_file):
     run = True
+    translate = True # run the program as generated Python code instead of in the VM
     verbose = True
     error_files = True
     abstract_syntax_tree = True
@@ -28,14 +20,13 @@ def compile(source_file):
     tokens = True
 
     print("Compiling", source_file)
-    SymbolTableManager.init()
-    MemoryManager.init()
-    parser = Parser(source_file)
+    context = CompilationContext()
+    parser = Parser(source_file, context, build_tree=abstract_syntax_tree)
     start = time.time()
     parser.parse()
     stop = time.time() - start
     print(f"Compilation took {stop:.6f} s")
-    if not SymbolTableManager.error_flag:
+    if not context.error_flag:
         print("Compilation successful!")
     else:
         print("Compilation failed due to the following errors:\n")
@@ -53,34 +44,23 @@ def compile(source_file):
         parser.scanner.save_lexical_errors()
         parser.semantic_analyzer.save_semantic_errors()
     parser.code_generator.save_output()
-    if run and not SymbolTableManager.error_flag:
+    if run and not context.error_flag:
         print("Executing compiled program")
-        plat = platform.system()
-        if plat == "Windows":
-            tester_file = os.path.join(script_dir, "interpreter", "tester_Windows.exe")
+        start = time.time()
+        backend = translator if translate else vm
+        machine = backend.run(parser.code_generator.program_block)
+        stop = time.time() - start
+        print(f"Execution took {stop:.6f} s ({machine.steps} instructions)")
+        if verbose and machine.stats:
+            fusions = ", ".join(f"{count} {kind}" for kind, count in machine.stats["fusions"].items())
+            print(f"{machine.stats['dispatches']} dispatches, superinstructions: {fusions}")
+        print("Program output:")
+        if verbose:
+            print(machine.report())
         else:
-            raise RuntimeError("Unsupported operating system for code execution!")
-        output_file = os.path.join(script_dir, "output", "output.txt")
-        output_dir = os.path.dirname(output_file)
-        if os.path.exists(output_file):
-            preexec_fn = limit_virtual_memory if plat == "Linux" else None
-            stderr = sp.PIPE if not verbose else None
-            start = time.time()
-            try:
-                tester_output = sp.check_output(tester_file, cwd=output_dir,
-                                                stderr=stderr, timeout=10,
-                                                preexec_fn=preexec_fn).decode("utf-8")
-            except sp.TimeoutExpired:
-                print("RuntimeError: Execution timed out!")
-            else:
-                if not verbose:
-                    tester_output = "\n".join([line.replace("PRINT", "").strip()
-                                               for line in tester_output.splitlines()
-                                               if line.startswith("PRINT")])
-                stop = time.time() - start
-                print(f"Execution took {stop:.6f} s")
-            print("Program output:")
-            print(tester_output)
+            print("\n".join(str(value) for value in machine.output))
+            if isinstance(machine.error, vm.StepLimitError):
+                print(machine.error)
 
 if __name__ == "__main__":
     compile()
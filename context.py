@@ -0,0 +1,18 @@
+from scanner import SymbolTableManager
+from code_gen import MemoryManager
+
+
+class CompilationContext(object):
+    ''' Owns the mutable state of a single compilation (symbol table, scope and
+        temp stacks, memory offsets, program block index and the error flag).
+        Scanner, Parser, SemanticAnalyser and CodeGen receive it explicitly, so
+        several compilations can run side by side in one process; the grammar
+        and DFA tables are module level and only ever read '''
+
+    def __init__(self):
+        self.symbols = SymbolTableManager()
+        self.memory = MemoryManager(self.symbols)
+
+    @property
+    def error_flag(self):
+        return self.symbols.error_flag
@@ -0,0 +1,215 @@
+'''
+LL(1) table generator for the predictive parser
+
+Takes a declarative grammar, one rule per line:
+
+    Statement-list -> Statement Statement-list | EPSILON
+
+Symbols that never appear on a left-hand side are terminals, EPSILON is the
+empty string and symbols starting with "#" are action symbols (they derive
+the empty string but are kept in the productions). The generator computes
+FIRST and FOLLOW sets, fills the parsing table, marks the remaining cells
+of FOLLOW(A) and of the end marker as SYNCH and everything else as EMPTY
+(skip the input token), and reports LL(1) conflicts. The result is cached as a pickle keyed by the
+hash of the grammar, so later runs only load it.
+'''
+
+import os
+import pickle
+import hashlib
+from array import array
+
+
+EPSILON = "EPSILON"
+END_MARKER = "$"
+
+cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "__pycache__")
+
+with open(os.path.abspath(__file__), "rb") as f: # cached tables are invalidated by changes to the generator too
+    _generator_hash = hashlib.sha256(f.read()).hexdigest()
+
+
+class GrammarError(Exception):
+    pass
+
+
+class LL1Tables(object):
+    ''' Generated parsing tables. productions[i] is the right-hand side of
+        production i (the last two are the SYNCH and EMPTY markers) and
+        table[row * len(terminals) + col] is the production index for
+        non-terminal row and lookahead terminal col '''
+
+    def __init__(self, start, non_terminals, terminals, productions, lhs, table, first, follow, conflicts):
+        self.start = start
+        self.non_terminals = non_terminals
+        self.terminals = terminals
+        self.productions = productions
+        self.lhs = lhs
+        self.table = table
+        self.first = first
+        self.follow = follow
+        self.conflicts = conflicts
+
+    @property
+    def synch(self):
+        return len(self.productions) - 2
+
+    @property
+    def empty(self):
+        return len(self.productions) - 1
+
+    def conflict_messages(self):
+        return [f"LL(1) conflict in {A} on '{a}': keeping {A} -> {' '.join(self.productions[kept])}, "
+                f"dropping {A} -> {' '.join(self.productions[dropped])}" for A, a, kept, dropped in self.conflicts]
+
+    def report(self):
+        ''' human readable FIRST/FOLLOW sets and conflicts '''
+        lines = []
+        for A in self.non_terminals:
+            lines.append(f"FIRST({A}) = {{{', '.join(sorted(self.first[A]))}}}")
+            lines.append(f"FOLLOW({A}) = {{{', '.join(sorted(self.follow[A]))}}}")
+        lines += self.conflict_messages()
+        if not self.conflicts:
+            lines.append("The grammar is LL(1).")
+        return "\n".join(lines)
+
+
+def parse_grammar(text):
+    ''' returns the list of (lhs, rhs) productions in the order of the text '''
+    rules = []
+    for lineno, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line:
+            continue
+        if "->" not in line:
+            raise GrammarError(f"line {lineno}: expected 'A -> ...', got '{line}'")
+        A, alternatives = line.split("->", 1)
+        A = A.strip()
+        for alternative in alternatives.split("|"):
+            rhs = alternative.split()
+            if not rhs:
+                raise GrammarError(f"line {lineno}: empty alternative in rule for {A}, use {EPSILON}")
+            rules.append((A, rhs))
+    return rules
+
+
+def _first_of(symbols, first, non_terminals):
+    ''' FIRST set of a sequence of symbols (contains EPSILON if it can vanish) '''
+    result = set()
+    for X in symbols:
+        if X == EPSILON or X.startswith("#"):
+            continue
+        if X not in non_terminals:
+            result.add(X)
+            return result
+        result |= first[X] - {EPSILON}
+        if EPSILON not in first[X]:
+            return result
+    result.add(EPSILON)
+    return result
+
+
+def build_tables(text, start, extra_terminals=()):
+    ''' computes the LL(1) tables of the grammar. extra_terminals are tokens the
+        scanner can produce that the grammar does not use; they get table columns
+        so that they are reported as illegal instead of unknown '''
+    rules = parse_grammar(text)
+    non_terminals = []
+    for A, _ in rules:
+        if A not in non_terminals:
+            non_terminals.append(A)
+    if start not in non_terminals:
+        raise GrammarError(f"start symbol {start} has no rules")
+    nt_set = set(non_terminals)
+
+    terminals = []
+    for _, rhs in rules:
+        for X in rhs:
+            if X not in nt_set and X != EPSILON and not X.startswith("#") and X not in terminals:
+                terminals.append(X)
+    for a in extra_terminals:
+        if a not in terminals and a != END_MARKER:
+            terminals.append(a)
+    terminals.append(END_MARKER)
+
+    first = {A: set() for A in non_terminals}
+    changed = True
+    while changed:
+        changed = False
+        for A, rhs in rules:
+            new = _first_of(rhs, first, nt_set) - first[A]
+            if new:
+                first[A] |= new
+                changed = True
+
+    follow = {A: set() for A in non_terminals}
+    follow[start].add(END_MARKER)
+    changed = True
+    while changed:
+        changed = False
+        for A, rhs in rules:
+            for i, X in enumerate(rhs):
+                if X not in nt_set:
+                    continue
+                rest = _first_of(rhs[i + 1:], first, nt_set)
+                new = (rest - {EPSILON}) | (follow[A] if EPSILON in rest else set())
+                if new - follow[X]:
+                    follow[X] |= new
+                    changed = True
+
+    productions = [rhs for _, rhs in rules] + [["SYNCH"], ["EMPTY"]]
+    lhs = [A for A, _ in rules]
+    synch, empty = len(productions) - 2, len(productions) - 1
+    if empty > 0xFFFF:
+        raise GrammarError("too many productions for the table")
+
+    col = {a: i for i, a in enumerate(terminals)}
+    n_cols = len(terminals)
+    table = array("B" if empty <= 0xFF else "H", [empty]) * (len(non_terminals) * n_cols)
+    conflicts = []
+    for prod_idx, (A, rhs) in enumerate(rules):
+        row = non_terminals.index(A)
+        predict = _first_of(rhs, first, nt_set)
+        if EPSILON in predict:
+            predict = (predict - {EPSILON}) | follow[A]
+        for a in sorted(predict, key=col.get):
+            cell = row * n_cols + col[a]
+            if table[cell] != empty:
+                conflicts.append((A, a, table[cell], prod_idx)) # the earlier production wins
+            else:
+                table[cell] = prod_idx
+    for row, A in enumerate(non_terminals):
+        for a in follow[A] | {END_MARKER}: # skipping the end marker would never terminate
+            cell = row * n_cols + col[a]
+            if table[cell] == empty:
+                table[cell] = synch
+
+    return LL1Tables(start, tuple(non_terminals), tuple(terminals), tuple(productions), tuple(lhs),
+                     table, first, follow, conflicts)
+
+
+def grammar_hash(text, start, extra_terminals=()):
+    key = "\0".join([_generator_hash, start, text, " ".join(extra_terminals)])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def load_tables(text, start, extra_terminals=()):
+    ''' returns the tables of the grammar, from the cache when the grammar is unchanged '''
+    cache_file = os.path.join(cache_dir, f"ll1_tables.{grammar_hash(text, start, extra_terminals)[:16]}.pickle")
+    try:
+        with open(cache_file, "rb") as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        pass
+    tables = build_tables(text, start, extra_terminals)
+    for message in tables.conflict_messages():
+        print(message)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "wb") as f:
+            pickle.dump(tables, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file) # atomic, concurrent compilers may race here
+    except OSError:
+        pass
+    return tables
@@ -1,18 +1,156 @@
 import os
-from scanner import Scanner
-from scanner import SymbolTableManager
+import math
+from scanner import Scanner, number_value, number_lexeme
+from context import CompilationContext
 
 script_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 script_dir = os.path.join(script_dir, "compiler-st")
-# Класс для представления токенов
-class Token:
-    def __init__(self, type, value):
-        self.type = type
-        self.value = value
+# Токены парсер хранит как кортежи (вид, значение) прямо из сканера, без обёрток
+def token_text(token):
+    return f"({token[0]}, {token[1]})"
+
+
+# Узлы AST. Поля перечислены в __slots__, kind - имя узла в сообщениях об ошибках.
+# __repr__ печатает узел как кортеж (kind, поля...), как раньше печатались кортежи AST
+class Node:
+    __slots__ = ()
+    kind = None
+
+    def fields(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
 
     def __repr__(self):
-        return f"({self.type}, {self.value})"
-    
+        # итеративно: глубоко вложенные выражения не должны упираться в предел рекурсии
+        parts = []
+        stack = [(False, self)]
+        while stack:
+            is_text, item = stack.pop()
+            if is_text:
+                parts.append(item)
+            elif isinstance(item, Node):
+                items = (item.kind,) + item.fields()
+                stack.append((True, ")"))
+                for i in range(len(items) - 1, -1, -1):
+                    stack.append((False, items[i]))
+                    stack.append((True, ", " if i else "("))
+            elif type(item) is list and item:
+                stack.append((True, "]"))
+                for i in range(len(item) - 1, -1, -1):
+                    stack.append((False, item[i]))
+                    stack.append((True, ", " if i else "["))
+            elif type(item) is tuple:
+                parts.append(token_text(item))
+            else:
+                parts.append(repr(item))
+        return "".join(parts)
+
+class Declaration(Node):
+    __slots__ = ('identifiers', 'type_')
+    kind = 'declaration'
+
+    def __init__(self, identifiers, type_):
+        self.identifiers = identifiers
+        self.type_ = type_
+
+class Assignment(Node):
+    __slots__ = ('identifier', 'expression')
+    kind = 'assignment'
+
+    def __init__(self, identifier, expression):
+        self.identifier = identifier
+        self.expression = expression
+
+class Write(Node):
+    __slots__ = ('expressions',)
+    kind = 'write'
+
+    def __init__(self, expressions):
+        self.expressions = expressions
+
+class Read(Node):
+    __slots__ = ('identifiers',)
+    kind = 'read'
+
+    def __init__(self, identifiers):
+        self.identifiers = identifiers
+
+class If(Node):
+    __slots__ = ('condition', 'then_branch', 'else_branch')
+    kind = 'if'
+
+    def __init__(self, condition, then_branch, else_branch):
+        self.condition = condition
+        self.then_branch = then_branch
+        self.else_branch = else_branch
+
+class While(Node):
+    __slots__ = ('condition', 'body')
+    kind = 'while'
+
+    def __init__(self, condition, body):
+        self.condition = condition
+        self.body = body
+
+class For(Node):
+    __slots__ = ('initialization', 'condition', 'body')
+    kind = 'for'
+
+    def __init__(self, initialization, condition, body):
+        self.initialization = initialization
+        self.condition = condition
+        self.body = body
+
+class BinaryOp(Node):
+    __slots__ = ('operator', 'left', 'right')
+    kind = 'binary_op'
+
+    def __init__(self, operator, left, right):
+        self.operator = operator
+        self.left = left
+        self.right = right
+
+class UnaryOp(Node):
+    __slots__ = ('operator', 'operand')
+    kind = 'unary_op'
+
+    def __init__(self, operator, operand):
+        self.operator = operator
+        self.operand = operand
+
+class Identifier(Node):
+    __slots__ = ('value',)
+    kind = 'identifier'
+
+    def __init__(self, value):
+        self.value = value
+
+class Number(Node):
+    __slots__ = ('value',)
+    kind = 'number'
+
+    def __init__(self, value):
+        self.value = value
+
+class Boolean(Node):
+    __slots__ = ('value',)
+    kind = 'boolean'
+
+    def __init__(self, value):
+        self.value = value
+
+relational_operators = frozenset(['NE', 'EQ', 'LT', 'LE', 'GT', 'GE'])
+additive_operators = frozenset(['plus', 'min', 'or'])
+multiplicative_operators = frozenset(['mult', 'div', 'and'])
+arithmetic_operators = frozenset(['plus', 'min', 'mult', 'div'])
+
+# Приоритеты бинарных операций: отношения < сложение < умножение, все левоассоциативны
+binary_precedence = dict.fromkeys(relational_operators, 1)
+binary_precedence.update(dict.fromkeys(additive_operators, 2))
+binary_precedence.update(dict.fromkeys(multiplicative_operators, 3))
+
+OPEN_PAREN = '('  # маркер открытой скобки в стеке операций
+
+
 class SemanticError(Exception):
     pass
 
@@ -26,11 +164,7 @@ class Parser:
         self.errors_file = os.path.join(script_dir, "errors", "syntax_errors.txt")
         
     def advance(self):
-        token = self.scanner.get_next_token()
-        type = token[0]
-        value = token[1]
-        print(f"Current token: {type} {value}")
-        self.current_token = Token(type, value)
+        self.current_token = self.scanner.get_next_token()
 
     def parse(self):
         try:
@@ -48,65 +182,65 @@ class Parser:
         return statements
 
     def statement(self):
-        if self.current_token.type == 'KEYWORD' and self.current_token.value == 'dim':
+        if self.current_token[0] == 'KEYWORD' and self.current_token[1] == 'dim':
             return self.declaration()
-        elif self.current_token.type == 'ID':
+        elif self.current_token[0] == 'ID':
             return self.assignment()
-        elif self.current_token.type == 'KEYWORD' and self.current_token.value == 'write':
+        elif self.current_token[0] == 'KEYWORD' and self.current_token[1] == 'write':
             return self.write_statement()
-        elif self.current_token.type == 'KEYWORD' and self.current_token.value == 'read':
+        elif self.current_token[0] == 'KEYWORD' and self.current_token[1] == 'read':
             return self.read_statement()
-        elif self.current_token.type == 'KEYWORD' and self.current_token.value == 'if':
+        elif self.current_token[0] == 'KEYWORD' and self.current_token[1] == 'if':
             return self.if_statement()
-        elif self.current_token.type == 'KEYWORD' and self.current_token.value == 'while':
+        elif self.current_token[0] == 'KEYWORD' and self.current_token[1] == 'while':
             return self.while_statement()
-        elif self.current_token.type == 'KEYWORD' and self.current_token.value == 'for':
+        elif self.current_token[0] == 'KEYWORD' and self.current_token[1] == 'for':
             return self.for_statement()
-        elif self.current_token.type == 'KEYWORD' and self.current_token.value == 'end':
+        elif self.current_token[0] == 'KEYWORD' and self.current_token[1] == 'end':
             with open(self.errors_file, "w") as f:
                 f.write("No syntax error:)")
             print("End of program")
             self.flag = True
-        elif self.current_token.type == 'EOF':
+        elif self.current_token[0] == 'EOF':
             raise SyntaxError("Not found end of program")
         else:
-            raise SyntaxError(f"Unexpected token: {self.current_token}")
+            raise SyntaxError(f"Unexpected token: {token_text(self.current_token)}")
 
     def declaration(self):
         self.match('KEYWORD', 'dim')
         identifiers = [self.match('ID')]
-        while self.current_token and self.current_token.type == 'RAZD' and self.current_token.value == ',':
+        while self.current_token and self.current_token[0] == 'RAZD' and self.current_token[1] == ',':
             self.match('RAZD', ',')
             identifiers.append(self.match('ID'))
         self.match('RAZD', ':')
         type_ = self.match('KEYWORD')
-        return ('declaration', identifiers, type_)
+        return Declaration(identifiers, type_)
 
     def assignment(self):
         identifier = self.match('ID')
         self.match('RAZD', 'as')
         expression = self.expression()
-        return ('assignment', identifier, expression)
+        return Assignment(identifier, expression)
 
     def write_statement(self):
         self.match('KEYWORD', 'write')
         self.match('RAZD', '(')
         expressions = [self.expression()]
-        while self.current_token and self.current_token.type == 'RAZD' and self.current_token.value == ',':
+        while self.current_token and self.current_token[0] == 'RAZD' and self.current_token[1] == ',':
             self.match('RAZD', ',')
             expressions.append(self.expression())
         self.match('RAZD', ')')
-        return ('write', expressions)
+        return Write(expressions)
     
     def read_statement(self):
         self.match('KEYWORD', 'read')
         self.match('RAZD', '(')
         identifiers = [self.match('ID')]
-        while self.current_token and self.current_token.type == 'RAZD' and self.current_token.value == ',':
+        while self.current_token and self.current_token[0] == 'RAZD' and self.current_token[1] == ',':
             self.match('RAZD', ',')
             identifiers.append(self.match('ID'))
         self.match('RAZD', ')')
-        return ('read', identifiers)
+        return Read(identifiers)
 
     def if_statement(self):
         self.match('KEYWORD', 'if')
@@ -114,17 +248,17 @@ class Parser:
         self.match('KEYWORD', 'then')
         then_branch = self.statement()
         else_branch = None
-        if self.current_token and self.current_token.type == 'KEYWORD' and self.current_token.value == 'else':
+        if self.current_token and self.current_token[0] == 'KEYWORD' and self.current_token[1] == 'else':
             self.match('KEYWORD', 'else')
             else_branch = self.statement()
-        return ('if', condition, then_branch, else_branch)
+        return If(condition, then_branch, else_branch)
 
     def while_statement(self):
         self.match('KEYWORD', 'while')
         condition = self.expression()
         self.match('KEYWORD', 'do')
         body = self.statement()
-        return ('while', condition, body)
+        return While(condition, body)
 
     def for_statement(self):
         self.match('KEYWORD', 'for')
@@ -133,62 +267,69 @@ class Parser:
         condition = self.expression()
         self.match('KEYWORD', 'do')
         body = self.statement()
-        return ('for', initialization, condition, body)
+        return For(initialization, condition, body)
     
     def expression(self):
-        operand = self.operand()
-        while self.current_token and self.current_token.type == 'RAZD' and self.current_token.value in ['NE', 'EQ', 'LT', 'LE', 'GT', 'GE']:
-            operator = self.match('RAZD')
-            right_operand = self.operand()
-            operand = ('binary_op', operator, operand, right_operand)
-        return operand
-
-    def operand(self):
-        term = self.term()
-        while self.current_token and self.current_token.type == 'RAZD' and self.current_token.value in ['plus', 'min', 'or']:
-            operator = self.match('RAZD')
-            right_term = self.term()
-            term = ('binary_op', operator, term, right_term)
-        return term
-
-    def term(self):
-        factor = self.factor()
-        while self.current_token and self.current_token.type == 'RAZD' and self.current_token.value in ['mult', 'div', 'and']:
-            operator = self.match('RAZD')
-            right_factor = self.factor()
-            factor = ('binary_op', operator, factor, right_factor)
-        return factor
-
-    def factor(self):
-        token = self.current_token
-        if token.type == 'ID':
-            self.advance()
-            return ('identifier', token.value)
-        elif token.type == 'NUM':
-            self.advance()
-            return ('number', token.value)
-        elif token.type == 'KEYWORD' and token.value in ['true', 'false']:
-            self.advance()
-            return ('boolean', token.value)
-        elif token.type == 'RAZD' and token.value == '~':
-            self.advance()
-            factor = self.factor()
-            return ('unary_op', '~', factor)
-        elif token.type == 'RAZD' and token.value == '(':
+        # Разбор выражения методом сортировочной станции: операнды и операции хранятся
+        # в явных стеках, поэтому глубина вложенности скобок и "~" ограничена только памятью
+        operands = []
+        operators = []  # токены бинарных операций, '~' и маркеры OPEN_PAREN
+        open_parens = 0
+        while True:
+            # префикс: унарные операции и открывающие скобки, затем первичное выражение
+            token = self.current_token
+            while token[0] == 'RAZD' and (token[1] == '~' or token[1] == '('):
+                if token[1] == '(':
+                    operators.append(OPEN_PAREN)
+                    open_parens += 1
+                else:
+                    operators.append('~')
+                self.advance()
+                token = self.current_token
+            if token[0] == 'ID':
+                operands.append(Identifier(token[1]))
+            elif token[0] == 'NUM':
+                operands.append(Number(token[1]))
+            elif token[0] == 'KEYWORD' and token[1] in ['true', 'false']:
+                operands.append(Boolean(token[1]))
+            else:
+                raise SyntaxError(f"Unexpected token: {token_text(token)}")
             self.advance()
-            expr = self.expression()
-            self.match('RAZD', ')')
-            return expr
-        else:
-            raise SyntaxError(f"Unexpected token: {token}")
+
+            # постфикс: закрывающие скобки и следующая бинарная операция
+            while True:
+                while operators and operators[-1] == '~':
+                    operators.pop()
+                    operands.append(UnaryOp('~', operands.pop()))
+                token = self.current_token
+                if token[0] == 'RAZD' and token[1] in binary_precedence:
+                    precedence = binary_precedence[token[1]]
+                    while operators and operators[-1] is not OPEN_PAREN and binary_precedence[operators[-1][1]] >= precedence:
+                        self._reduce(operators, operands)
+                    operators.append(self.match('RAZD'))
+                    break
+                if open_parens == 0:
+                    while operators:
+                        self._reduce(operators, operands)
+                    return operands.pop()
+                while operators[-1] is not OPEN_PAREN:
+                    self._reduce(operators, operands)
+                self.match('RAZD', ')')
+                operators.pop()
+                open_parens -= 1
+
+    @staticmethod
+    def _reduce(operators, operands):
+        right = operands.pop()
+        operands.append(BinaryOp(operators.pop(), operands.pop(), right))
 
     def match(self, type, value=None):
-        if self.current_token and self.current_token.type == type and (value is None or self.current_token.value == value):
+        if self.current_token and self.current_token[0] == type and (value is None or self.current_token[1] == value):
             token = self.current_token
             self.advance()
             return token
         else:
-            raise SyntaxError(f"Expected {type} {value}, but got {self.current_token}")
+            raise SyntaxError(f"Expected {type} {value}, but got {token_text(self.current_token)}")
 
 class SemanticAnalyzer:
     def __init__(self, ast):
@@ -209,105 +350,302 @@ class SemanticAnalyzer:
     def visit(self, node):
         if node is None:
             return
-        method_name = 'visit_' + node[0]
-        visitor = getattr(self, method_name, self.generic_visit)
-        print(f"Visiting {node}")
-        return visitor(node)
+        return self.dispatch[type(node)](self, node)
 
     def visit_declaration(self, node):
-        _, identifiers, type_ = node
-        for identifier in identifiers:
-            if identifier.value in self.symbol_table:
-                raise SemanticError(f"Identifier {identifier.value} already declared")
-            self.symbol_table[identifier.value] = type_.value
+        for identifier in node.identifiers:
+            if identifier[1] in self.symbol_table:
+                raise SemanticError(f"Identifier {identifier[1]} already declared")
+            self.symbol_table[identifier[1]] = node.type_[1]
 
     def visit_assignment(self, node):
-        _, identifier, expression = node
-        if identifier.value not in self.symbol_table:
-            raise SemanticError(f"Identifier {identifier.value} not declared")
+        identifier = node.identifier
+        if identifier[1] not in self.symbol_table:
+            raise SemanticError(f"Identifier {identifier[1]} not declared")
         
-        declared_type = self.symbol_table[identifier.value]
-        expr_type = self.visit(expression)  # Получаем тип выражения
+        declared_type = self.symbol_table[identifier[1]]
+        expr_type = self.visit(node.expression)  # Получаем тип выражения
 
         if declared_type != expr_type:
             raise SemanticError(f"Type mismatch: cannot assign {expr_type} to {declared_type}")
 
     def visit_write(self, node):
-        _, expressions = node
-        for expression in expressions:
+        for expression in node.expressions:
             self.visit(expression)
 
     def visit_read(self, node):
-        _, identifiers = node
-        for identifier in identifiers:
-            if identifier.value not in self.symbol_table:
-                raise SemanticError(f"Identifier {identifier.value} not declared")
+        for identifier in node.identifiers:
+            if identifier[1] not in self.symbol_table:
+                raise SemanticError(f"Identifier {identifier[1]} not declared")
 
     def visit_if(self, node):
-        _, condition, then_branch, else_branch = node
-        if condition[0] != 'binary_op' or condition[1].value not in ['NE', 'EQ', 'LT', 'LE', 'GT', 'GE']:
+        condition = node.condition
+        if type(condition) is not BinaryOp or condition.operator[1] not in relational_operators:
             raise SemanticError(f"Condition in 'if' statement must be a relational operation: {condition}")
         self.visit(condition)
-        self.visit(then_branch)
-        if else_branch:
-            self.visit(else_branch)
+        self.visit(node.then_branch)
+        if node.else_branch:
+            self.visit(node.else_branch)
 
     def visit_while(self, node):
-        _, condition, body = node
-        if condition[0] != 'binary_op' or condition[1].value not in ['NE', 'EQ', 'LT', 'LE', 'GT', 'GE']:
+        condition = node.condition
+        if type(condition) is not BinaryOp or condition.operator[1] not in relational_operators:
             raise SemanticError(f"Condition in 'if' statement must be a relational operation: {condition}")
         self.visit(condition)
-        self.visit(body)
+        self.visit(node.body)
 
     def visit_for(self, node):
-        _, initialization, condition, body = node
-        self.visit(initialization)
-        self.visit(condition)
-        self.visit(body)
-
-    def visit_binary_op(self, node):
-        _, operator, left, right = node
-        left_type = self.visit(left)
-        right_type = self.visit(right)
-
+        self.visit(node.initialization)
+        self.visit(node.condition)
+        self.visit(node.body)
+
+    def visit_expression(self, node):
+        # Тип выражения вычисляется обходом в обратном порядке с явным стеком:
+        # типы операндов копятся в types, операция снимает их после своих поддеревьев
+        types = []
+        stack = [node]
+        done = []  # узлы операций, поддеревья которых уже уложены в стек
+        while stack:
+            node = stack.pop()
+            node_class = type(node)
+            if node_class is BinaryOp:
+                if done and done[-1] is node:
+                    done.pop()
+                    right_type = types.pop()
+                    types.append(self.binary_op_type(node, types.pop(), right_type))
+                else:
+                    done.append(node)
+                    stack.append(node)
+                    stack.append(node.right)
+                    stack.append(node.left)
+            elif node_class is UnaryOp:
+                if done and done[-1] is node:
+                    done.pop()
+                    types.append(self.unary_op_type(node, types.pop()))
+                else:
+                    done.append(node)
+                    stack.append(node)
+                    stack.append(node.operand)
+            else:
+                types.append(self.dispatch[node_class](self, node))
+        return types.pop()
+
+    def binary_op_type(self, node, left_type, right_type):
+        operator = node.operator
         # Пример проверки типов в бинарных операциях
-        if operator in ['plus', 'min', 'mult', 'div']:
+        if operator[1] in arithmetic_operators:
             if left_type != right_type:
-                raise SemanticError(f"Type mismatch in binary operation: {left_type} {operator} {right_type}")
+                raise SemanticError(f"Type mismatch in binary operation: {left_type} {operator[1]} {right_type}")
         return left_type  # Возвращаем тип результата операции
 
-    def visit_unary_op(self, node):
-        _, operator, operand = node
-        operand_type = self.visit(operand)
-
+    def unary_op_type(self, node, operand_type):
         # Пример проверки типа для унарных операций
-        if operator == '~' and operand_type != 'boolean':
+        if node.operator == '~' and operand_type != 'boolean':
             raise SemanticError(f"Type mismatch: expected boolean for '~', got {operand_type}")
         return operand_type
 
     def visit_identifier(self, node):
-        _, value = node
+        value = node.value
         if value not in self.symbol_table:
             raise SemanticError(f"Identifier {value} not declared")
         return self.symbol_table[value]
 
     def visit_number(self, node):
-        _, value = node
         # Вещественное число (например) будет типом "float", обычное - "int"
-        if 'E' in value or 'e' in value or '.' in value:
+        if type(number_value(node.value)) is float:
             return 'real'
         return 'integer'
 
     def visit_boolean(self, node):
         return 'boolean'
 
-    def generic_visit(self, node):
-        raise SemanticError(f"No visit_{node[0]} method")
+    # Таблица диспетчеризации: класс узла -> обработчик. Строится один раз при загрузке модуля
+    dispatch = {}
+
+for node_class in (Declaration, Assignment, Write, Read, If, While, For,
+                   Identifier, Number, Boolean):
+    SemanticAnalyzer.dispatch[node_class] = getattr(SemanticAnalyzer, 'visit_' + node_class.kind)
+SemanticAnalyzer.dispatch[BinaryOp] = SemanticAnalyzer.dispatch[UnaryOp] = SemanticAnalyzer.visit_expression
+
+class ConstantFolder:
+    # Оптимизация AST после семантического анализа: сворачивает операции над литералами,
+    # убирает тождества (x plus 0, x mult 1, ...) и приводит числа к канонической записи.
+    # removed - сколько узлов AST удалено
+    int_min, int_max = -2 ** 31, 2 ** 31 - 1  # целые результаты вне этого диапазона не сворачиваются
+
+    def __init__(self, ast):
+        self.ast = ast
+        self.removed = 0
+
+    def fold(self):
+        for statement in self.ast:
+            self.fold_statement(statement)
+        return self.ast
+
+    def fold_statement(self, node):
+        if node is not None:
+            self.dispatch[type(node)](self, node)
+
+    def fold_declaration(self, node):
+        pass
+
+    def fold_read(self, node):
+        pass
+
+    def fold_assignment(self, node):
+        node.expression = self.fold_expression(node.expression)
+
+    def fold_write(self, node):
+        node.expressions = [self.fold_expression(expression) for expression in node.expressions]
+
+    def fold_condition(self, condition):
+        # Условие if/while остаётся операцией отношения, чтобы AST по-прежнему проходил анализ
+        if type(condition) is BinaryOp:
+            condition.left = self.fold_expression(condition.left)
+            condition.right = self.fold_expression(condition.right)
+            return condition
+        return self.fold_expression(condition)
+
+    def fold_if(self, node):
+        node.condition = self.fold_condition(node.condition)
+        self.fold_statement(node.then_branch)
+        self.fold_statement(node.else_branch)
+
+    def fold_while(self, node):
+        node.condition = self.fold_condition(node.condition)
+        self.fold_statement(node.body)
+
+    def fold_for(self, node):
+        self.fold_assignment(node.initialization)
+        node.condition = self.fold_expression(node.condition)
+        self.fold_statement(node.body)
+
+    def fold_expression(self, node):
+        # Обход в обратном порядке с явным стеком, как в SemanticAnalyzer.visit_expression
+        results = []
+        stack = [node]
+        done = []
+        while stack:
+            node = stack.pop()
+            node_class = type(node)
+            if node_class is BinaryOp:
+                if done and done[-1] is node:
+                    done.pop()
+                    node.right = results.pop()
+                    node.left = results.pop()
+                    results.append(self.fold_binary_op(node))
+                else:
+                    done.append(node)
+                    stack.append(node)
+                    stack.append(node.right)
+                    stack.append(node.left)
+            elif node_class is UnaryOp:
+                if done and done[-1] is node:
+                    done.pop()
+                    node.operand = results.pop()
+                    results.append(self.fold_unary_op(node))
+                else:
+                    done.append(node)
+                    stack.append(node)
+                    stack.append(node.operand)
+            else:
+                if node_class is Number:
+                    # бесконечные значения (1e400) сохраняют исходную лексему, как и в fold_numbers
+                    value = number_value(node.value)
+                    if type(value) is int or math.isfinite(value):
+                        node.value = number_lexeme(value)
+                results.append(node)
+        return results.pop()
+
+    def fold_binary_op(self, node):
+        operator, left, right = node.operator[1], node.left, node.right
+        if type(left) is Number and type(right) is Number:
+            folded = self.fold_numbers(operator, number_value(left.value), number_value(right.value))
+            if folded is not None:
+                self.removed += 2
+                return folded
+        elif type(left) is Boolean and type(right) is Boolean:
+            folded = self.fold_booleans(operator, left.value == 'true', right.value == 'true')
+            if folded is not None:
+                self.removed += 2
+                return folded
+
+        # тождества: x plus 0, x min 0, x mult 1, x div 1, 0 plus x, 1 mult x
+        if type(right) is Number:
+            value = number_value(right.value)
+            if (value == 0 and operator in ('plus', 'min')) or (value == 1 and operator in ('mult', 'div')):
+                self.removed += 2
+                return left
+        if type(left) is Number:
+            value = number_value(left.value)
+            if (value == 0 and operator == 'plus') or (value == 1 and operator == 'mult'):
+                self.removed += 2
+                return right
+        return node
+
+    def fold_numbers(self, operator, a, b):
+        if type(a) is not type(b):  # смешанные типы отвергает семантический анализ
+            return None
+        # Операции отношения над числами не сворачиваются: SemanticAnalyzer даёт им тип
+        # левого операнда, и логический литерал на их месте не прошёл бы анализ снова
+        # (y as 4 EQ 17o EQ 17o). Над логическими литералами тип не меняется, см. fold_booleans
+        if operator == 'plus':
+            value = a + b
+        elif operator == 'min':
+            value = a - b
+        elif operator == 'mult':
+            value = a * b
+        elif operator == 'div':
+            if b == 0:
+                return None
+            if type(a) is int:
+                if a % b:  # целое деление сворачивается, только если оно точное
+                    return None
+                value = a // b
+            else:
+                value = a / b
+        else:
+            return None
+        if type(value) is int:
+            if not self.int_min <= value <= self.int_max:
+                return None
+        elif not math.isfinite(value):
+            return None
+        return Number(number_lexeme(value))
+
+    def fold_booleans(self, operator, a, b):
+        if operator == 'and':
+            value = a and b
+        elif operator == 'or':
+            value = a or b
+        elif operator == 'EQ':
+            value = a == b
+        elif operator == 'NE':
+            value = a != b
+        else:
+            return None
+        return Boolean('true' if value else 'false')
+
+    def fold_unary_op(self, node):
+        operand = node.operand
+        if node.operator == '~' and type(operand) is Boolean:
+            self.removed += 1
+            return Boolean('false' if operand.value == 'true' else 'true')
+        return node
+
+    dispatch = {
+        Declaration: fold_declaration,
+        Assignment: fold_assignment,
+        Write: fold_write,
+        Read: fold_read,
+        If: fold_if,
+        While: fold_while,
+        For: fold_for,
+    }
 
 def mainGrammar():
     input_file_path = os.path.join(os.path.dirname(__file__), 'main.txt')
-    SymbolTableManager.init()
-    scanner = Scanner(input_file_path)
+    scanner = Scanner(input_file_path, CompilationContext())
     parser = Parser(scanner)
     
     ast = parser.parse()
@@ -322,6 +660,11 @@ def mainGrammar():
             with open(sem_errors_file, "w") as f:
                 f.write("No semantic error:)")
             print("Semantic analysis completed successfully.")
+
+            constant_folder = ConstantFolder(ast)
+            ast = constant_folder.fold()
+            print(f"Constant folding removed {constant_folder.removed} nodes:")
+            print(ast)
     else:
         print("Parsing failed.")
     print()
@@ -0,0 +1,95 @@
+'''
+Linear-scan reallocation of the temporaries in the three-address code
+
+CodeGen hands out a fresh temp word for every intermediate result. Once the
+program is finished, the liveness of every temp is computed over the
+basic blocks of the program (cfg.Liveness), each temp gets the interval from
+the first to the last instruction where it is live,
+and a linear scan over the intervals packs them into as few words as there
+are temps live at the same time. Computed (indirect) jumps, the returns of
+functions, lead to every return address in the control flow graph, so a
+temp live after a call is live through the called function too.
+'''
+
+from code_gen import IMMEDIATE
+from peephole import address_of
+from cfg import ControlFlowGraph, Liveness
+
+
+class LinearScanAllocator(object):
+    ''' Renames the temps of program_block in place. temps maps each temp address
+        to its new address and size is the number of words the temps take now '''
+
+    def __init__(self, program_block, temp_base, temp_end):
+        self.program_block = program_block
+        self.temp_base = temp_base # temps live in [temp_base, temp_end)
+        self.temp_end = temp_end
+        self.temps = {}
+        self.size = 0
+
+
+    def is_temp(self, value):
+        return type(value) is int and self.temp_base <= value < self.temp_end
+
+
+    def allocate(self):
+        block = self.program_block
+
+        # temps whose address is taken keep it, the others are numbered for the bitsets
+        used, taken = [], set()
+        for instruction in block:
+            for mode, value in instruction.operands:
+                if mode == IMMEDIATE:
+                    taken.add(address_of(value))
+                elif self.is_temp(value):
+                    used.append(value)
+        fixed = taken.intersection(used)
+        bit = {}
+        for value in used:
+            if value not in fixed and value not in bit:
+                bit[value] = len(bit)
+        if not bit:
+            return False
+        temps = list(bit)
+
+        liveness = Liveness(ControlFlowGraph(block), temps)
+        live_in, live_out = liveness.per_instruction()
+        define = liveness.define
+
+        # interval of a temp: every instruction where it is live or defined
+        start, end = {}, {}
+        for i in range(len(block)):
+            present = live_in[i] | define[i] | live_out[i]
+            while present:
+                low = present & -present
+                t = temps[low.bit_length() - 1]
+                present ^= low
+                if t not in start:
+                    start[t] = i
+                end[t] = i
+        # a temp that only starts at a write can share the word of a temp whose last read is there
+        starts_with_def = {t: bool(define[start[t]] & (1 << bit[t])) and not live_in[start[t]] & (1 << bit[t])
+                           for t in start}
+
+        free_addresses = (address for address in range(self.temp_base, self.temp_end + 4 * len(temps) + 4 * len(fixed), 4)
+                          if address not in fixed)
+        active = [] # (end, address)
+        free = []
+        for t in sorted(start, key=lambda t: (start[t], end[t])):
+            still_active = []
+            for interval_end, address in active:
+                if interval_end < start[t] or (interval_end == start[t] and starts_with_def[t]):
+                    free.append(address)
+                else:
+                    still_active.append((interval_end, address))
+            active = still_active
+            address = free.pop() if free else next(free_addresses)
+            self.temps[t] = address
+            active.append((end[t], address))
+
+        for i, instruction in enumerate(block):
+            if any(mode != IMMEDIATE and value in self.temps for mode, value in instruction.operands):
+                instruction.operands = tuple((mode, self.temps[value]) if mode != IMMEDIATE and value in self.temps
+                                             else (mode, value) for mode, value in instruction.operands)
+        self.size = (max(set(self.temps.values()) | fixed) - self.temp_base) // 4 + 1
+        return True
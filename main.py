@@ -4,7 +4,7 @@ from time import sleep
 from PyQt6.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QTextEdit, QLabel, QTableWidget, QTableWidgetItem, QPushButton, QMenu
 from PyQt6.QtGui import QAction
 from compiler import compile
-from scanner import SymbolTableManager, mainScanner
+from scanner import mainScanner
 from grammer import mainGrammar
 
 class MainWindow(QMainWindow):
@@ -182,7 +182,6 @@ class MainWindow(QMainWindow):
             file.write(code)
 
         # Запуск функции compile с путем к файлу main.txt
-        SymbolTableManager.init()
         mainScanner(source_file)
         sleep(1)
         tokens_file = os.path.join(os.path.dirname(__file__), 'output', 'tokens.txt')
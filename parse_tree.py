@@ -0,0 +1,126 @@
+'''
+Compact parse tree of the LL(1) parser
+
+Nodes live in an arena of parallel arrays and are referred to by their
+index. A node stores its grammar symbol id, parent, first/last child,
+previous/next sibling and the index of the matched token in the
+scanner's token store.
+'''
+
+from array import array
+
+NO_NODE = -1
+
+
+class ParseTree(object):
+    ''' Arena-based parse tree with O(1) node insertion and detachment '''
+
+    def __init__(self, symbol_names):
+        self.symbol_names = symbol_names # symbol id -> printable name
+        self.symbols = array("i")
+        self.parents = array("i")
+        self.first_child = array("i")
+        self.last_child = array("i")
+        self.prev_sibling = array("i")
+        self.next_sibling = array("i")
+        self.tokens = array("i")         # token store index or NO_NODE
+
+
+    def __len__(self):
+        return len(self.symbols)
+
+
+    def add(self, symbol, parent=NO_NODE):
+        ''' creates a node for symbol, appending it to parent's children '''
+        node = len(self.symbols)
+        self.symbols.append(symbol)
+        self.parents.append(parent)
+        self.first_child.append(NO_NODE)
+        self.last_child.append(NO_NODE)
+        self.next_sibling.append(NO_NODE)
+        self.tokens.append(NO_NODE)
+        if parent == NO_NODE:
+            self.prev_sibling.append(NO_NODE)
+        else:
+            last = self.last_child[parent]
+            self.prev_sibling.append(last)
+            if last == NO_NODE:
+                self.first_child[parent] = node
+            else:
+                self.next_sibling[last] = node
+            self.last_child[parent] = node
+        return node
+
+
+    def detach(self, node):
+        ''' unlinks node (with its subtree) from its parent '''
+        parent = self.parents[node]
+        if parent == NO_NODE:
+            return
+        prev_node, next_node = self.prev_sibling[node], self.next_sibling[node]
+        if prev_node == NO_NODE:
+            self.first_child[parent] = next_node
+        else:
+            self.next_sibling[prev_node] = next_node
+        if next_node == NO_NODE:
+            self.last_child[parent] = prev_node
+        else:
+            self.prev_sibling[next_node] = prev_node
+        self.parents[node] = self.prev_sibling[node] = self.next_sibling[node] = NO_NODE
+
+
+    def name(self, node):
+        return self.symbol_names[self.symbols[node]]
+
+
+    def is_leaf(self, node):
+        return self.first_child[node] == NO_NODE
+
+
+    def has_token(self, node):
+        return self.tokens[node] != NO_NODE
+
+
+    def children(self, node):
+        child = self.first_child[node]
+        while child != NO_NODE:
+            yield child
+            child = self.next_sibling[child]
+
+
+    def pre_order(self, root=0):
+        ''' iterative pre-order traversal of the subtree rooted at root '''
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            yield node
+            child = self.last_child[node]
+            while child != NO_NODE:
+                stack.append(child)
+                child = self.prev_sibling[child]
+
+
+    def prune(self, root, keep_leaf):
+        ''' removes dead subtrees in one post-order pass: a leaf is detached unless
+            keep_leaf(leaf) holds, and a parent whose children were all detached
+            becomes a leaf itself by the time it is visited. The root is kept '''
+        for node in reversed(list(self.pre_order(root))): # descendants come before their ancestors
+            if node != root and self.first_child[node] == NO_NODE and not keep_leaf(node):
+                self.detach(node)
+
+
+    def render(self, root=0):
+        ''' yields (prefix, node) pairs in the same layout as anytree's RenderTree '''
+        stack = [(root, "", "")]
+        while stack:
+            node, prefix, indent = stack.pop()
+            yield prefix, node
+            child = self.last_child[node]
+            last = True
+            while child != NO_NODE:
+                if last:
+                    stack.append((child, indent + "└── ", indent + "    "))
+                else:
+                    stack.append((child, indent + "├── ", indent + "│   "))
+                last = False
+                child = self.prev_sibling[child]
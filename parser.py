@@ -1,8 +1,10 @@
 import os
-from anytree import Node, RenderTree, PreOrderIter
-from scanner import Scanner, SymbolTableManager
+from scanner import Scanner, keywords, razd
 from semantic_analyser import SemanticAnalyser
-from code_gen import CodeGen, MemoryManager
+from code_gen import CodeGen
+from context import CompilationContext
+from parse_tree import ParseTree, NO_NODE
+from grammar_compiler import load_tables
 
 script_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 script_dir = os.path.join(script_dir, "compiler-st")
@@ -10,203 +12,158 @@ script_dir = os.path.join(script_dir, "compiler-st")
 non_terminal_to_missing_construct = {
     
     "Program"                       : "end",
-    "Description"                   : "dim ID : integer",
-    "Description-list"              : "dim ID : integer",
     "Statement-list"                : "ID as EXPR",
     "Statement"                     : "ID as EXPR",
+    "Description"                   : "dim ID : integer",
+    "Identifier-list"               : ", ID",
+    "Type"                          : "integer",
+    "AssignmentStatement"           : "ID as EXPR",
+    "ConditionalStatement"          : "if EXPR then STMT",
+    "ElseClause"                    : "else STMT",
+    "FixedLoopStatement"            : "for ID as EXPR to EXPR do STMT",
+    "ConditionalLoopStatement"      : "while EXPR do STMT",
+    "InputStatement"                : "read (ID)",
+    "Input-list"                    : ", ID",
+    "OutputStatement"               : "write (EXPR)",
+    "Expression-list"               : ", EXPR",
     "Expression"                    : "NUM",
+    "Expression-tail"               : "EQ NUM",
     "Operand"                       : "NUM",
+    "Operand-tail"                  : "plus NUM",
     "Term"                          : "NUM",
+    "Term-tail"                     : "mult NUM",
     "Factor"                        : "NUM",
     "Identifier"                    : "ID",
     "Number"                        : "NUM",
     "LogicalConstant"               : "true",
-    "Type"                          : "integer",
     "RelationalOperation"           : "EQ",
     "AdditiveOperation"             : "plus",
     "MultiplicativeOperation"       : "mult",
     "UnaryOperation"                : "~",
-    "CompoundStatement"             : "ID as EXPR",
-    "AssignmentStatement"           : "ID as EXPR",
-    "ConditionalStatement"          : "if EXPR then STMT",
-    "FixedLoopStatement"            : "for ID as EXPR to EXPR do STMT",
-    "ConditionalLoopStatement"      : "while EXPR do STMT",
-    "InputStatement"                : "read (ID)",
-    "OutputStatement"               : "write (EXPR)",
 }
 
-productions = (
-    "",                                                                  # Empty production
-    "Description-list",                                                  # Description-list
-    "Description Description-list",                                       # Description Description-list
-    "EPSILON",                                                           # Epsilon
-    "#SA_SAVE_MAIN #SA_SAVE_TYPE Type-specifier #SA_SAVE_MAIN #SA_ASSIGN_TYPE ID", 
-    "dim ID : Type",                                                     # Description
-    "Statement-list",                                                     # Statement-list
-    "Statement Statement-list",                                          # Statement Statement-list
-    "EPSILON",                                                           # Epsilon
-    "CompoundStatement",                                                  # CompoundStatement
-    "AssignmentStatement",                                               # AssignmentStatement
-    "ConditionalStatement",                                             # ConditionalStatement
-    "FixedLoopStatement",                                                # FixedLoopStatement
-    "ConditionalLoopStatement",                                         # ConditionalLoopStatement
-    "InputStatement",                                                   # InputStatement
-    "OutputStatement",                                                   # OutputStatement
-    "ID as Expression",                                                  # AssignmentStatement
-    "if Expression then Statement else Statement",                       # ConditionalStatement
-    "for ID as Expression to Expression do Statement",                   # FixedLoopStatement
-    "while Expression do Statement",                                      # ConditionalLoopStatement
-    "read ( ID )",                                                       # InputStatement
-    "write ( Expression )",                                             # OutputStatement
-    "Expression",                                                        # Expression
-    "Operand RelationalOperation Operand",                               # Expression
-    "Operand",                                                           # Operand
-    "Term AdditiveOperation Term",                                       # Operand
-    "Term",                                                              # Term
-    "Factor MultiplicativeOperation Factor",                            # Term
-    "Factor",                                                            # Factor
-    "Identifier",                                                        # Factor
-    "Number",                                                            # Factor
-    "LogicalConstant",                                                   # Factor
-    "UnaryOperation Factor",                                             # Factor
-    "( Expression )",                                                    # Factor
-    "ID",                                                                # Identifier
-    "NUM",                                                               # Number
-    "true",                                                             # LogicalConstant
-    "false",                                                             # LogicalConstant
-    "integer",                                                          # Type
-    "real",                                                              # Type
-    "boolean",                                                           # Type
-    "NE",                                                               # RelationalOperation
-    "EQ",                                                               # RelationalOperation
-    "LT",                                                               # RelationalOperation
-    "LE",                                                               # RelationalOperation
-    "GT",                                                               # RelationalOperation
-    "GE",                                                               # RelationalOperation
-    "plus",                                                              # AdditiveOperation
-    "min",                                                              # AdditiveOperation
-    "or",                                                               # AdditiveOperation
-    "mult",                                                              # MultiplicativeOperation
-    "div",                                                              # MultiplicativeOperation
-    "and",                                                              # MultiplicativeOperation
-    "~",                                                                # UnaryOperation
-    "SYNCH",                                                             # Synchronization
-    "EMPTY"                                                              # Empty
-)
+# The grammar of the language. The LL(1) parsing table is generated from it by
+# grammar_compiler (and cached), so changing the language only means editing these rules.
+# "#SA_*" and "#CG_*" are action symbols, they call the semantic analyser and the code
+# generator with the lookahead token when they reach the top of the parse stack.
+grammar = """
+Program                     -> #SA_MAIN_PROGRAM #CG_MAIN_PROGRAM Statement-list end
+Statement-list              -> Statement Statement-list | EPSILON
+Statement                   -> Description | AssignmentStatement #CG_CLOSE_STMT | ConditionalStatement
+Statement                   -> FixedLoopStatement | ConditionalLoopStatement | InputStatement | OutputStatement
+Description                 -> dim #SA_SAVE_DECL ID Identifier-list : #SA_ASSIGN_DECL_TYPE Type
+Identifier-list             -> , #SA_SAVE_DECL ID Identifier-list | EPSILON
+Type                        -> integer | real | boolean
+AssignmentStatement         -> #SA_CHECK_DECL #CG_PUSH_ID ID as Expression #CG_ASSIGN
+ConditionalStatement        -> if Expression #CG_SAVE then Statement ElseClause
+ElseClause                  -> else #CG_ELSE Statement #CG_IF_ELSE | #CG_IF EPSILON
+FixedLoopStatement          -> for AssignmentStatement to #CG_LABEL Expression #CG_FOR_COND #CG_SAVE do Statement #CG_FOR
+ConditionalLoopStatement    -> while #CG_LABEL Expression #CG_SAVE do Statement #CG_WHILE
+InputStatement              -> #SA_CHECK_SUPPORTED read ( ID Input-list )
+Input-list                  -> , ID Input-list | EPSILON
+OutputStatement             -> write ( Expression #CG_PRINT Expression-list )
+Expression-list             -> , Expression #CG_PRINT Expression-list | EPSILON
+Expression                  -> Operand Expression-tail
+Expression-tail             -> #CG_SAVE_OP RelationalOperation Operand #CG_RELOP Expression-tail | EPSILON
+Operand                     -> Term Operand-tail
+Operand-tail                -> #CG_SAVE_OP AdditiveOperation Term #CG_ADDOP Operand-tail | EPSILON
+Term                        -> Factor Term-tail
+Term-tail                   -> #SA_CHECK_SUPPORTED #CG_SAVE_OP MultiplicativeOperation Factor #CG_MULT Term-tail | EPSILON
+Factor                      -> Identifier | Number | LogicalConstant | UnaryOperation Factor #CG_NOT | ( Expression )
+Identifier                  -> #SA_CHECK_DECL #CG_PUSH_ID ID
+Number                      -> #CG_PUSH_CONST NUM
+LogicalConstant             -> #CG_PUSH_CONST true | #CG_PUSH_CONST false
+RelationalOperation         -> NE | EQ | LT | LE | GT | GE
+AdditiveOperation           -> plus | min | or
+MultiplicativeOperation     -> mult | div | and
+UnaryOperation              -> ~
+"""
 
-productions = tuple([p.split() for p in productions]) # split productions into arrays
+# every token the scanner can hand to the parser gets a column, the ones the grammar does not use are illegal
+ll1_tables = load_tables(grammar, "Program", ["ID", "NUM"] + keywords + razd)
 
-terminal_to_col = {
-    "ID"        : 0,
-    "NUM"       : 1,
-    "end"       : 2,
-    "dim"       : 3,
-    "integer"   : 4,
-    "real"      : 5,
-    "boolean"   : 6,
-    "if"        : 7,
-    "then"      : 8,
-    "else"      : 9,
-    "for"       : 10,
-    "to"        : 11,
-    "do"        : 12,
-    "while"     : 13,
-    "read"      : 14,
-    "write"     : 15,
-    "true"      : 16,
-    "false"     : 17,
-    "NE"        : 18,
-    "EQ"        : 19,
-    "LT"        : 20,
-    "LE"        : 21,
-    "GT"        : 22,
-    "GE"        : 23,
-    "plus"      : 24,
-    "min"       : 25,
-    "or"        : 26,
-    "mult"      : 27,
-    "div"       : 28,
-    "and"       : 29,
-    "~"         : 30,
-    "as"        : 31,
-    ":"         : 32,
-    "{"         : 33,
-    "}"         : 34,
-    "("         : 35,
-    ")"         : 36,
-    "."         : 37,
-    ","         : 38,
-    "$"         : 39
-}
+productions = ll1_tables.productions
+terminal_to_col = {a: col for col, a in enumerate(ll1_tables.terminals)}
+non_terminal_to_row = {A: row for row, A in enumerate(ll1_tables.non_terminals)}
 
-non_terminal_to_row = {
-    "Program"                       : 0,
-    "Description-list"              : 1,
-    "Description"                   : 2,
-    "Statement-list"                : 3,
-    "Statement"                    : 4,
-    "Expression"                    : 5,
-    "Operand"                      : 6,
-    "Term"                          : 7,
-    "Factor"                        : 8,
-    "Identifier"                    : 9,
-    "Number"                        : 10,
-    "LogicalConstant"               : 11,
-    "Type"                          : 12,
-    "RelationalOperation"           : 13,
-    "AdditiveOperation"             : 14,
-    "MultiplicativeOperation"      : 15,
-    "UnaryOperation"                : 16,
-    "CompoundStatement"            : 17,
-    "AssignmentStatement"           : 18,
-    "ConditionalStatement"         : 19,
-    "FixedLoopStatement"            : 20,
-    "ConditionalLoopStatement"      : 21,
-    "InputStatement"                : 22,
-    "OutputStatement"               : 23,
-}
+# The generated tables are compiled once at import into integer symbol ids:
+# terminals take ids 0..len(terminal_to_col)-1 (= their parsing table column),
+# non-terminals follow (id - num_terminals = their parsing table row), and the
+# remaining symbols used in productions (action symbols, EPSILON, undefined
+# names) get the ids after that.
+TERMINAL, NON_TERMINAL, SA_ACTION, CG_ACTION, EPSILON, UNDEFINED = range(6)
+PRODUCE, SYNCH, EMPTY = range(3)
+
+num_terminals = len(terminal_to_col)
+num_cols = num_terminals
+
+def _compile_grammar():
+    names = sorted(terminal_to_col, key=terminal_to_col.get)
+    names += sorted(non_terminal_to_row, key=non_terminal_to_row.get)
+    kinds = [TERMINAL] * num_terminals + [NON_TERMINAL] * len(non_terminal_to_row)
+    ids = {name: i for i, name in enumerate(names)}
+
+    def symbol_id(name):
+        if name not in ids:
+            ids[name] = len(names)
+            names.append(name)
+            if name.startswith("#SA"):
+                kinds.append(SA_ACTION)
+            elif name.startswith("#CG"):
+                kinds.append(CG_ACTION)
+            elif name == "EPSILON":
+                kinds.append(EPSILON)
+            else:
+                kinds.append(UNDEFINED)
+        return ids[name]
+
+    compiled = []
+    for rhs in productions:
+        if "SYNCH" in rhs:
+            compiled.append((SYNCH, ()))
+        elif "EMPTY" in rhs:
+            compiled.append((EMPTY, ()))
+        else:
+            compiled.append((PRODUCE, tuple(symbol_id(name) for name in rhs)))
+    return tuple(names), tuple(kinds), ids, tuple(compiled)
+
+symbol_names, symbol_kinds, symbol_to_id, compiled_productions = _compile_grammar()
+production_texts = tuple(" ".join(rhs) for rhs in productions)
+flat_parsing_table = ll1_tables.table
+# rhs symbol ids in the order they are pushed onto the parse stack (EPSILON is never pushed)
+pushed_symbols = tuple(tuple(Y_id for Y_id in reversed(rhs) if symbol_kinds[Y_id] != EPSILON)
+                       for _, rhs in compiled_productions)
+# action symbols and "#..." names are not attached to the parse tree
+detached_symbols = tuple(name.startswith("#") for name in symbol_names)
+
+EOF_ID = symbol_to_id["$"]
+PROGRAM_ID = symbol_to_id["Program"]
+DEC_SCOPE_ID = symbol_to_id.get("#SA_DEC_SCOPE")
 
-parsing_table = (
-    # 0    1    2    3    4    5    6    7    8    9   10   11   12   13   14   15   16   17   18   19   20   21   22   23   24   25   26   27   28   29   30   31   32   33   34   35   36   37   38   39
-    #ID  NUM   end  dim int real bool  if   then else for   to   do while read write true false NE EQ    LT   LE   GT   GE  plus min   or   mult div and   ~    as   :    {     }   (     )    .    ,    $
-    (54,  54,  54,   2,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  53), # 1  Program
-    ( 2,  54,  54,  53,   1,   1,   1,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,   2,   2), # 2  Description-list
-    ( 3,  53,  54,  53,   1,   1,   1,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,   2,  53), # 3  Description
-    (54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  53), # 4  Statement-list
-    (53,  53,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  53), # 5  Statement
-    (54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  53), # 6  Expression
-    (54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  53), # 7  Operand
-    (54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  53), # 8  Term
-    (54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  53), # 9  Factor
-    (54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  53), # 10 Identifier
-    (54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  53), # 11 Number
-    (54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  53), # 12 LogicalConstant
-    (54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  53), # 13 Type
-    (54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  53), # 14 RelationalOperation
-    (54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  53), # 15 AdditiveOperation
-    (54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  53), # 16 MultiplicativeOperation
-    (54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  53), # 17 UnaryOperation
-    (53,  53,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  53), # 18 CompoundStatement
-    (53,  53,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  53), # 19 AssignmentStatement
-    (53,  53,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  53), # 20 ConditionalStatement
-    (53,  53,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  53), # 21 FixedLoopStatement
-    (53,  53,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  53), # 22 ConditionalLoopStatement
-    (53,  53,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  53), # 23 InputStatement
-    (53,  53,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  54,  53), # 24 OutputStatement
-)
 
 class Parser(object):
-    def __init__(self, input_file):
+    def __init__(self, input_file, context, build_tree=True):
         if not os.path.isabs(input_file):
             input_file = os.path.join(script_dir, input_file)
         print("Parsing", input_file)
-        self.scanner = Scanner(input_file)
-        self.semantic_analyzer = SemanticAnalyser()
-        self.code_generator = CodeGen()
+        self.context = context
+        self.scanner = Scanner(input_file, context)
+        self.semantic_analyzer = SemanticAnalyser(context)
+        self.code_generator = CodeGen(context)
         self._syntax_errors = []
-        self.root = Node("Program") # Start symbol
-        self.parse_tree = self.root
-        self.stack = [Node("$"), self.root]           #self.stack = [Node("$"), self.root]
+        self.build_tree = build_tree # without the tree the parser only drives semantic analysis and code generation
+        self.parse_tree = ParseTree(symbol_names) if build_tree else None
+        self.root = self.parse_tree.add(PROGRAM_ID) if build_tree else None # Start symbol
+        self.stack = [NO_NODE, self.root] if build_tree else None # parse tree nodes ("$" and action symbols have none)
+        self.symbol_stack = [EOF_ID, PROGRAM_ID]      # symbol ids of the entries on self.stack
+
+        # action symbols pre-bound to their semantic routines, indexed by symbol id
+        self.actions = [None] * len(symbol_names)
+        for X_id, kind in enumerate(symbol_kinds):
+            if kind == SA_ACTION:
+                self.actions[X_id] = self.semantic_analyzer.bind_check(symbol_names[X_id])
+            elif kind == CG_ACTION:
+                self.actions[X_id] = self.code_generator.bind_routine(symbol_names[X_id])
 
         self.parse_tree_file = os.path.join(script_dir, "output", "parse_tree.txt")
         self.syntax_error_file = os.path.join(script_dir, "errors", "syntax_errors.txt")
@@ -222,129 +179,124 @@ class Parser(object):
         return "".join(syntax_errors)
 
     def save_parse_tree(self):
+        if not self.build_tree:
+            raise RuntimeError("Parse tree was not built, create the Parser with build_tree=True to save it")
+        tree = self.parse_tree
         with open(self.parse_tree_file, "w", encoding="utf-8") as f:
-            for pre, _, node in RenderTree(self.parse_tree):
-                if hasattr(node, "token"):
-                    f.write(f"{pre}{node.token}\n")
+            for pre, node in tree.render(self.root):
+                if tree.has_token(node):
+                    f.write(f"{pre}{self.scanner.tokens.token_to_str(tree.tokens[node])}\n")
                 else:
-                    f.write(f"{pre}{node.name}\n")
+                    f.write(f"{pre}{tree.name(node)}\n")
 
     def save_syntax_errors(self):
         with open(self.syntax_error_file, "w") as f:
             f.write(self.syntax_errors)
 
     def _remove_node(self, node):
-        try:
-            # remove node from the parse tree
-            parent = list(node.iter_path_reverse())[1]
-            parent.children = [c for c in parent.children if c != node]
-        except IndexError:
-            pass
+        # remove node from the parse tree
+        self.parse_tree.detach(node)
 
     def _clean_up_tree(self):
-        ''' remove non terminals and unmet terminals from leaf nodes '''
-        remove_nodes = []
-        for node in PreOrderIter(self.parse_tree):
-            if not node.children and not hasattr(node, "token") and node.name != "EPSILON":
-                remove_nodes.append(node)
-
-        for node in remove_nodes:
-            self._remove_node(node)
+        ''' remove non terminals and unmet terminals from leaf nodes, together with
+            the subtrees that are left without any matched token or EPSILON '''
+        tree = self.parse_tree
+        tree.prune(self.root, lambda node: tree.has_token(node) or symbol_kinds[tree.symbols[node]] == EPSILON)
 
     def parse(self):
         clean_up_needed = False
-        token = self.scanner.get_next_token()
-        new_nodes = []
+        scanner = self.scanner
+        stack, symbol_stack, actions = self.stack, self.symbol_stack, self.actions
+        build_tree, tree = self.build_tree, self.parse_tree
+        lookahead_id = terminal_to_col.get
+        token = scanner.get_next_token()
         self.code_generator.code_gen("INIT_PROGRAM", None)
         while True:
-            print(f"stack: {self.stack}")
             token_type, a = token
             if token_type in ("ID", "NUM"):   # parser won't understand the lexim input in this case
                 a = token_type
+            a_id = lookahead_id(a, -1)
 
-            current_node = self.stack[-1]     # check the top of the stack
-            X = current_node.name
-            print(f"X: {X}, a: {a}, token: {token}", X, a)
-            if X.startswith("#SA"):             # X is an action symbol for semantic analyzer
-                if X == "#SA_DEC_SCOPE" and a == "ID":
-                    curr_lexim = self.scanner.id_to_lexim(token[1])
-                self.semantic_analyzer.semantic_check(X, token, self.scanner.line_number)
-                self.stack.pop()
-                if X == "#SA_DEC_SCOPE" and a == "ID":
-                    token = (token[0], self.scanner.update_symbol_table(curr_lexim))
-            elif X.startswith("#CG"):           # X is an action symbol for code generator
-                self.code_generator.code_gen(X, token)
-                self.stack.pop()
-            elif X in terminal_to_col.keys():   # X is a terminal
-                if X == a:
-                    if X == "$":
+            X_id = symbol_stack[-1]           # check the top of the stack
+            kind = symbol_kinds[X_id]
+            if kind == SA_ACTION:               # X is an action symbol for semantic analyzer
+                if X_id == DEC_SCOPE_ID and a == "ID":
+                    curr_lexim = scanner.id_to_lexim(token[1])
+                actions[X_id](token, scanner.line_number)
+                symbol_stack.pop()
+                if build_tree:
+                    stack.pop()
+                if X_id == DEC_SCOPE_ID and a == "ID":
+                    token = (token[0], scanner.update_symbol_table(curr_lexim))
+            elif kind == CG_ACTION:             # X is an action symbol for code generator
+                actions[X_id](token)
+                symbol_stack.pop()
+                if build_tree:
+                    stack.pop()
+            elif kind == TERMINAL:
+                if X_id == a_id:
+                    if X_id == EOF_ID:
                         break
-                    self.stack[-1].token = self.scanner.token_to_str(token)
-                    self.stack.pop()
-                    token = self.scanner.get_next_token()
+                    symbol_stack.pop()
+                    if build_tree:
+                        tree.tokens[stack.pop()] = scanner.tokens.last_index() # index into the scanner's token store
+                    token = scanner.get_next_token()
                 else:
-                    print("gay2")
-                    SymbolTableManager.error_flag = True
-                    if X == "$": # parse stack unexpectedly exhausted
-                        # self._clean_up_tree()
+                    self.context.symbols.error_flag = True
+                    if X_id == EOF_ID: # parse stack unexpectedly exhausted
                         break
-                    self._syntax_errors.append((self.scanner.line_number, f'Missing "{X}"'))
-                    self.stack.pop()
+                    self._syntax_errors.append((scanner.line_number, f'Missing "{symbol_names[X_id]}"'))
+                    symbol_stack.pop()
+                    if build_tree:
+                        stack.pop()
                     clean_up_needed = True
             else:                               # X is non-terminal
+                if a_id < 0:
+                    raise KeyError(a)
+                if kind != NON_TERMINAL:
+                    raise KeyError(symbol_names[X_id])
                 # look up parsing table which production to use
-                col = terminal_to_col[a]
-                row = non_terminal_to_row[X]
-                prod_idx = parsing_table[row][col]
+                prod_idx = flat_parsing_table[(X_id - num_terminals) * num_cols + a_id]
+                flag, rhs = compiled_productions[prod_idx]
 
-                # Check if prod_idx is within the valid range
-                if prod_idx < 0 or prod_idx >= len(productions):
-                    pass
-                    #raise IndexError(f"prod_idx {prod_idx} is out of range for productions")
-
-                rhs = productions[prod_idx]
-
-                if "SYNCH" in rhs:
-                    SymbolTableManager.error_flag = True
-                    if a == "$":
-                        self._syntax_errors.append((self.scanner.line_number, "Unexpected EndOfFile"))
-                        # self._clean_up_tree()
+                if flag == SYNCH:
+                    self.context.symbols.error_flag = True
+                    if a_id == EOF_ID:
+                        self._syntax_errors.append((scanner.line_number, "Unexpected EndOfFile"))
                         clean_up_needed = True
                         break
-                    missing_construct = non_terminal_to_missing_construct[X]
-                    self._syntax_errors.append((self.scanner.line_number, f'Missing "{missing_construct}"'))
-                    self._remove_node(current_node)
-                    self.stack.pop()
-                elif "EMPTY" in rhs:
-                    SymbolTableManager.error_flag = True
-                    self._syntax_errors.append((self.scanner.line_number, f'Illegal "{a}"'))
-                    token = self.scanner.get_next_token()
+                    missing_construct = non_terminal_to_missing_construct[symbol_names[X_id]]
+                    self._syntax_errors.append((scanner.line_number, f'Missing "{missing_construct}"'))
+                    symbol_stack.pop()
+                    if build_tree:
+                        self._remove_node(stack.pop())
+                elif flag == EMPTY:
+                    self.context.symbols.error_flag = True
+                    self._syntax_errors.append((scanner.line_number, f'Illegal "{a}"'))
+                    token = scanner.get_next_token()
+                elif build_tree:
+                    current_node = stack.pop()
+                    symbol_stack.pop()
+                    new_nodes = [NO_NODE if detached_symbols[Y_id]
+                                 else tree.add(Y_id, current_node) for Y_id in rhs]
+                    for i in range(len(rhs) - 1, -1, -1):
+                        if symbol_kinds[rhs[i]] != EPSILON:
+                            stack.append(new_nodes[i])
+                            symbol_stack.append(rhs[i])
                 else:
-                    self.stack.pop()
-                    for symbol in rhs:
-                        if not symbol.startswith("#"):
-                            print("gay")
-                            new_nodes.append(Node(symbol, parent=current_node))
-                        else:
-                            new_nodes.append(Node(symbol))
-
-                    for node in reversed(new_nodes):
-                        if node.name != "EPSILON":
-                            self.stack.append(node)
+                    symbol_stack.pop()
+                    symbol_stack.extend(pushed_symbols[prod_idx])
 
-                print(f"{X} -> {' '.join(rhs)}")  # prints out the productions used
-                new_nodes = []
+                print(f"{symbol_names[X_id]} -> {production_texts[prod_idx]}")  # prints out the productions used
 
-        self.semantic_analyzer.eof_check(self.scanner.line_number)
-        if clean_up_needed:
+        self.semantic_analyzer.eof_check(scanner.line_number)
+        if clean_up_needed and build_tree:
             self._clean_up_tree()
         self.code_generator.code_gen("FINISH_PROGRAM", None)
 
 def main(input_path):
     import time
-    SymbolTableManager.init()
-    MemoryManager.init()
-    parser = Parser(input_path)
+    parser = Parser(input_path, CompilationContext())
     start = time.time()
     parser.parse()
     stop = time.time() - start
@@ -358,5 +310,9 @@ def main(input_path):
     parser.code_generator.save_output()
 
 if __name__ == "__main__":
+    import sys
+    if "--grammar" in sys.argv: # python parser.py --grammar  (FIRST/FOLLOW sets and LL(1) conflicts)
+        print(ll1_tables.report())
+        sys.exit()
     input_path = os.path.join(script_dir, "input/input_simple.c")
     main(input_path)
@@ -0,0 +1,268 @@
+'''
+Peephole optimizer for the three-address code of CodeGen
+
+Works on the Instruction list of CodeGen.program_block after the program
+is finished:
+
+    - constants set up before the first jump (the constant pool) and never
+      written again are used as immediates everywhere
+    - jumps to an unconditional jump are threaded to its final target
+    - a constant copied into a slot that is used once is used as an immediate
+    - a result computed into a temp and copied right away is stored directly
+    - jumps to the next instruction are dropped
+    - removed instructions and leftover placeholders are compacted out and
+      the jump targets renumbered
+
+Computed (indirect) jumps return to the addresses the callers store with
+ASSIGN #pc, @t (CodeGen.code_addresses). Constant propagation treats those
+return addresses as jump targets; copy folding is skipped in programs with
+indirect jumps. Jump threading, removal of jumps to the next instruction
+and the compaction do not depend on indirect jumps, and the compaction
+renumbers the return addresses along with the jump targets.
+'''
+
+from code_gen import Opcode, DIRECT, IMMEDIATE, INDIRECT
+
+# number of leading operands an instruction reads, the operand after them is
+# the one it writes (ADD/SUB/MULT/EQ/LT, ASSIGN) or its jump target (JPF, JP)
+read_count = {
+    Opcode.ADD: 2, Opcode.SUB: 2, Opcode.MULT: 2, Opcode.EQ: 2, Opcode.LT: 2,
+    Opcode.ASSIGN: 1, Opcode.JPF: 1, Opcode.PRINT: 1, Opcode.JP: 0, Opcode.PLACEHOLDER: 0,
+}
+writes_result = frozenset([Opcode.ADD, Opcode.SUB, Opcode.MULT, Opcode.EQ, Opcode.LT, Opcode.ASSIGN])
+
+
+def jump_target(instruction):
+    ''' direct jump target of JP/JPF, None for other instructions '''
+    if instruction.opcode == Opcode.JP or instruction.opcode == Opcode.JPF:
+        mode, target = instruction.operands[-1]
+        if mode == DIRECT:
+            return target
+    return None
+
+
+def has_indirect_jump(program_block):
+    return any(instruction.opcode == Opcode.JP and instruction.operands[0][0] != DIRECT
+               for instruction in program_block)
+
+
+def address_of(value):
+    ''' immediates hold ints or the lexemes of constants '''
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+    return value
+
+
+def _with_operand(instruction, k, operand):
+    operands = list(instruction.operands)
+    operands[k] = operand
+    instruction.operands = tuple(operands)
+
+
+class PeepholeOptimizer(object):
+    ''' Rewrites a program block in place until no pattern applies any more.
+        Removed instructions are marked with None until the final compaction '''
+
+    def __init__(self, program_block, code_addresses=()):
+        self.program_block = program_block
+        self.code_addresses = code_addresses # instructions whose immediate source is a program block index
+        self.removed = 0
+
+
+    def optimize(self):
+        size = len(self.program_block)
+        indirect = has_indirect_jump(self.program_block)
+        self.propagate_constants()
+        changed = True
+        while changed:
+            changed = self.thread_jumps()
+            if not indirect:
+                changed |= self.fold_copies()
+            changed |= self.remove_jumps_to_next()
+        self.compact()
+        self.removed = size - len(self.program_block)
+        return self.program_block
+
+
+    def _is_gone(self, i):
+        instruction = self.program_block[i]
+        return instruction is None or instruction.opcode == Opcode.PLACEHOLDER
+
+
+    def _next(self, i):
+        ''' index of the instruction executed after i when i falls through '''
+        i += 1
+        while i < len(self.program_block) and self._is_gone(i):
+            i += 1
+        return i
+
+
+    def _usage(self):
+        ''' counts the direct reads and writes of every address and collects the
+            addresses that appear as immediates (their address is taken) and the jump targets '''
+        reads, writes, taken, targets = {}, {}, set(), set()
+        for instruction in self.program_block:
+            if instruction is None:
+                continue
+            n_reads = read_count[instruction.opcode]
+            for k, (mode, value) in enumerate(instruction.operands):
+                if mode == IMMEDIATE:
+                    taken.add(address_of(value))
+                elif k < n_reads or mode == INDIRECT: # a pointer is read wherever it is used
+                    reads[value] = reads.get(value, 0) + 1
+                elif instruction.opcode in writes_result:
+                    writes[value] = writes.get(value, 0) + 1
+                else:
+                    targets.add(value)
+        return reads, writes, taken, targets
+
+
+    def _return_addresses(self):
+        return {instruction.operands[0][1] for instruction in self.code_addresses}
+
+
+    def propagate_constants(self):
+        ''' ASSIGN #c, s in the straight-line code the program starts with, where s is
+            written nowhere else and its address is never taken, holds c for the rest
+            of the run, so every read of s becomes #c (and @s becomes c) '''
+        block = self.program_block
+        reads, writes, taken, targets = self._usage()
+        targets |= self._return_addresses()
+        constants = {}
+        for i, instruction in enumerate(block):
+            if i in targets:
+                break
+            if self._is_gone(i):
+                continue
+            if instruction.opcode in (Opcode.JP, Opcode.JPF):
+                break
+            (source_mode, value), (mode, address) = instruction.operands[0], instruction.operands[-1]
+            if (instruction.opcode == Opcode.ASSIGN and source_mode == IMMEDIATE and mode == DIRECT
+                    and isinstance(address_of(value), int) and address not in taken and writes.get(address) == 1):
+                constants[address] = value
+                block[i] = None
+        for instruction in block:
+            if instruction is None:
+                continue
+            n_reads = read_count[instruction.opcode]
+            for k, (mode, address) in enumerate(instruction.operands):
+                if mode == DIRECT and k < n_reads and address in constants:
+                    _with_operand(instruction, k, (IMMEDIATE, constants[address]))
+                elif mode == INDIRECT and address in constants:
+                    _with_operand(instruction, k, (DIRECT, address_of(constants[address])))
+        return bool(constants)
+
+
+    def thread_jumps(self):
+        ''' retargets jumps whose target is an unconditional direct jump '''
+        block = self.program_block
+        changed = False
+        for instruction in block:
+            if instruction is None:
+                continue
+            target = original = jump_target(instruction)
+            if target is None:
+                continue
+            seen = set()
+            while target < len(block) and target not in seen:
+                seen.add(target)
+                if self._is_gone(target):
+                    target = self._next(target)
+                elif jump_target(block[target]) is not None and block[target].opcode == Opcode.JP:
+                    target = jump_target(block[target])
+                else:
+                    break
+            if target != original:
+                _with_operand(instruction, -1, (DIRECT, target))
+                changed = True
+        return changed
+
+
+    def fold_copies(self):
+        ''' ASSIGN #c, s followed by the only use of s becomes that use with #c, and
+            OP a, b, t followed by ASSIGN t, x (the only use of t) becomes OP a, b, x.
+            s and t must be written once and never have their address taken, and no
+            jump may enter between the two instructions '''
+        block = self.program_block
+        reads, writes, taken, targets = self._usage()
+        changed = False
+        for i, instruction in enumerate(block):
+            if instruction is None or instruction.opcode not in writes_result:
+                continue
+            mode, address = instruction.operands[-1]
+            if mode != DIRECT or address in taken or writes.get(address) != 1 or reads.get(address) != 1:
+                continue
+            j = self._next(i)
+            if j >= len(block) or any(k in targets for k in range(i + 1, j + 1)):
+                continue
+            use = block[j]
+            source = instruction.operands[0]
+
+            if instruction.opcode == Opcode.ASSIGN and source[0] == IMMEDIATE:
+                for k, operand in enumerate(use.operands):
+                    if operand == (DIRECT, address) and k < read_count[use.opcode]:
+                        _with_operand(use, k, source)
+                        break
+                    if operand == (INDIRECT, address) and isinstance(address_of(source[1]), int):
+                        # the constant stays among the taken addresses, so its counts are never consulted
+                        _with_operand(use, k, (DIRECT, address_of(source[1])))
+                        break
+                else:
+                    continue
+                block[i] = None
+
+            elif use.opcode == Opcode.ASSIGN and use.operands[0] == (DIRECT, address):
+                _with_operand(instruction, -1, use.operands[1])
+                block[j] = None
+
+            else:
+                continue
+            # the fold drops one read and one write of address and leaves every other count as it was
+            reads[address] -= 1
+            writes[address] -= 1
+            changed = True
+        return changed
+
+
+    def remove_jumps_to_next(self):
+        ''' a jump, conditional or not, to the instruction that follows it does nothing '''
+        block = self.program_block
+        changed = False
+        for i, instruction in enumerate(block):
+            if instruction is None:
+                continue
+            target = jump_target(instruction)
+            if target is not None and i < target <= self._next(i):
+                block[i] = None
+                changed = True
+        return changed
+
+
+    def compact(self):
+        ''' drops removed instructions and placeholders and renumbers the jump targets
+            and the return addresses '''
+        block = self.program_block
+        new_index = []
+        kept = []
+        for i, instruction in enumerate(block):
+            new_index.append(len(kept))
+            if not self._is_gone(i):
+                kept.append(instruction)
+        new_index.append(len(kept)) # jumping past the end stops the program
+        for instruction in kept:
+            target = jump_target(instruction)
+            if target is not None and 0 <= target < len(new_index):
+                _with_operand(instruction, -1, (DIRECT, new_index[target]))
+        for instruction in self.code_addresses:
+            mode, target = instruction.operands[0]
+            if 0 <= target < len(new_index):
+                _with_operand(instruction, 0, (mode, new_index[target]))
+        block[:] = kept
+
+
+def optimize(program_block, code_addresses=()):
+    ''' optimizes program_block in place, returns the number of removed instructions.
+        code_addresses are the instructions that store a return address '''
+    optimizer = PeepholeOptimizer(program_block, code_addresses)
+    optimizer.optimize()
+    return optimizer.removed
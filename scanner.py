@@ -1,13 +1,16 @@
 import os
 import re
+import copy
+import codecs
+from array import array
 
 script_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 script_dir = os.path.join(script_dir, "compiler-st")
 
 print(script_dir)
 class SymbolTableManager(object):
-    ''' Управляет таблицей символов компилятора,
-    которая используется в различных модулях '''
+    ''' Управляет таблицей символов компилятора, которая используется в различных модулях.
+    Каждая компиляция владеет своим экземпляром (см. context.CompilationContext) '''
     _global_funcs = [{
         "lexim": "output",
         "scope": 0,
@@ -17,66 +20,83 @@ class SymbolTableManager(object):
         "params": ["int"]
     }]
 
-    @classmethod
-    def init(cls):
+    def __init__(self):
+        self.init()
+
+    def init(self):
         ''' Инициализирует таблицу символов '''
-        cls.scope_stack = [0]
-        cls.temp_stack = [0]
-        cls.arg_list_stack = []
-        cls.symbol_table = cls._global_funcs.copy()
-        cls.declaration_flag = False
-        cls.error_flag = False
-
-    @classmethod
-    def scope(cls):
+        self.scope_stack = [0]
+        self.temp_stack = [0]
+        self.arg_list_stack = []
+        self.symbol_table = copy.deepcopy(self._global_funcs) # строки изменяются семантическими процедурами
+        self.lexim_index = {} # лексема -> стек индексов строк (по возрастанию, последняя - самая внутренняя)
+        for i, row in enumerate(self.symbol_table):
+            self.lexim_index.setdefault(row["lexim"], []).append(i)
+        self.declaration_flag = False
+        self.error_flag = False
+
+    def scope(self):
         ''' Возвращает текущий уровень области видимости '''
-        return len(cls.scope_stack) - 1
+        return len(self.scope_stack) - 1
 
-    @classmethod
-    def insert(cls, lexim):
+    def insert(self, lexim):
         ''' Вставляет новый символ в таблицу символов '''
-        cls.symbol_table.append({"lexim": lexim, "scope": cls.scope()})
-
-    @classmethod
-    def _exists(cls, lexim, scope):
+        self.lexim_index.setdefault(lexim, []).append(len(self.symbol_table))
+        self.symbol_table.append({"lexim": lexim, "scope": self.scope()})
+
+    def push_scope(self):
+        ''' Открывает новую область видимости, начинающуюся с конца таблицы '''
+        self.scope_stack.append(len(self.symbol_table))
+
+    def pop_scope(self):
+        ''' Закрывает текущую область видимости, удаляя ее символы из таблицы и индекса '''
+        scope_start_idx = self.scope_stack.pop()
+        for row in self.symbol_table[scope_start_idx:]:
+            rows = self.lexim_index[row["lexim"]]
+            rows.pop()
+            if not rows:
+                del self.lexim_index[row["lexim"]]
+        del self.symbol_table[scope_start_idx:]
+
+    def _exists(self, lexim, scope):
         ''' Проверяет, существует ли символ в таблице символов '''
-        for row in cls.symbol_table:
-            if row["lexim"] == lexim and row["scope"] == scope:
+        for i in reversed(self.lexim_index.get(lexim, ())):
+            row_scope = self.symbol_table[i]["scope"]
+            if row_scope == scope:
                 return True
+            if row_scope < scope: # области видимости в стеке лексемы не убывают
+                break
         return False
 
-    @classmethod
-    def findrow(cls, value, attr="lexim"):
+    def findrow(self, value, attr="lexim"):
         ''' Находит строку в таблице символов по значению атрибута '''
-        for i in range(len(cls.symbol_table) - 1, -1, -1):
-            row = cls.symbol_table[i]
-            if row[attr] == value:
-                return row
-        return None
-
-    @classmethod
-    def findrow_idx(cls, value, attr="lexim"):
-        ''' Находит индекс строки в таблице символов по значению атрибута '''
-        for i in range(len(cls.symbol_table) - 1, -1, -1):
-            row = cls.symbol_table[i]
+        i = self.findrow_idx(value, attr)
+        return None if i is None else self.symbol_table[i]
+
+    def findrow_idx(self, value, attr="lexim"):
+        ''' Находит индекс строки в таблице символов по значению атрибута
+            (поиск по лексеме идет через индекс, по другим атрибутам - перебором) '''
+        if attr == "lexim":
+            rows = self.lexim_index.get(value)
+            return rows[-1] if rows else None
+        for i in range(len(self.symbol_table) - 1, -1, -1):
+            row = self.symbol_table[i]
             if row[attr] == value:
                 return i
         return None
 
-    @classmethod
-    def install_id(cls, lexim):
+    def install_id(self, lexim):
         ''' Устанавливает идентификатор для символа '''
-        if not cls.declaration_flag:
-            i = cls.findrow_idx(lexim)
+        if not self.declaration_flag:
+            i = self.findrow_idx(lexim)
             if i is not None:
                 return i
-        return len(cls.symbol_table)
+        return len(self.symbol_table)
 
-    @classmethod
-    def get_enclosing_fun(cls, level=1):
+    def get_enclosing_fun(self, level=1):
         ''' Возвращает охватывающую функцию на заданном уровне '''
         try:
-            return cls.symbol_table[cls.scope_stack[-level] - 1]
+            return self.symbol_table[self.scope_stack[-level] - 1]
         except IndexError:
             return None
 
@@ -107,6 +127,7 @@ state_to_token = {
     11: "SYMBOL",
     12: "SYMBOL",
     16: "COMMENT",
+    18: "COMMENT",  # от "}" до конца строки
 
  
 
@@ -139,9 +160,9 @@ token_dfa = (
     (None, None, None, None, None, None, None, None, None, None, None, None, None, None, None), # State 4 (illegal number)
     (   6,    5,    5,    6,    6,    6,    6,    6,   20,   5,  5, 20, 20,20,20), # State 5 
     (None, None, None, None, None, None, None, None, None, None, None, None, None, None, None), # State 6 (id or keyword)
-    (  21,   21,   21,   21,   21,   21,    8,   21,   20), # State 7 хз что это
+    (  21,   21,   21,   21,   21,   21,    8,   21,   20,   21,   21,   21,   21,   21,   21), # State 7 хз что это
     (None, None, None, None, None, None, None, None, None, None, None, None, None, None, None), # State 8 (unmatched */)
-    (  11,   11,   11,   11,   10,   11,   11,   11,   20), # State 9 хз 
+    (  11,   11,   11,   11,   10,   11,   11,   11,   20,   11,   11,   11,   11,   11,   11), # State 9 хз 
     (None, None, None, None, None, None, None, None, None, None, None, None, None, None, None), # State 10 (symbol ==)
     (None, None, None, None, None, None, None, None, None, None, None, None, None, None, None), # State 11 (symbol =)
     (None, None, None, None, None, None, None, None, None, None, None, None, None, None, None), # State 12 (symbol)
@@ -149,7 +170,7 @@ token_dfa = (
     (  14,   14,   14,   14,   14,   14,   14,   14,   14,   14,   14,   14,   14,   14,   16), # State 14            сюда бы дописать столбцы если что
     (  14,   14,   14,   15,   14,   14,   16,   14,   14,   14,   14,   14,   14,   14,   14), # State 15
     (None, None, None, None, None, None, None, None, None, None, None, None, None, None, None), # State 16 (/* comment */)
-    (  17,   17,   17,   17,   17,   17,   17,   18,   17,   17,   17,   17,   17,  17), # State 17 
+    (  17,   17,   17,   17,   17,   17,   17,   18,   17,   17,   17,   17,   17,   17,   17), # State 17 
     (None, None, None, None, None, None, None, None, None, None, None, None, None, None, None), # State 18 (// comment\n)
     (  19, None, None, None, None, None, None,   19, None, None, None, None, None, None, None), # State 19 (newline + whitespace)
     (None, None, None, None, None, None, None, None, None, None, None, None, None, None, None), # State 20 (invalid input)
@@ -166,6 +187,9 @@ token_dfa = (
     (None, None, None, None, None, None, None, None, None, None, None, None, None, None, None), # State 31 Nbodh
 
 )
+# во всех строках по 15 столбцов: на границе чанка и в конце ввода в таблицу попадает
+# любой символ просмотра вперед (например, '*+' или '=.')
+assert all(len(row) == len(char_to_col) for row in token_dfa)
 
 F = {1, 3, 6, 10, 11, 12, 16, 18, 19, 20, 21,23,31} # all accepting states
 Fstar = {3, 6, 11, 21, 31}                        # accepting states that require the last character to be returned to the input stream
@@ -173,25 +197,257 @@ unclosed_comment_states = {14, 15, 17}
 
 whitespaces = {' ', '\r', '\t', '\v', '\f'} # \n исключен, так как имеет специальное значение в однострочных комментариях
 
+_symbols = {',', ';', ':', '(', ')', '~', '/'} # = и * исключены
+letters = {chr(i) for i in range(65, 91)} | {chr(i) for i in range(97, 123)}
+digits = {str(i) for i in range(0, 10)}
+
+razd = [
+    "NE",       # 0
+    "EQ",       # 1
+    "LT",      # 2
+    "LE",      # 3
+    "GT",       # 4
+    "GE",       # 5
+    "plus",       # 6
+    "min",      # 7
+    "or",        # 8
+    "mult",       # 9
+    "div",       # 10
+    "and",        # 11
+    "~",         # 12
+    "+",         # 13
+    "-",         # 14
+    "as",        # 15
+    ":",         # 16
+    "(",         # 17
+    ")",         # 18
+    ".",         # 19
+    ",",         # 20
+    "{",         # 21
+    "}",         # 22
+]
+
+keywords = [
+    "end",     # 0
+    "dim",       # 1
+    "integer",       # 2
+    "real",        # 3
+    "boolean",      # 4
+    "if",      # 5
+    "then",       # 6
+    "else",        # 7
+    "for",     # 8
+    "do",        # 9
+    "to",      # 10
+    "read",      # 11
+    "write",     # 12
+    "while",     # 13
+    "true",      # 14
+    "false",      # 15
+]
+
+# лексема -> вид токена (ключевые слова имеют приоритет над разделителями)
+lexeme_to_token = dict.fromkeys(razd, "RAZD")
+lexeme_to_token.update(dict.fromkeys(keywords, "KEYWORD"))
+
+def _build_char_class_table():
+    ''' Строит плоскую таблицу классов символов (столбцов DFA) для всех 256 кодов.
+        Порядок заполнения повторяет приоритет проверок: пробелы, буквы, цифры, символы '''
+    table = [char_to_col["OTHER"]] * 256
+    for char, col in char_to_col.items():
+        if len(char) == 1:
+            table[ord(char)] = col
+    for char in _symbols:
+        table[ord(char)] = char_to_col["SYMBOL"]
+    for char in digits:
+        table[ord(char)] = char_to_col["DIGIT"]
+    for char in letters:
+        table[ord(char)] = char_to_col["LETTER"]
+    for char in whitespaces:
+        table[ord(char)] = char_to_col["WHITESPACE"]
+    return tuple(table)
+
+char_class = _build_char_class_table()
+OTHER_COL = char_to_col["OTHER"]
+
+# действие DFA для каждого состояния: 0 - переход, ACCEPT/ACCEPT_STAR - принимающее, ERROR - ошибка
+ACCEPT, ACCEPT_STAR, ERROR = 1, 2, 3
+state_action = tuple(
+    ERROR if s in state_to_error_message else
+    ACCEPT_STAR if s in Fstar else
+    ACCEPT if s in F else 0
+    for s in range(len(token_dfa))
+)
+
+# Мастер-регулярка для движка "regex". Каждая группа описывает лексемы, для которых
+# проход по token_dfa заведомо заканчивается в указанном принимающем состоянии; там, где нужен
+# символ просмотра вперед, он проверяется lookahead-ом (в конце ввода совпадения нет).
+# Всё остальное (ошибочные лексемы, "}" вне комментария и т.п.) разбирается таблицей DFA.
+_terminators = r"[ \t\r\v\f\n*=,;:()~/{]" # символы, завершающие идентификатор или число
+master_pattern = re.compile(r"""
+    [ \t\r\v\f]*       # пробелы перед лексемой пропускаются тем же совпадением
+    (?:(?P<WHITESPACE>[ \t\r\v\f\n]+)(?=[^ \t\r\v\f\n])
+    | (?P<COMMENT>\{[^}]*\})
+    | (?P<ID_OR_KEYWORD>[A-Za-z][A-Za-z0-9]*)(?={T})
+    | (?P<Nbodh>[0-9]+[A-Za-z](?=[ \t\r\v\f\n])|[0-9]+[A-Za-z]{2}(?:[A-Za-z0-9]*[A-Za-z])?(?={T}))
+    | (?P<NUM>(?:[0-9]+(?:\.[0-9]+)?|\.[0-9]+)(?:[eE][+-]?[0-9]+)?)(?={T})
+    | (?P<EQ>==)
+    | (?P<ASSIGN>=)(?=[ \t\r\v\f\n0-9A-Za-z*,;:()~/{])
+    | (?P<STAR>\*)(?=[ \t\r\v\f\n0-9A-Za-z*=,;:()~/])
+    | (?P<SYMBOL>[,;:()~/])
+    | (?P<RAZD>[+-]))
+""".replace("{T}", _terminators), re.VERBOSE)
+
+group_to_state = {
+    "WHITESPACE": 19,
+    "COMMENT": 16,
+    "ID_OR_KEYWORD": 6,
+    "Nbodh": 31,
+    "NUM": 3,
+    "EQ": 10,
+    "ASSIGN": 11,
+    "STAR": 21,
+    "SYMBOL": 12,
+    "RAZD": 23,
+}
+
+skipped_groups = {"WHITESPACE", "COMMENT"}
+
+# вид токена для групп, лексемы которых не нужно проверять (если лексемы нет в lexeme_to_token);
+# такие токены движок "regex" принимает сам, без _accept. Nbodh проверяется в _accept
+group_to_kind = {
+    "ID_OR_KEYWORD": "ID",
+    "NUM": "NUM",
+    "EQ": "SYMBOL",
+    "ASSIGN": "SYMBOL",
+    "STAR": "SYMBOL",
+    "SYMBOL": "SYMBOL",
+    "RAZD": "RAZD",
+}
+
+engines = ("dfa", "regex")
+
+token_kinds = ("KEYWORD", "RAZD", "SYMBOL", "ID", "NUM") # виды токенов, хранимые в TokenStore
+kind_codes = {kind: code for code, kind in enumerate(token_kinds)}
+
+# Основания чисел с суффиксом, которые распознаёт сканер: 101b, 17o, 99d, 1AFh
+number_bases = {'b': 2, 'o': 8, 'd': 10, 'h': 16}
+
+def number_value(lexeme):
+    # Значение числовой лексемы: int для целых (в том числе b/o/d/h), float для вещественных
+    base = number_bases.get(lexeme[-1].lower())
+    if base is not None:
+        return int(lexeme[:-1], base)
+    if 'E' in lexeme or 'e' in lexeme or '.' in lexeme:
+        return float(lexeme)
+    return int(lexeme)
+
+def number_lexeme(value):
+    # Каноническая запись числа: десятичное целое или repr вещественного (всегда с '.' или 'e')
+    return str(value) if type(value) is int else repr(value)
+
+
+class TokenStore(object):
+    ''' Колоночное хранилище токенов. Для каждого токена хранятся только код вида
+        и смещения лексемы во входном буфере (плюс номер строки) в массивах array,
+        а текст лексемы вырезается из буфера лишь по запросу. Индексы токенов сквозные:
+        после отбрасывания старых строк индексы оставшихся токенов не меняются '''
+
+    def __init__(self):
+        self.source = "" # входной буфер, на который ссылаются смещения
+        self.kinds = array("B")
+        self.starts = array("I")
+        self.ends = array("I")
+        self.lines = array("I")
+        self.offset = 0 # сквозной индекс первого хранимого токена
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def append(self, kind, start, end, lineno):
+        ''' Добавляет токен вида kind с лексемой source[start:end] '''
+        self.kinds.append(kind_codes[kind])
+        self.starts.append(start)
+        self.ends.append(end)
+        self.lines.append(lineno)
+
+    def last_index(self):
+        ''' Возвращает сквозной индекс последнего добавленного токена '''
+        return self.offset + len(self.kinds) - 1
+
+    def kind(self, i):
+        return token_kinds[self.kinds[i - self.offset]]
+
+    def lexeme(self, i):
+        i -= self.offset
+        return self.source[self.starts[i]:self.ends[i]]
+
+    def line(self, i):
+        return self.lines[i - self.offset]
+
+    def token(self, i):
+        ''' Возвращает токен (вид, лексема) по сквозному индексу '''
+        return self.kind(i), self.lexeme(i)
+
+    def token_to_str(self, i):
+        return "({}, {})".format(*self.token(i))
+
+    def lexemes(self, kind):
+        ''' Лениво выдает лексемы всех токенов заданного вида '''
+        code, source = kind_codes[kind], self.source
+        for j, k in enumerate(self.kinds):
+            if k == code:
+                yield source[self.starts[j]:self.ends[j]]
+
+    def iter_lines(self):
+        ''' Выдает пары (номер строки, список токенов строки) для строк, где есть токены '''
+        source, kinds, starts, ends, lines = self.source, self.kinds, self.starts, self.ends, self.lines
+        j, n = 0, len(kinds)
+        while j < n:
+            lineno = lines[j]
+            tokens = []
+            while j < n and lines[j] == lineno:
+                tokens.append((token_kinds[kinds[j]], source[starts[j]:ends[j]]))
+                j += 1
+            yield lineno, tokens
+
+    def drop_line(self, lineno):
+        ''' Отбрасывает токены строки lineno, если она первая из хранимых '''
+        n = 0
+        while n < len(self.lines) and self.lines[n] == lineno:
+            n += 1
+        if n:
+            for column in (self.kinds, self.starts, self.ends, self.lines):
+                del column[:n]
+            self.offset += n
+
 class Scanner(object):
     ''' Лексический анализатор, который токенизирует входной исходный файл
         в соответствии с лексической спецификацией C минус '''
 
-    def __init__(self, input_file, chunk_size=8192, max_state_size=float("inf")):
-        ''' Инициализирует сканер '''
+    def __init__(self, input_file, context, chunk_size=8192, max_state_size=float("inf"), engine="dfa"):
+        ''' Инициализирует сканер. context - контекст компиляции, в таблицу символов которого
+            заносятся идентификаторы. engine выбирает движок разбора:
+            "dfa" - проход по таблице token_dfa, "regex" - мастер-регулярка с тем же результатом '''
         assert chunk_size >= 16, "Минимальный поддерживаемый размер чанка - 16!"
-        if not os.path.isabs(input_file):
+        assert engine in engines, f"Неизвестный движок сканера '{engine}', доступны: {', '.join(engines)}"
+        self._handle = None # открытый дескриптор входа, из которого дочитывается буфер
+        self._owns_handle = False
+        if hasattr(input_file, "read"): # вход - уже открытый файлоподобный объект
+            self._handle = input_file
+            input_file = getattr(input_file, "name", "<stream>")
+        elif not os.path.isabs(input_file):
             input_file = os.path.join(script_dir, input_file)
         self.input_file = input_file
         print(self.input_file)
+        self.context = context
         self.line_number = 1
         self.first_line = 1
         self._lexical_errors = []
-        self.tokens = {} # доступ к токенам по номеру строки
-        self.tokens[self.line_number] = []
+        self.tokens = TokenStore() # токены в виде смещений во входном буфере
         self.max_state_size = max_state_size # сколько строк токенов мы хотим держать в памяти (по умолчанию: неограниченно)
-        self.ind = []
-        self.nums = []
+        self.engine = engine
+        self._next_token = self._next_token_regex if engine == "regex" else self._next_token_dfa
         self.tokens_file = os.path.join(script_dir, "output", "tokens.txt")
         self.symbol_file = os.path.join(script_dir, "output", "symbol_table.txt")
 
@@ -201,68 +457,40 @@ class Scanner(object):
         self.file_pointer = 0
         self.max_unclosed_comment_size = 15
         self.input = ""
-        self.read_input()
+        self.pos = 0 # позиция чтения во входном буфере (токены - это смещения в self.input)
+        self.streaming = False # потоковый режим (iter_tokens): чтение чанками, без истории токенов
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._input_exhausted = False
 
         # лексическая спецификация
-        self._symbols = {',', ';', ':', '(', ')', '~', '/'} # = и * исключены
-        self.letters = {chr(i) for i in range(65, 91)} | {chr(i) for i in range(97, 123)}
-        self.digits = {str(i) for i in range(0, 10)}
+        self._symbols = _symbols
+        self.letters = letters
+        self.digits = digits
         self.symbols = self._symbols | {"*", "="}
-        
-        
-
-        razd = [
-            "NE",       # 0
-            "EQ",       # 1
-            "LT",      # 2
-            "LE",      # 3
-            "GT",       # 4
-            "GE",       # 5
-            "plus",       # 6
-            "min",      # 7
-            "or",        # 8
-            "mult",       # 9
-            "div",       # 10
-            "and",        # 11
-            "~",         # 12
-            "+",         # 13
-            "-",         # 14
-            "as",        # 15
-            ":",         # 16
-            "(",         # 17
-            ")",         # 18
-            ".",         # 19
-            ",",         # 20
-            "{",         # 21
-            "}",         # 22
-        ]
-        self.identifiers = razd
+
         self.razd = set(razd)
+        self.keywords = {keyword: i for i, keyword in enumerate(keywords)} # таблица ключевых слов
+        self.identifiers = {} # лексема идентификатора -> id в порядке первого появления
 
-        #
-        keywords = [
-            "end",     # 0
-            "dim",       # 1
-            "integer",       # 2
-            "real",        # 3
-            "boolean",      # 4
-            "if",      # 5
-            "then",       # 6
-            "else",        # 7
-            "for",     # 8
-            "do",        # 9
-            "to",      # 10
-            "read",      # 11
-            "write",     # 12
-            "while",     # 13
-            "true",      # 14
-            "false",      # 15
-        ]
-        self.identifiers = keywords
-        self.keywords = set(keywords)
-        
     def data(self):
         return self.nums, self.ind
+
+    @property
+    def ind(self):
+        ''' Идентификаторы в порядке первого появления '''
+        return list(self.identifiers)
+
+    def register_identifier(self, lexim):
+        ''' Возвращает id идентификатора, регистрируя его при первом появлении '''
+        identifier_id = self.identifiers.get(lexim)
+        if identifier_id is None:
+            identifier_id = self.identifiers[lexim] = len(self.identifiers)
+        return identifier_id
+
+    @property
+    def nums(self):
+        ''' Числовые лексемы в порядке появления (вычисляются из хранилища токенов) '''
+        return list(self.tokens.lexemes("NUM"))
     
     @property
     def lexical_errors(self):
@@ -283,7 +511,7 @@ class Scanner(object):
 
     def id_to_lexim(self, token_id):
         ''' Возвращает лексиму по идентификатору токена '''
-        return SymbolTableManager.symbol_table[token_id]['lexim']
+        return self.context.symbols.symbol_table[token_id]['lexim']
 
     def token_to_str(self, token):
         ''' Преобразует токен в строку '''
@@ -293,234 +521,338 @@ class Scanner(object):
             return "({}, {})".format(*token)
 
     def read_input(self):
-        ''' Читает входной файл по чанкам '''
-        with open(self.input_file, "rb") as f:
-            f.seek(self.file_pointer)
-            chunk = f.read(self.chunk_size)
-        if not chunk:
+        ''' Дочитывает вход из открытого дескриптора в буфер. Обычно файл читается
+            целиком за одно чтение; в потоковом режиме - чанками по chunk_size, а уже
+            разобранная часть буфера отбрасывается, так что память не растет с размером входа '''
+        if self._input_exhausted:
             raise EOFError
-        self.input += chunk.decode()
-        self.file_pointer += self.chunk_size
+        if self._handle is None:
+            self._handle = open(self.input_file, "rb")
+            self._owns_handle = True
+        size = self.chunk_size if self.streaming else -1
+        text = ""
+        while not text:
+            chunk = self._handle.read(size)
+            if isinstance(chunk, bytes):
+                text = self._decoder.decode(chunk, final=not chunk)
+            else:
+                text = chunk
+            if not chunk:
+                break
+        if not text:
+            self._input_exhausted = True
+            if self._owns_handle:
+                self._handle.close()
+            raise EOFError
+        if self.streaming and self.pos:
+            self.input = self.input[self.pos:] + text # одна копия на чанк, а не на токен
+            self.pos = 0
+        else:
+            self.input += text # смещения токенов в хранилище остаются валидными
+            self.tokens.source = self.input
+        self.file_pointer += len(text)
 
     def _resolve_dfa_table_column(self, input_char):
         ''' Определяет столбец таблицы DFA для данного символа '''
-        if input_char in whitespaces:
-            return char_to_col["WHITESPACE"]
-        if input_char in self.letters:
-            return char_to_col["LETTER"]
-        if input_char in self.digits:
-            return char_to_col["DIGIT"]
-        if input_char in self._symbols:
-            return char_to_col["SYMBOL"]
-        
-
-        try:
-            return char_to_col[input_char]
-        except KeyError:
-            return char_to_col["OTHER"]
+        code = ord(input_char)
+        return char_class[code] if code < 256 else OTHER_COL
 
     def save_symbol_table(self):
         ''' Сохраняет таблицу символов в файл '''
         with open(self.symbol_file, "w") as f:
-            for i, symbol in enumerate(self.identifiers):
+            for i, symbol in enumerate(self.keywords):
+                f.write(f"{i+1}.\t{symbol}\n")
+            for i, symbol in enumerate(self.identifiers, len(self.keywords)):
                 f.write(f"{i+1}.\t{symbol}\n")
 
     def save_tokens(self):
         ''' Сохраняет токены в файл '''
         if self.max_state_size > 0:
             with open(self.tokens_file, "w") as f:
-                for lineno, tokens in self.tokens.items():
-                    if tokens:
-                        f.write(f"{lineno}.\t{' '.join([f'({t}, {l})' for t, l in tokens])}\n")
+                for lineno, tokens in self.tokens.iter_lines():
+                    f.write(f"{lineno}.\t{' '.join([f'({t}, {l})' for t, l in tokens])}\n")
 
     def _switch_line(self, num_lines):
         ''' Переключает строку и обновляет номер строки '''
         if num_lines > 0:
-            for i in range(num_lines):
-                self.tokens[self.line_number + i + 1] = []
             self.line_number += num_lines
-            # удаляет начальные пробелы из следующей строки
+            # пропускает начальные пробелы следующей строки, сдвигая позицию чтения
             # (ожидаются символы новой строки, так как они нужны для расчетов номера строки)
-            self.input = self.input.lstrip(" ").lstrip("\t")
+            inp, pos, end = self.input, self.pos, len(self.input)
+            while pos < end and inp[pos] == " ":
+                pos += 1
+            while pos < end and inp[pos] == "\t":
+                pos += 1
+            self.pos = pos
 
     def update_symbol_table(self, lexim):
         ''' Обновляет таблицу символов новым символом '''
-        symbol_id = SymbolTableManager.install_id(lexim)
-        if symbol_id == len(SymbolTableManager.symbol_table):
-            SymbolTableManager.insert(lexim)
+        symbol_id = self.context.symbols.install_id(lexim)
+        if symbol_id == len(self.context.symbols.symbol_table):
+            self.context.symbols.insert(lexim)
         return symbol_id
     
     def get_next_token(self):
-        save_state = None
-        error_occurred = False
-        input_ended = False
-        s = 0  # начальное состояние
-
-        if len(self.tokens.keys()) > self.max_state_size:
-            self.tokens.pop(self.first_line, None)
+        ''' Возвращает следующий токен. Вход не копируется: движок проходит
+            по буферу от позиции self.pos, и токен вырезается один раз '''
+        if not self.streaming and self.line_number - self.first_line + 1 > self.max_state_size:
+            self.tokens.drop_line(self.first_line)
             self.first_line += 1
 
         if len(self._lexical_errors) > self.max_state_size:
             self._lexical_errors.pop(0)
 
         while True:  # Цикл до тех пор, пока не найдем корректный токен
-            if not self.input or input_ended:
-                try:
-                    self.read_input()
-                except EOFError:
-                    if s in unclosed_comment_states:
-                        mucs = self.max_unclosed_comment_size
-                        err_token = self.input[:mucs]
-                        if len(self.input) > len(err_token):
-                            err_token = err_token + " ..."
-                        SymbolTableManager.error_flag = True
-                        self._lexical_errors.append((self.line_number, err_token, "unclosed comment"))
-                    self.line_number += self.input.count("\n")
-                    self.input = ""
-                    return ("EOF", "$")
-
-            token_candidates = []
-            error_occurred = False
-            input_ended = False
-
-            s = 0 if save_state is None else save_state
-            save_state = None
-
-            # проходим по DFA, пока можем с оставшимся вводом
-            for i in range(len(self.input) + 1):
-                try:
-                    a = self.input[i]
-                except IndexError:
-                    a = self.input[-1]
-                col = self._resolve_dfa_table_column(a)
-                next_s = token_dfa[s][col]
-            
-
-                if s in state_to_error_message:  # находимся ли мы в состоянии ошибки?
-                    if s == 22:
-                        i -= 1  # это состояние ошибки просмотра вперед (некорректный комментарий)
-                    lexim, error = self.input[:i], state_to_error_message[s]
-                    if self.max_state_size > 0:
-                        SymbolTableManager.error_flag = True
-                        self._lexical_errors.append((self.line_number, lexim, error))
-                    else:
-                        print(f"Lexical Error in line {self.line_number}: {error} '{lexim}'")
-                    self.input = self.input[i:]  # пропускаем некорректный токен (режим паники)
-                    error_occurred = True
-                    break
+            try:
+                if self.pos >= len(self.input):
+                    self._end_of_input(0)
+                    continue
+                token = self._next_token()
+            except EOFError:
+                return ("EOF", "$")
+            if token is not None:
+                return token
+
+    def _end_of_input(self, s):
+        ''' Вызывается, когда ввод закончился в состоянии s. Пытается дочитать вход,
+            а в конце файла фиксирует незакрытый комментарий и бросает EOFError '''
+        try:
+            self.read_input()
+        except EOFError:
+            if s in unclosed_comment_states:
+                mucs = self.max_unclosed_comment_size
+                err_token = self.input[self.pos:self.pos + mucs]
+                if len(self.input) - self.pos > len(err_token):
+                    err_token = err_token + " ..."
+                self._error(err_token, "unclosed comment")
+            self.line_number += self.input.count("\n", self.pos)
+            self.pos = len(self.input)
+            raise
+
+    def _error(self, lexim, error, flag=True):
+        ''' Фиксирует лексическую ошибку. В потоковом режиме ошибки не копятся в памяти,
+            а печатаются сразу (как при max_state_size == 0), иначе список рос бы с размером входа.
+            flag=False - ошибка не поднимает error_flag таблицы символов '''
+        if flag:
+            self.context.symbols.error_flag = True
+        if self.streaming:
+            print(f"Lexical Error in line {self.line_number}: {error} '{lexim}'")
+        else:
+            self._lexical_errors.append((self.line_number, lexim, error))
 
-                if s in F:  # находимся ли мы в принимающем состоянии?
-                    if s in Fstar:
-                        token_candidates.append((s, self.input[:i-1]))
-                    else:
-                        token_candidates.append((s, self.input[:i]))
+    def _scan_dfa(self):
+        ''' Проходит по таблице DFA от позиции self.pos. Возвращает (состояние, начало, конец)
+            максимального токена или None, если токен не получен (ошибка, дочитывание ввода) '''
+        token_state = None
+        token_end = 0
+        s = 0  # начальное состояние
 
-                if next_s is None:  # можем ли мы продолжать проход по DFA?
-                    break
-                elif i >= len(self.input):  # достаточно ли у нас ввода для этого?
-                    # это происходит только для больших файлов или маленького размера чанка
-                    if next_s not in F:
-                        save_state = next_s
-                    input_ended = True
+        inp = self.input
+        start = self.pos
+        end = len(inp)
+
+        # проходим по DFA, пока можем с оставшимся вводом
+        for i in range(start, end + 1):
+            code = ord(inp[i] if i < end else inp[end - 1])
+            next_s = token_dfa[s][char_class[code] if code < 256 else OTHER_COL]
+            action = state_action[s]
+            if not action:
+                if next_s is None:
                     break
-                #print(s)       
+                elif i >= end:  # ввод закончился посреди токена
+                    self._end_of_input(s)
+                    return None
                 s = next_s
-
-            if error_occurred or input_ended:
                 continue
 
-            if token_candidates:
-                max_token = token_candidates[-1]  # выбираем максимальный токен
-                state, lexim = max_token
-                self.input = self.input[len(lexim):]  # продвигаемся во вводе
-                token = state_to_token[state]
-
-                if token == "WHITESPACE" or token == "COMMENT":  # эти токены не будут возвращены
-                    self._switch_line(lexim.count("\n"))  # обновляем номер строки и т.д.
-                    continue  # переходим к следующему токену
-
-                if token == "NUM":
-                    self.nums.append(lexim)
-                    # Разрешаем цифры, символы '+' и '-', а также 'e' или 'E', но не другие буквы или символы
-                    if re.search(r'[^0-9eE\+\-\.]', lexim):  
-                        SymbolTableManager.error_flag = True
-                        self._lexical_errors.append((self.line_number, lexim, "e number without e"))
-                        
-                        continue
-
-                if token == "Nbodh":  
-                    if lexim[-1] in ['b', 'B']:
-                        # Возвращаемся к началу слова и проверяем его на наличие только 0, 1, b, B
-                        if re.search(r'[^01 ]', lexim[:-1]): #пробел важен 
-                            SymbolTableManager.error_flag = True
-                            self._lexical_errors.append((self.line_number, lexim, "Invalid binary number"))
-                            continue  # Пропускаем токен и продолжаем 
-                        else:
-                            token = "NUM"
-                            self.nums.append(lexim)
-
-                    elif lexim[-1] in ['o', 'O']:
-                        # Возвращаемся к началу слова и проверяем его на наличие только 0, 1, b, B
-                        if re.search(r'[^0-7 ]', lexim[:-1]): #пробел важен 
-                            SymbolTableManager.error_flag = True
-                            self._lexical_errors.append((self.line_number, lexim, "Invalid octa number"))
-                            continue  # Пропускаем токен и продолжаем 
-                        else:
-                            token = "NUM"
-                            self.nums.append(lexim)
-                            
-                    elif lexim[-1] in ['d', 'D']:
-                        # Возвращаемся к началу слова и проверяем его на наличие только 0, 1, b, B
-                        if re.search(r'[^0-9 ]', lexim[:-1]): #пробел важен 
-                            SymbolTableManager.error_flag = True
-                            self._lexical_errors.append((self.line_number, lexim, "Invalid deca number"))
-                            continue  # Пропускаем токен и продолжаем 
-                        else:
-                            token = "NUM"
-                            self.nums.append(lexim)
-
-                    elif lexim[-1] in ['h', 'H']:
-                        # Возвращаемся к началу слова и проверяем его на наличие только 0, 1, b, B
-                        if re.search(r'[^0-9A-F ]', lexim[:-1]): #пробел важен 
-                            SymbolTableManager.error_flag = True
-                            self._lexical_errors.append((self.line_number, lexim, "Invalid hex number"))
-                            continue  # Пропускаем токен и продолжаем 
-                        else:
-                            token = "NUM"
-                            self.nums.append(lexim)
-                    else:
-                        self._lexical_errors.append((self.line_number, lexim, "Invalid number"))
-                        continue  # Пропускаем токен и продолжаем 
-                        
-                if token == "SYMBOL":
-                    token = "KEYWORD" if lexim in self.keywords else "SYMBOL"  
- 
-                if token == "SYMBOL":
-                    token = "RAZD" if lexim in self.razd else "SYMBOL"      
-                   
-                if token == "ID_OR_KEYWORD":  
-                    token = "KEYWORD" if lexim in self.keywords else "ID"
-
-                if token == "ID":  
-                    token = "RAZD" if lexim in self.razd else "ID"
-                    
+            if action == ERROR:  # находимся ли мы в состоянии ошибки?
+                if s == 22:
+                    i -= 1  # это состояние ошибки просмотра вперед (некорректный комментарий)
+                lexim, error = inp[start:i], state_to_error_message[s]
                 if self.max_state_size > 0:
-                    self.tokens[self.line_number].append((token, lexim))  # сохраняем токены для последующей печати
-
-                if token == "ID":
-                    if lexim not in self.identifiers:
-                        self.identifiers.append(lexim)
-                        self.ind.append(lexim)
-                    lexim = self.update_symbol_table(lexim)
-                return (token, lexim)
+                    self._error(lexim, error)
+                else:
+                    print(f"Lexical Error in line {self.line_number}: {error} '{lexim}'")
+                self.pos = i  # пропускаем некорректный токен (режим паники)
+                return None
+
+            # принимающее состояние (запоминаем максимальный токен)
+            token_state = s
+            token_end = i - 1 if action == ACCEPT_STAR else i
+
+            if next_s is None:  # можем ли мы продолжать проход по DFA?
+                break
+            elif i >= end:  # ввод закончился посреди токена
+                self._end_of_input(s)
+                return None
+            s = next_s
+
+        if token_state is None:
+            print(f"[Panic Mode] Dropping '{inp[start:start + 1]}' from input!")
+            self.pos += 1  # сбрасываем некорректный символ в случае ошибки
+            return None
+        return token_state, start, token_end
+
+    def _next_token_dfa(self):
+        ''' Шаг движка "dfa": токен из прохода по таблице или None '''
+        lexeme = self._scan_dfa()
+        return None if lexeme is None else self._accept(*lexeme)
+
+    def _next_token_regex(self):
+        ''' Шаг движка "regex": ищет токен одним совпадением мастер-регулярки от позиции self.pos.
+            Пробелы и комментарии пропускаются здесь же, без выхода в get_next_token.
+            Токены групп из group_to_kind принимаются сразу, без вызова _accept: на них
+            приходится почти весь вход, и вызовы на каждый токен съедали выигрыш регулярки.
+            То, что регулярка не распознаёт однозначно (ошибки, конец ввода посреди токена),
+            разбирается таблицей DFA, поэтому результат совпадает с движком "dfa" '''
+        inp = self.input
+        match = master_pattern.match(inp, self.pos)
+        while match is not None and match.lastgroup in skipped_groups:
+            start, self.pos = self.pos, match.end()
+            self._switch_line(inp.count("\n", start, self.pos))
+            match = master_pattern.match(inp, self.pos)
+        if match is None:
+            if self.pos >= len(inp):
+                self._end_of_input(0)
+                return None
+            return self._next_token_dfa()
+
+        group = match.lastgroup
+        start, end = match.span(group)
+        kind = group_to_kind.get(group)
+        if kind is None:
+            return self._accept(group_to_state[group], start, end)
+        self.pos = end
+        lexim = inp[start:end]
+        token = lexeme_to_token.get(lexim, kind)
+        if not self.streaming:
+            if self.max_state_size > 0:
+                self.tokens.append(token, start, end, self.line_number)
+            if token == "ID":
+                self.register_identifier(lexim)
+        if token == "ID":
+            lexim = self.update_symbol_table(lexim)
+        return (token, lexim)
+
+    def _accept(self, token_state, start, end):
+        ''' Обрабатывает принятую лексему input[start:end]: продвигает позицию чтения,
+            классифицирует лексему и возвращает токен (или None для пропускаемых лексем) '''
+        self.pos = end  # продвигаемся во вводе
+        token = state_to_token[token_state]
+
+        if token == "WHITESPACE" or token == "COMMENT":  # эти токены не будут возвращены
+            self._switch_line(self.input.count("\n", start, end))  # обновляем номер строки и т.д.
+            return None  # переходим к следующему токену
+
+        lexim = self.input[start:end]
+
+        if token == "NUM":
+            # Разрешаем цифры, символы '+' и '-', а также 'e' или 'E', но не другие буквы или символы
+            if re.search(r'[^0-9eE\+\-\.]', lexim):  
+                self._error(lexim, "e number without e")
+                return None
+
+        if token == "Nbodh":  
+            if lexim[-1] in ['b', 'B']:
+                # Возвращаемся к началу слова и проверяем его на наличие только 0, 1, b, B
+                if re.search(r'[^01 ]', lexim[:-1]): #пробел важен 
+                    self._error(lexim, "Invalid binary number")
+                    return None  # Пропускаем токен и продолжаем 
+                else:
+                    token = "NUM"
+
+            elif lexim[-1] in ['o', 'O']:
+                # Возвращаемся к началу слова и проверяем его на наличие только 0, 1, b, B
+                if re.search(r'[^0-7 ]', lexim[:-1]): #пробел важен 
+                    self._error(lexim, "Invalid octa number")
+                    return None  # Пропускаем токен и продолжаем 
+                else:
+                    token = "NUM"
+
+            elif lexim[-1] in ['d', 'D']:
+                # Возвращаемся к началу слова и проверяем его на наличие только 0, 1, b, B
+                if re.search(r'[^0-9 ]', lexim[:-1]): #пробел важен 
+                    self._error(lexim, "Invalid deca number")
+                    return None  # Пропускаем токен и продолжаем 
+                else:
+                    token = "NUM"
+
+            elif lexim[-1] in ['h', 'H']:
+                # Возвращаемся к началу слова и проверяем его на наличие только 0, 1, b, B
+                if re.search(r'[^0-9A-F ]', lexim[:-1]): #пробел важен 
+                    self._error(lexim, "Invalid hex number")
+                    return None  # Пропускаем токен и продолжаем 
+                else:
+                    token = "NUM"
             else:
-                print(f"[Panic Mode] Dropping '{self.input[:1]}' from input!")
-                self.input = self.input[1:]  # сбрасываем некорректный символ в случае ошибки
+                # как и раньше, число с неизвестным суффиксом не поднимает error_flag
+                self._error(lexim, "Invalid number", flag=False)
+                return None  # Пропускаем токен и продолжаем 
+
+        if token == "SYMBOL":
+            token = lexeme_to_token.get(lexim, "SYMBOL")
+        elif token == "ID_OR_KEYWORD":
+            token = lexeme_to_token.get(lexim, "ID")
+
+        if not self.streaming:
+            if self.max_state_size > 0:
+                self.tokens.append(token, start, end, self.line_number)  # сохраняем токены для последующей печати
+            if token == "ID":
+                self.register_identifier(lexim)
+
+        if token == "ID":
+            lexim = self.update_symbol_table(lexim)
+        return (token, lexim)
+
+    def iter_tokens(self):
+        ''' Лениво выдает токены до конца ввода. Включает потоковый режим: вход дочитывается
+            чанками из открытого дескриптора, токены, числа и идентификаторы по строкам
+            не накапливаются, поэтому память не зависит от размера входа '''
+        self.streaming = True
+        while True:
+            token = self.get_next_token()
+            if token[0] == "EOF":
+                return
+            yield token
+
+def compare_engines(input_paths):
+    ''' Дифференциальная проверка: прогоняет оба движка сканера по файлам и возвращает
+        список расхождений в токенах, номерах строк и лексических ошибках '''
+    from context import CompilationContext
+    divergences = []
+    for input_path in input_paths:
+        results = {}
+        for engine in engines:
+            scanner = Scanner(input_path, CompilationContext(), engine=engine)
+            stream = []
+            token = None
+            try:
+                while token != ("EOF", "$"):
+                    token = scanner.get_next_token()
+                    if token[0] == "ID":
+                        token = ("ID", scanner.id_to_lexim(token[1]))
+                    stream.append((scanner.line_number, token))
+            except Exception as e:
+                stream.append((scanner.line_number, ("CRASH", type(e).__name__)))
+            results[engine] = (stream, scanner.lexical_errors)
+
+        (dfa_stream, dfa_errors), (regex_stream, regex_errors) = results["dfa"], results["regex"]
+        for i, (expected, got) in enumerate(zip(dfa_stream, regex_stream)):
+            if expected != got:
+                divergences.append((input_path, f"token #{i}: dfa {expected} != regex {got}"))
+                break
+        else:
+            if len(dfa_stream) != len(regex_stream):
+                divergences.append((input_path, f"token count: dfa {len(dfa_stream)} != regex {len(regex_stream)}"))
+        if dfa_errors != regex_errors:
+            divergences.append((input_path, f"lexical errors differ:\n{dfa_errors}---\n{regex_errors}"))
+    return divergences
 
-def mainScanner(input_path):
+def mainScanner(input_path, engine="dfa"):
     ''' Основная функция для запуска сканера '''
     import time
-    scanner = Scanner(input_path)
+    from context import CompilationContext
+    scanner = Scanner(input_path, CompilationContext(), engine=engine)
     start = time.time()
     token = scanner.get_next_token()
     while token[0] != "EOF":
@@ -531,8 +863,20 @@ def mainScanner(input_path):
     scanner.save_lexical_errors()
     scanner.save_tokens()
 
-    
+
 if __name__ == "__main__":
-    SymbolTableManager.init()
+    import sys
+    if "--diff" in sys.argv:
+        # python scanner.py --diff [файлы ...]  (по умолчанию - корпус tests/)
+        import glob
+        paths = [arg for arg in sys.argv[1:] if arg != "--diff"]
+        if not paths:
+            tests_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tests")
+            paths = sorted(glob.glob(os.path.join(tests_dir, "*", "input.txt")))
+        divergences = compare_engines(paths)
+        for input_path, divergence in divergences:
+            print(f"{input_path}: {divergence}")
+        print(f"Checked {len(paths)} files, {len(divergences)} divergences")
+        sys.exit(1 if divergences else 0)
     input_path = os.path.join(script_dir, "input/input_simple.c")
-    mainScanner(input_path)
\ No newline at end of file
+    mainScanner(input_path)
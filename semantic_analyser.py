@@ -1,17 +1,25 @@
 import os
-from scanner import SymbolTableManager
-from code_gen import MemoryManager
+from functools import partial
 
 script_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 script_dir = os.path.join(script_dir, "compiler-st")
+
+declared_types = ("integer", "real", "boolean")
+# the three-address code has no instructions for input and division
+unsupported_constructs = ("read", "div")
+
 class SemanticAnalyser(object):
-    def __init__(self):
+    def __init__(self, context):
+        self.context = context
+        self.symbols = context.symbols
+        self.memory = context.memory
 
         # routines
         self.semantic_checks = {
             "#SA_INC_SCOPE" : self.inc_scope_routine,
             "#SA_DEC_SCOPE" : self.dec_scope_routine,
 
+            "#SA_MAIN_PROGRAM" : self.main_program_routine,
             "#SA_SAVE_MAIN" : self.save_main_routine,
             "#SA_MAIN_POP" : self.pop_main_routine,
             "#SA_MAIN_CHECK" : self.check_main_routine,
@@ -24,8 +32,11 @@ class SemanticAnalyser(object):
             "#SA_ASSIGN_LENGTH" : self.assign_length_routine,
             "#SA_SAVE_PARAM" : self.save_param_routine,
             "#SA_ASSIGN_FUN_ATTRS" : self.assign_fun_attrs_routine,
+            "#SA_SAVE_DECL" : self.save_decl_routine,
+            "#SA_ASSIGN_DECL_TYPE" : self.assign_decl_type_routine,
 
             "#SA_CHECK_DECL" : self.check_declaration_routine,
+            "#SA_CHECK_SUPPORTED" : self.check_supported_routine,
 
             "#SA_SAVE_FUN" : self.save_fun_routine,
             "#SA_CHECK_ARGS" : self.check_args_routine,
@@ -69,6 +80,7 @@ class SemanticAnalyser(object):
         # lists
         self.fun_param_list = []
         self.fun_arg_list = []
+        self.decl_list = [] # identifiers of a "dim" waiting for their type
         self._semantic_errors = []
 
         self.semantic_error_file = os.path.join(script_dir, "errors", "semantic_errors.txt")
@@ -76,7 +88,7 @@ class SemanticAnalyser(object):
 
     @property
     def scope(self):
-        return len(SymbolTableManager.scope_stack) - 1
+        return len(self.symbols.scope_stack) - 1
 
 
     @property
@@ -92,7 +104,7 @@ class SemanticAnalyser(object):
 
     def _get_lexim(self, token):
         if token[0] == "ID":
-            return SymbolTableManager.symbol_table[token[1]]['lexim']
+            return self.symbols.symbol_table[token[1]]['lexim']
         else:
             return token[1]
 
@@ -106,12 +118,16 @@ class SemanticAnalyser(object):
 
 
     def inc_scope_routine(self, input_token, line_number):
-        SymbolTableManager.scope_stack.append(len(SymbolTableManager.symbol_table))
+        self.symbols.push_scope()
 
 
     def dec_scope_routine(self, input_token, line_number):
-        scope_start_idx = SymbolTableManager.scope_stack.pop()
-        SymbolTableManager.symbol_table = SymbolTableManager.symbol_table[:scope_start_idx]
+        self.symbols.pop_scope()
+
+
+    def main_program_routine(self, input_token, line_number):
+        # the statements of the program are its main function
+        self.main_found = True
 
 
     def save_main_routine(self, input_token, line_number):
@@ -123,23 +139,23 @@ class SemanticAnalyser(object):
 
     
     def save_type_routine(self, input_token, line_number):
-        SymbolTableManager.declaration_flag = True
+        self.symbols.declaration_flag = True
         self.semantic_stacks["type_assign"].append(input_token[1])
 
 
     def assign_type_routine(self, input_token, line_number):
         if input_token[0] == "ID" and self.semantic_stacks["type_assign"]:
             symbol_idx = input_token[1]
-            SymbolTableManager.symbol_table[symbol_idx]["type"] = self.semantic_stacks["type_assign"].pop()
+            self.symbols.symbol_table[symbol_idx]["type"] = self.semantic_stacks["type_assign"].pop()
             self.semantic_stacks["type_assign"].append(symbol_idx)
-            SymbolTableManager.declaration_flag = False
+            self.symbols.declaration_flag = False
         
 
     def assign_fun_role_routine(self, input_token, line_number):
         if self.semantic_stacks["type_assign"]:
             symbol_idx = self.semantic_stacks["type_assign"][-1]
-            SymbolTableManager.symbol_table[symbol_idx]["role"] = "function"
-            SymbolTableManager.symbol_table[symbol_idx]["address"] = MemoryManager.pb_index
+            self.symbols.symbol_table[symbol_idx]["role"] = "function"
+            self.symbols.symbol_table[symbol_idx]["address"] = self.memory.pb_index
 
     
     def assign_param_role_routine(self, input_token, line_number):
@@ -149,12 +165,12 @@ class SemanticAnalyser(object):
     def assign_var_role_routine(self, input_token, line_number, role="local_var"):
         if self.semantic_stacks["type_assign"]:
             symbol_idx = self.semantic_stacks["type_assign"][-1]
-            symbol_row = SymbolTableManager.symbol_table[symbol_idx]
+            symbol_row = self.symbols.symbol_table[symbol_idx]
             symbol_row["role"] = role
             if self.scope == 0:
                 symbol_row["role"] = "global_var"
             if symbol_row["type"] == "void":
-                SymbolTableManager.error_flag = True
+                self.symbols.error_flag = True
                 self._semantic_errors.append((line_number, "Illegal type of void for '{}'.".format(symbol_row["lexim"])))
                 symbol_row.pop("type") # void types are not considered to be defined
             if input_token[1] == "[":
@@ -164,52 +180,75 @@ class SemanticAnalyser(object):
     def assign_length_routine(self, input_token, line_number):
         if self.semantic_stacks["type_assign"]:
             symbol_idx = self.semantic_stacks["type_assign"].pop()
-            symbol_row = SymbolTableManager.symbol_table[symbol_idx]
+            symbol_row = self.symbols.symbol_table[symbol_idx]
             if input_token[0] == "NUM":
                 symbol_row["arity"] = int(input_token[1])
                 if symbol_row["role"] == "param":
-                    symbol_row["offset"] = MemoryManager.get_param_offset()
+                    symbol_row["offset"] = self.memory.get_param_offset()
                 else: 
-                    symbol_row["address"] = MemoryManager.get_static(int(input_token[1]))
+                    symbol_row["address"] = self.memory.get_static(int(input_token[1]))
             else:
-                SymbolTableManager.symbol_table[symbol_idx]["arity"] = 1
+                self.symbols.symbol_table[symbol_idx]["arity"] = 1
                 if symbol_row["role"] == "param":
-                    symbol_row["offset"] = MemoryManager.get_param_offset()
+                    symbol_row["offset"] = self.memory.get_param_offset()
                 else:
-                    symbol_row["address"] = MemoryManager.get_static()
+                    symbol_row["address"] = self.memory.get_static()
                 
             if input_token[1] == "[" and self.fun_param_list:
                 self.fun_param_list[-1] = "array"
             
 
+    def save_decl_routine(self, input_token, line_number):
+        if input_token[0] == "ID":
+            self.decl_list.append(input_token[1])
+
+
+    def assign_decl_type_routine(self, input_token, line_number):
+        ''' "dim x, y : integer" names the type after the identifiers, so they
+            get their type, role and static address only here '''
+        decl_list, self.decl_list = self.decl_list, []
+        if input_token[1] not in declared_types:
+            return
+        for symbol_idx in decl_list:
+            symbol_row = self.symbols.symbol_table[symbol_idx]
+            if "type" in symbol_row:
+                self.symbols.error_flag = True
+                self._semantic_errors.append((line_number, f"'{symbol_row['lexim']}' is already defined."))
+                continue
+            symbol_row["type"] = input_token[1]
+            symbol_row["role"] = "global_var"
+            symbol_row["arity"] = 1
+            symbol_row["address"] = self.memory.get_static()
+
+
     def save_param_routine(self, input_token, line_number):
         self.fun_param_list.append(input_token[1])
 
     
     def push_arg_stack_routine(self, input_token, line_number):
-        SymbolTableManager.arg_list_stack.append([])
+        self.symbols.arg_list_stack.append([])
 
 
     def pop_arg_stack_routine(self, input_token, line_number):
-        if len(SymbolTableManager.arg_list_stack) > 1:
-            SymbolTableManager.arg_list_stack.pop()
+        if len(self.symbols.arg_list_stack) > 1:
+            self.symbols.arg_list_stack.pop()
 
     
     def save_arg_routine(self, input_token, line_number):
         if input_token[0] == "ID":
-            SymbolTableManager.arg_list_stack[-1].append(SymbolTableManager.symbol_table[input_token[1]].get("type"))
+            self.symbols.arg_list_stack[-1].append(self.symbols.symbol_table[input_token[1]].get("type"))
         else:
-            SymbolTableManager.arg_list_stack[-1].append("int")
+            self.symbols.arg_list_stack[-1].append("int")
 
 
     def assign_fun_attrs_routine(self, input_token, line_number):
         if self.semantic_stacks["type_assign"]:
             symbol_idx = self.semantic_stacks["type_assign"].pop()
             params = self.fun_param_list
-            SymbolTableManager.symbol_table[symbol_idx]["arity"] = len(params)
-            SymbolTableManager.symbol_table[symbol_idx]["params"] = params
+            self.symbols.symbol_table[symbol_idx]["arity"] = len(params)
+            self.symbols.symbol_table[symbol_idx]["params"] = params
             self.fun_param_list = []
-            SymbolTableManager.temp_stack.append(0) # init temp counter for this function
+            self.symbols.temp_stack.append(0) # init temp counter for this function
 
 
     def check_main_routine(self, input_token, line_number):
@@ -229,33 +268,39 @@ class SemanticAnalyser(object):
     
 
     def check_declaration_routine(self, input_token, line_number):
-        if "type" not in SymbolTableManager.symbol_table[input_token[1]]:
+        if "type" not in self.symbols.symbol_table[input_token[1]]:
             lexim = self._get_lexim(input_token)
-            SymbolTableManager.error_flag = True
+            self.symbols.error_flag = True
             self._semantic_errors.append((line_number, f"'{lexim}' is not defined."))
 
     
+    def check_supported_routine(self, input_token, line_number):
+        if input_token[1] in unsupported_constructs:
+            self.symbols.error_flag = True
+            self._semantic_errors.append((line_number, f"'{input_token[1]}' is not supported by the target machine."))
+
+
     def save_fun_routine(self, input_token, line_number):
-        if SymbolTableManager.symbol_table[input_token[1]].get("role") == "function":
+        if self.symbols.symbol_table[input_token[1]].get("role") == "function":
             self.semantic_stacks["fun_check"].append(input_token[1])
 
 
     def check_args_routine(self, input_token, line_number):
         if self.semantic_stacks["fun_check"]:
             fun_id = self.semantic_stacks["fun_check"].pop()
-            lexim = SymbolTableManager.symbol_table[fun_id]["lexim"]
-            args = SymbolTableManager.arg_list_stack[-1]
+            lexim = self.symbols.symbol_table[fun_id]["lexim"]
+            args = self.symbols.arg_list_stack[-1]
             if args is not None:
                 self.semantic_stacks["type_check"] = self.semantic_stacks["type_check"][:len(args)]
-                if SymbolTableManager.symbol_table[fun_id]["arity"] != len(args):
-                    SymbolTableManager.error_flag = True
+                if self.symbols.symbol_table[fun_id]["arity"] != len(args):
+                    self.symbols.error_flag = True
                     self._semantic_errors.append((line_number, f"Mismatch in numbers of arguments of '{lexim}'."))
                 else:
-                    params = SymbolTableManager.symbol_table[fun_id]["params"]
+                    params = self.symbols.symbol_table[fun_id]["params"]
                     i = 1
                     for param, arg in zip(params, args):
                         if param != arg and arg is not None:
-                            SymbolTableManager.error_flag = True
+                            self.symbols.error_flag = True
                             self._semantic_errors.append((line_number, f"Mismatch in type of argument {i} of '{lexim}'. Expected '{param}' but got '{arg}' instead."))
                         i += 1
 
@@ -266,7 +311,7 @@ class SemanticAnalyser(object):
 
     def check_while_routine(self, input_token, line_number):
         if self.while_counter <= 0:
-            SymbolTableManager.error_flag = True
+            self.symbols.error_flag = True
             self._semantic_errors.append((line_number, f"No 'while' found for 'continue'"))
 
 
@@ -280,7 +325,7 @@ class SemanticAnalyser(object):
 
     def check_break_routine(self, input_token, line_number):
         if self.while_counter <= 0 and self.switch_counter <= 0:
-            SymbolTableManager.error_flag = True
+            self.symbols.error_flag = True
             self._semantic_errors.append((line_number, "No 'while' or 'switch' found for 'break'."))
 
 
@@ -290,7 +335,7 @@ class SemanticAnalyser(object):
 
     def save_type_check_routine(self, input_token, line_number):
         if input_token[0] == "ID":
-            operand_type = SymbolTableManager.symbol_table[input_token[1]].get("type")
+            operand_type = self.symbols.symbol_table[input_token[1]].get("type")
         else:
             operand_type = "int"
         self.semantic_stacks["type_check"].append(operand_type)
@@ -312,11 +357,11 @@ class SemanticAnalyser(object):
             operand_a_type = self.semantic_stacks["type_check"].pop()
             if operand_b_type is not None and operand_a_type is not None:
                 if operand_a_type == "array":
-                    SymbolTableManager.error_flag = True
+                    self.symbols.error_flag = True
                     self._semantic_errors.append((line_number, 
                         f"Type mismatch in operands, Got '{operand_a_type}' instead of 'int'."))
                 elif operand_a_type != operand_b_type:
-                    SymbolTableManager.error_flag = True
+                    self.symbols.error_flag = True
                     self._semantic_errors.append((line_number, 
                         f"Type mismatch in operands, Got '{operand_b_type}' instead of '{operand_a_type}'."))
                 else:
@@ -335,7 +380,21 @@ class SemanticAnalyser(object):
             print(f"{line_number} : Error in semantic routine {action_symbol}:", str(e))
 
 
+    def bind_check(self, action_symbol):
+        ''' returns semantic_check pre-bound to the routine of action_symbol '''
+        routine = self.semantic_checks.get(action_symbol)
+        if routine is None:
+            return partial(self.semantic_check, action_symbol)
+
+        def check(input_token, line_number):
+            try:
+                routine(input_token, line_number)
+            except Exception as e:
+                print(f"{line_number} : Error in semantic routine {action_symbol}:", str(e))
+        return check
+
+
     def eof_check(self, line_number):
         if not self.main_found or self.main_not_last:
-            SymbolTableManager.error_flag = True
+            self.symbols.error_flag = True
             self._semantic_errors.append((line_number, "main function not found!"))
@@ -0,0 +1,113 @@
+'''
+Benchmark of the control flow graph and the data-flow analyses of cfg
+
+    python tests/benchmark_cfg.py [instructions] [words]
+
+builds a random structured program (100000 instructions over 5000 words by
+default) and times the graph, every analysis, the live sets of every
+instruction and the reaching definitions of every direct read.
+'''
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from code_gen import Instruction, Opcode, DIRECT, IMMEDIATE, INDIRECT
+from peephole import read_count
+from cfg import ControlFlowGraph, Liveness, ReachingDefinitions, AvailableExpressions
+
+
+def random_program(size, words, seed=0):
+    ''' a structured program of about size instructions over words addresses:
+        nested loops and conditionals around arithmetic, copies and prints.
+        Every stretch of the program works on its own window of the addresses,
+        so early words stay defined to the end, like the globals of a program '''
+    rng = random.Random(seed)
+    block = []
+
+    def word():
+        base = len(block) * (words - 32) // size
+        return 1000 + 4 * (base + rng.randrange(32))
+
+    def source():
+        if rng.random() < 0.2:
+            return (IMMEDIATE, rng.randrange(10))
+        return (INDIRECT if rng.random() < 0.05 else DIRECT, word())
+
+    def statements(depth):
+        for _ in range(rng.randint(1, 6)):
+            choice = rng.random()
+            if depth < 3 and choice < 0.25:
+                condition = word()
+                loop = len(block)
+                block.append(Instruction(Opcode.LT, (source(), source(), (DIRECT, condition))))
+                branch = Instruction(Opcode.JPF, ((DIRECT, condition), (DIRECT, 0)))
+                block.append(branch)
+                if choice < 0.12:
+                    statements(depth + 1)
+                    block.append(Instruction(Opcode.JP, ((DIRECT, loop),)))
+                    branch.operands = (branch.operands[0], (DIRECT, len(block)))
+                else:
+                    statements(depth + 1)
+                    skip = Instruction(Opcode.JP, ((DIRECT, 0),))
+                    block.append(skip)
+                    branch.operands = (branch.operands[0], (DIRECT, len(block)))
+                    statements(depth + 1)
+                    skip.operands = ((DIRECT, len(block)),)
+            elif choice < 0.35:
+                block.append(Instruction(Opcode.PRINT, (source(),)))
+            elif choice < 0.6:
+                block.append(Instruction(Opcode.ASSIGN, (source(), (DIRECT, word()))))
+            else:
+                opcode = rng.choice([Opcode.ADD, Opcode.SUB, Opcode.MULT, Opcode.EQ])
+                block.append(Instruction(opcode, (source(), source(), (DIRECT, word()))))
+
+    while len(block) < size:
+        statements(0)
+    return block
+
+
+def benchmark(size=100000, words=5000, seed=0):
+    ''' times the graph and the analyses on random_program(size, words, seed):
+        the construction of every analysis, the live sets of every instruction
+        and the reaching definitions of every direct read '''
+    block = random_program(size, words, seed)
+    timings = []
+    start = time.perf_counter()
+
+    def lap(name):
+        nonlocal start
+        now = time.perf_counter()
+        timings.append((name, now - start))
+        start = now
+
+    graph = ControlFlowGraph(block)
+    lap("cfg")
+    liveness = Liveness(graph)
+    lap("liveness")
+    liveness.per_instruction()
+    lap("live per instruction")
+    reaching = ReachingDefinitions(graph)
+    lap("reaching definitions")
+    reads = 0
+    for i, instruction in enumerate(block):
+        for mode, value in instruction.operands[:read_count[instruction.opcode]]:
+            if mode == DIRECT:
+                reaching.definitions_of(i, value)
+                reads += 1
+    lap(f"definitions of {reads} reads")
+    AvailableExpressions(graph)
+    lap("available expressions")
+    print(f"{len(block)} instructions, {len(graph.blocks)} blocks, {len(liveness.variables)} words, "
+          f"{len(reaching.definitions)} definitions")
+    for name, seconds in timings:
+        print(f"{name:>32}: {seconds:.3f} s")
+    print(f"{'total':>32}: {sum(seconds for _, seconds in timings):.3f} s")
+    return timings
+
+
+if __name__ == "__main__":
+    benchmark(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,54 @@
+'''
+Regression tests of the compiler front end
+
+Every directory here holds an input.txt, the three-address code the compiler
+generates for it (output.txt) and the semantic errors it reports
+(semantic_errors.txt). The tests compile the input and compare both.
+'''
+
+import os
+import sys
+import unittest
+
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(tests_dir))
+
+from parser import Parser
+from context import CompilationContext
+
+
+def compile_program(input_path, build_tree=True):
+    parser = Parser(input_path, CompilationContext(), build_tree=build_tree)
+    parser.parse()
+    return parser
+
+
+def read_expected(name, file_name):
+    with open(os.path.join(tests_dir, name, file_name)) as f:
+        return f.read()
+
+
+class CompilerTest(unittest.TestCase):
+
+    def check_program(self, name):
+        parser = compile_program(os.path.join(tests_dir, name, "input.txt"))
+        code = "".join(f"{lineno}\t{instruction}\n"
+                       for lineno, instruction in enumerate(parser.code_generator.program_block))
+        self.assertEqual(code, read_expected(name, "output.txt"))
+        self.assertEqual(parser.semantic_analyzer.semantic_errors, read_expected(name, "semantic_errors.txt"))
+
+    def test_t01(self):
+        self.check_program("T01")
+
+    def test_t02(self):
+        self.check_program("T02")
+
+    def test_if(self):
+        self.check_program("Test_IF")
+
+    def test_expressions(self):
+        self.check_program("Test_EXPR")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+'''
+Tests of the constant folding pass of grammer.py
+
+A folded AST must still pass semantic analysis, with every expression keeping
+the type the analyzer gave it before folding.
+'''
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from grammer import Parser, SemanticAnalyzer, ConstantFolder, Number, Boolean
+from scanner import Scanner
+from context import CompilationContext
+
+
+def parse_program(source):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "input.txt")
+        with open(path, "w") as f:
+            f.write(source)
+        return Parser(Scanner(path, CompilationContext())).parse()
+
+
+class ConstantFolderTest(unittest.TestCase):
+
+    def fold(self, source):
+        ast = parse_program(source)
+        self.assertIsNone(SemanticAnalyzer(ast).analyze())
+        folder = ConstantFolder(ast)
+        ast = folder.fold()
+        self.assertIsNone(SemanticAnalyzer(ast).analyze())
+        return ast, folder.removed
+
+    def test_arithmetic(self):
+        ast, removed = self.fold("dim z : integer\nz as (2 plus 3) mult 4\nend\n")
+        self.assertEqual(type(ast[1].expression), Number)
+        self.assertEqual(ast[1].expression.value, "20")
+        self.assertEqual(removed, 4)
+
+    def test_relational_numbers_keep_their_type(self):
+        ast, removed = self.fold("dim y : integer\ny as 4 EQ 17o EQ 17o\nend\n")
+        self.assertEqual(removed, 0)
+
+    def test_booleans(self):
+        ast, removed = self.fold("dim b : boolean\nb as true EQ false or ~ false\nend\n")
+        self.assertEqual(type(ast[1].expression), Boolean)
+        self.assertEqual(ast[1].expression.value, "true")
+
+
+if __name__ == "__main__":
+    unittest.main()
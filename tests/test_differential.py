@@ -0,0 +1,247 @@
+'''
+Differential tests of the back end
+
+The same programs run on every engine, and each engine must give the same
+output, error, step count and memory:
+- the stepping VirtualMachine;
+- its threaded run();
+- the translator;
+- the NumPy batch machine.
+
+Optimized code must print what the unoptimized code prints. The reaching
+definitions solved sparsely for one word must be the ones the sets over
+all definitions give.
+
+The programs are random. Some are source programs of the language,
+compiled with and without the peephole optimizer. The others are raw
+instruction blocks with indirect operands, invalid addresses and jumps,
+and small step limits.
+'''
+
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import batch
+import cfg
+import translator
+import vm
+from code_gen import Instruction, Opcode, DIRECT, IMMEDIATE, INDIRECT
+from context import CompilationContext
+from parser import Parser
+
+memory_size = 20000
+step_limits = (3, 10, 50, 100000)
+batch_step_limits = (3, 10, 50, 2000) # the batch machine steps a looping block one instruction at a time
+
+integers = ("x", "y", "z")
+relational = ("NE", "EQ", "LT", "LE", "GT", "GE")
+
+
+def random_source(rng, statements=8):
+    ''' a well-typed program over the integers x, y, z and the boolean b. Loops
+        always end: a for loop counts up a variable its body does not assign,
+        and a while loop counts w up to a constant '''
+
+    def integer(depth):
+        if depth <= 0 or rng.random() < 0.3:
+            return rng.choice(integers + ("w",) + tuple(str(rng.choice([0, 1, 2, 3, 7, 100, 65536]))
+                                                          for _ in range(2)))
+        return f"({integer(depth - 1)} {rng.choice(['plus', 'min', 'mult'])} {integer(depth - 1)})"
+
+    def boolean(depth):
+        choice = rng.random()
+        if depth <= 0 or choice < 0.2:
+            return rng.choice(["b", "true", "false"])
+        if choice < 0.6:
+            return f"({integer(depth - 1)} {rng.choice(relational)} {integer(depth - 1)})"
+        if choice < 0.8:
+            return f"~{boolean(depth - 1)}"
+        return f"({boolean(depth - 1)} {rng.choice(['and', 'or'])} {boolean(depth - 1)})"
+
+    def statement(depth, counters):
+        choice = rng.random()
+        assignable = [name for name in integers if name not in counters]
+        if depth <= 0 or choice < 0.3:
+            return f"{rng.choice(assignable)} as {integer(2)}"
+        if choice < 0.4:
+            return f"b as {boolean(2)}"
+        if choice < 0.55:
+            return "write (" + ", ".join(integer(2) for _ in range(rng.randint(1, 3))) + ")"
+        if choice < 0.7:
+            text = f"if {boolean(2)} then {statement(depth - 1, counters)}"
+            if rng.random() < 0.6:
+                text += f" else {statement(depth - 1, counters)}"
+            return text
+        if choice < 0.85 and assignable:
+            counter = rng.choice(assignable)
+            return (f"for {counter} as {rng.randint(0, 2)} to {rng.randint(0, 4)} do "
+                    f"{statement(depth - 1, counters | {counter})}")
+        return f"while w LT {rng.randint(0, 5)} do w as w plus 1"
+
+    lines = ["dim x, y, z, w : integer", "dim b : boolean", "x as 1", "y as 2", "z as 3", "w as 0", "b as true"]
+    lines += [statement(3, frozenset()) for _ in range(statements)]
+    lines += ["write (x, y, z, w, b)", "end"]
+    return "\n".join(lines) + "\n"
+
+
+def compile_source(source, optimize):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "input.txt")
+        with open(path, "w") as f:
+            f.write(source)
+        with contextlib.redirect_stdout(io.StringIO()):
+            parser = Parser(path, CompilationContext())
+            parser.code_generator.optimize = optimize
+            parser.parse()
+    assert parser.syntax_errors == "There is no syntax error.\n", source
+    assert parser.semantic_analyzer.semantic_errors == "The input program is semantically correct.\n", source
+    return parser.code_generator.program_block
+
+
+def random_block(rng):
+    ''' up to 12 instructions of any opcode, with operands of every mode '''
+    n = rng.randint(1, 12)
+    block = []
+    for _ in range(n):
+        opcode = rng.choice(list(Opcode))
+        operands = []
+        for _ in range(vm.arity.get(opcode, 0)):
+            mode = rng.choice([DIRECT, IMMEDIATE, IMMEDIATE, INDIRECT])
+            if mode == IMMEDIATE:
+                value = rng.choice([0, 4, 8, 100, 104, 108, 3, 12, rng.randint(0, 300), "7", "1.5", "12abc"])
+            else:
+                value = rng.choice([100, 104, 108, 0, 4, 8])
+            operands.append((mode, value))
+        if opcode in (Opcode.JP, Opcode.JPF):
+            operands[-1] = (DIRECT, rng.randint(0, n + 1))
+        block.append(Instruction(opcode, tuple(operands)))
+    return block
+
+
+def random_branches(rng):
+    ''' address arithmetic, compare-and-branch pairs and constant stores over a few temps '''
+    n = rng.randint(2, 14)
+    temps = [5000, 5004, 5008]
+    block = []
+    for _ in range(n):
+        choice = rng.random()
+        temp = rng.choice(temps)
+        if choice < 0.3:
+            block.append(Instruction(Opcode.ADD, ((rng.choice([DIRECT, IMMEDIATE, INDIRECT]), rng.choice([1000, 0, 4, 5000])),
+                                                  (IMMEDIATE, rng.choice([0, 4, -4, 8])), (DIRECT, temp))))
+        elif choice < 0.55:
+            opcode = rng.choice([Opcode.ADD, Opcode.LT, Opcode.EQ, Opcode.MULT, Opcode.ASSIGN, Opcode.PRINT])
+            if opcode == Opcode.PRINT:
+                operands = [(INDIRECT, temp)]
+            else:
+                operands = [(rng.choice([DIRECT, IMMEDIATE, INDIRECT]), rng.choice([1000, 4, 8, temp])) for _ in range(2)]
+                operands.append((rng.choice([DIRECT, INDIRECT]), rng.choice(temps + [4, 8])))
+                operands = operands[3 - vm.arity[opcode]:]
+            block.append(Instruction(opcode, tuple(operands)))
+        elif choice < 0.7:
+            block.append(Instruction(rng.choice([Opcode.LT, Opcode.EQ]),
+                                     ((rng.choice([DIRECT, IMMEDIATE, INDIRECT]), rng.choice([4, 8, 1000])),
+                                      (IMMEDIATE, rng.randint(-2, 20)), (DIRECT, temp))))
+            block.append(Instruction(Opcode.JPF, ((DIRECT, temp), (DIRECT, rng.randint(0, n + 1)))))
+        elif choice < 0.85:
+            block.append(Instruction(Opcode.ASSIGN, ((IMMEDIATE, rng.randint(-3, 12)),
+                                                     (rng.choice([DIRECT, DIRECT, IMMEDIATE]), rng.choice([0, 4, 8, 1000, temp])))))
+        else:
+            block.append(Instruction(Opcode.JP, ((DIRECT, rng.randint(0, n + 1)),)))
+    return block
+
+
+def stepped(block, max_steps, memory=()):
+    machine = vm.VirtualMachine(block, max_steps, memory_size)
+    for address, value in memory:
+        machine.memory[address] = value
+    try:
+        while machine.pc < len(machine.program):
+            machine.step()
+    except vm.VMError as error:
+        machine.error = error
+    return machine
+
+
+def written(memory):
+    return {address: value for address, value in enumerate(memory) if value is not None}
+
+
+def outcome(machine):
+    return machine.report(), machine.steps, written(machine.memory)
+
+
+class DifferentialTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        rng = random.Random(21)
+        cls.sources = [random_source(rng) for _ in range(40)]
+        cls.compiled = [compile_source(source, optimize) for source in cls.sources for optimize in (False, True)]
+        cls.blocks = [random_block(rng) for _ in range(300)] + [random_branches(rng) for _ in range(300)]
+        cls.programs = cls.compiled + cls.blocks
+
+    def test_engines(self):
+        rng = random.Random(1)
+        for k, block in enumerate(self.programs):
+            max_steps = rng.choice(step_limits)
+            expected = outcome(stepped(block, max_steps))
+            with self.subTest(program=k, max_steps=max_steps):
+                machine = vm.VirtualMachine(block, max_steps, memory_size)
+                machine.run()
+                self.assertEqual(outcome(machine), expected)
+                self.assertEqual(outcome(translator.run(block, max_steps, memory_size)), expected)
+
+    @unittest.skipIf(batch.np is None, "batch execution needs NumPy")
+    def test_batch(self):
+        rng = random.Random(2)
+        for k, block in enumerate(self.programs):
+            addresses = sorted({value for instruction in block for mode, value in instruction.operands
+                                if type(value) is int and 0 <= value < memory_size})
+            chosen = rng.sample(addresses, min(len(addresses), rng.randint(1, 8)))
+            cases = rng.choice([1, 7])
+            inputs = {address: [rng.choice([0, 1, 4, 8, -1, 1000, rng.randint(-5, 30), 2 ** 31 - 1]) for _ in range(cases)]
+                      for address in chosen}
+            max_steps = rng.choice(batch_step_limits)
+            machine = batch.run_batch(block, inputs, cases, max_steps, memory_size)
+            for case in range(cases):
+                with self.subTest(program=k, case=case, max_steps=max_steps):
+                    expected = stepped(block, max_steps, [(address, values[case]) for address, values in inputs.items()])
+                    self.assertEqual(machine.report(case), expected.report())
+                    if expected.error is None:
+                        self.assertEqual(machine.steps[case], expected.steps)
+                        memory = {address: int(machine.values[case, column]) for address, column in machine.columns.items()
+                                  if machine.written[case, column]}
+                        self.assertEqual(memory, written(expected.memory))
+
+    def test_optimizer(self):
+        for k, source in enumerate(self.sources):
+            plain, optimized = self.compiled[2 * k], self.compiled[2 * k + 1]
+            with self.subTest(program=k):
+                self.assertLessEqual(len(optimized), len(plain))
+                expected, got = vm.run(plain, memory_size=memory_size), vm.run(optimized, memory_size=memory_size)
+                self.assertIsNone(expected.error, source)
+                self.assertEqual(got.report(), expected.report())
+
+    def test_reaching_definitions(self):
+        for k, block in enumerate(self.programs):
+            graph = cfg.ControlFlowGraph(block)
+            sparse, dense = cfg.ReachingDefinitions(graph), cfg.ReachingDefinitions(graph)
+            dense.solve()
+            with self.subTest(program=k):
+                for i in range(len(block)):
+                    reaching = dense.reaching(i)
+                    for address in list(dense.positions) + [123456]:
+                        self.assertEqual(sparse.definitions_of(i, address),
+                                         cfg.members(reaching & dense.defined_by.get(address, 0), dense.definitions))
+
+
+if __name__ == "__main__":
+    unittest.main()
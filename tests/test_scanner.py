@@ -0,0 +1,80 @@
+'''
+Tests of the scanner: streaming the input in small chunks (iter_tokens) must
+give the same tokens as scanning it whole, wherever the chunks happen to end
+'''
+
+import contextlib
+import glob
+import io
+import os
+import sys
+import unittest
+
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(tests_dir))
+
+from scanner import Scanner, engines
+from context import CompilationContext
+
+chunk_sizes = (16, 17, 19, 23, 31, 64)
+
+# lexemes that need the character after them, so that a chunk ends between the two somewhere
+lookaheads = "x as a * b\ny as a *+ b\nz as a =. b\nz as c == d *} e\nw as 10b *- 7o =e 1.5e3\n} rest of line\n"
+
+
+def sources():
+    for input_path in sorted(glob.glob(os.path.join(tests_dir, "*", "input.txt"))):
+        with open(input_path, "rb") as f:
+            yield input_path, f.read()
+    # the same lines shifted by one character at a time against the chunk boundaries
+    yield "lookaheads", "".join(" " * shift + lookaheads for shift in range(40)).encode() + b"end\n"
+
+
+def scan(source, engine, chunk_size=None):
+    scanner = Scanner(io.BytesIO(source), CompilationContext(), chunk_size=chunk_size or 8192, engine=engine)
+    tokens = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        if chunk_size is None:
+            token = scanner.get_next_token()
+            while token[0] != "EOF":
+                tokens.append(token)
+                token = scanner.get_next_token()
+        else:
+            tokens = list(scanner.iter_tokens())
+    return [(kind, scanner.id_to_lexim(value)) if kind == "ID" else (kind, value) for kind, value in tokens]
+
+
+class StreamingTest(unittest.TestCase):
+
+    def test_chunks_match_bulk(self):
+        for name, source in sources():
+            for engine in engines:
+                expected = scan(source, engine)
+                for chunk_size in chunk_sizes:
+                    with self.subTest(source=name, engine=engine, chunk_size=chunk_size):
+                        self.assertEqual(scan(source, engine, chunk_size), expected)
+
+
+class ErrorFlagTest(unittest.TestCase):
+    ''' which lexical errors keep the program from being compiled further '''
+
+    def error_flag(self, source):
+        context = CompilationContext()
+        scanner = Scanner(io.BytesIO(source.encode()), context)
+        with contextlib.redirect_stdout(io.StringIO()):
+            while scanner.get_next_token()[0] != "EOF":
+                pass
+        self.assertTrue(scanner.lexical_errors.startswith("#1 : Lexical Error!"), scanner.lexical_errors)
+        return context.error_flag
+
+    def test_invalid_number_is_not_flagged(self):
+        self.assertFalse(self.error_flag("x as 12z \nend\n"))
+
+    def test_other_errors_are_flagged(self):
+        for source in ("x as 12b \nend\n", "x as 9o \nend\n", "x as 1 # 2\nend\n", "x as 1 {\n"):
+            with self.subTest(source=source):
+                self.assertTrue(self.error_flag(source))
+
+
+if __name__ == "__main__":
+    unittest.main()
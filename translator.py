@@ -0,0 +1,455 @@
+'''
+Translator of the three-address code of CodeGen to Python source
+
+Turns a whole program block into one generated Python function, compiles it
+with compile()/exec and runs it with the semantics of vm.VirtualMachine:
+
+    - the program is split into basic blocks at jump targets, after jumps and,
+      when the program has indirect jumps, at every immediate that could be a
+      return address; each block becomes straight-line Python code and JP/JPF
+      assign the id of the next block to a dispatch variable
+    - the blocks are selected by a binary tree of comparisons on that id
+    - directly addressed words that never appear as an immediate (so no
+      pointer is expected to reach them) become local variables, None until
+      written; reads check for None only where a forward must-analysis cannot
+      prove the word written on every path
+    - the step budget is charged per block on entry; a block that would
+      overrun it is left to the virtual machine, which finishes the run
+      instruction by instruction so that it stops at the exact step; when an
+      instruction fails, the line of the generated code the error comes from
+      tells which one, and the steps of the rest of its block are given back
+
+The promotion of words to locals is guarded at run time: an indirect access
+that reaches a promoted word, or an indirect jump into the middle of a block,
+abandons the translated run and the program is run again from the start by
+the virtual machine. Programs with direct addresses outside the memory
+budget are run by the virtual machine right away.
+'''
+
+from bisect import bisect_right
+from code_gen import Opcode, DIRECT, IMMEDIATE, INDIRECT
+from vm import (VirtualMachine, VMError, MemoryAccessError, InvalidCommandError, MAX_STEPS, MEMORY_SIZE, decode)
+
+jumps = frozenset([Opcode.JP, Opcode.JPF])
+# opcodes that create their result word before reading their operands
+creates_result = frozenset([Opcode.ADD, Opcode.SUB, Opcode.MULT, Opcode.LT, Opcode.ASSIGN])
+
+_expressions = {
+    Opcode.ADD: "(({} + {} + 2147483648) & 4294967295) - 2147483648",
+    Opcode.SUB: "(({} - {} + 2147483648) & 4294967295) - 2147483648",
+    Opcode.MULT: "(({} * {} + 2147483648) & 4294967295) - 2147483648",
+    Opcode.EQ: "(1 if {} == {} else 0)",
+    Opcode.LT: "(1 if {} < {} else 0)",
+    Opcode.ASSIGN: "{}",
+}
+
+
+class Deoptimize(Exception):
+    ''' the translated program met a case it was not translated for '''
+
+
+class Handoff(Exception):
+    ''' the step budget runs out inside the block at pc, the virtual machine
+        continues from there with the memory and steps of the translated run '''
+
+    def __init__(self, pc):
+        self.pc = pc
+
+
+def _uninitialized():
+    raise MemoryAccessError()
+
+
+def _memory_access(memory, promoted, block_of, end):
+    ''' the helpers of the generated code for words that are not locals '''
+    size = len(memory)
+
+    def load(address):
+        if address in promoted:
+            raise Deoptimize()
+        if 0 <= address < size:
+            value = memory[address]
+            if value is not None:
+                return value
+        raise MemoryAccessError()
+
+    def store(address, value):
+        if address in promoted:
+            raise Deoptimize()
+        if not 0 <= address < size:
+            raise MemoryAccessError()
+        memory[address] = value
+
+    def create(address):
+        if address in promoted:
+            raise Deoptimize()
+        if not 0 <= address < size:
+            raise MemoryAccessError()
+        if not memory[address]:
+            memory[address] = 0
+        return address
+
+    def target(pc):
+        block = block_of.get(pc)
+        if block is not None:
+            return block
+        if pc < 0:
+            raise InvalidCommandError()
+        if pc >= end:
+            return len(block_of)
+        raise Deoptimize()
+
+    return load, store, create, target
+
+
+class Translator(object):
+    ''' Translates one program block. source is the generated Python code,
+        promoted the set of addresses held in locals '''
+
+    def __init__(self, program_block, memory_size=MEMORY_SIZE):
+        self.program = [decode(instruction) for instruction in program_block]
+        self.memory_size = memory_size
+        self.leaders = []
+        self.block_of = {} # index of the first instruction of a block -> block id
+        self.indirect = False # the program has indirect jumps
+        self.promoted = frozenset()
+        self.source = None
+        self.pcs = {} # line of the generated source -> instruction index
+
+
+    def translatable(self):
+        ''' every direct address must be inside the memory budget '''
+        for decoded in self.program:
+            if decoded is None:
+                continue
+            opcode, operands = decoded
+            for k, (mode, value) in enumerate(operands):
+                is_target = opcode in jumps and k == len(operands) - 1
+                if not is_target and mode != INDIRECT and (mode == DIRECT or k == len(operands) - 1) \
+                        and not 0 <= value < self.memory_size:
+                    return False
+        return True
+
+
+    def find_blocks(self):
+        program = self.program
+        n = len(program)
+        leaders = {0}
+        indirect = False
+        for i, decoded in enumerate(program):
+            if decoded is None:
+                continue
+            opcode, operands = decoded
+            if opcode in jumps:
+                leaders.add(i + 1)
+                mode, target = operands[-1]
+                if mode == INDIRECT:
+                    indirect = True
+                else:
+                    leaders.add(target)
+        if indirect:
+            # return addresses are stored as immediates
+            for decoded in program:
+                if decoded is not None:
+                    leaders.update(value for mode, value in decoded[1] if mode == IMMEDIATE)
+        self.leaders = sorted(leader for leader in leaders if 0 <= leader < n)
+        self.block_of = {leader: block for block, leader in enumerate(self.leaders)}
+        self.indirect = indirect
+
+
+    def promote(self):
+        taken, direct = set(), set()
+        for decoded in self.program:
+            if decoded is None:
+                continue
+            opcode, operands = decoded
+            for k, (mode, value) in enumerate(operands):
+                if opcode in jumps and k == len(operands) - 1:
+                    continue
+                if mode == IMMEDIATE:
+                    taken.add(value)
+                else:
+                    direct.add(value)
+        self.promoted = frozenset(direct - taken)
+
+
+    def block_range(self, block):
+        start = self.leaders[block]
+        end = self.leaders[block + 1] if block + 1 < len(self.leaders) else len(self.program)
+        return start, end
+
+
+    def successors(self, block):
+        start, end = self.block_range(block)
+        last = self.program[end - 1]
+        result = []
+        if last is None:
+            return result
+        opcode, operands = last
+        if opcode in jumps:
+            mode, target = operands[-1]
+            if mode != INDIRECT and target in self.block_of:
+                result.append(self.block_of[target])
+            if opcode == Opcode.JP:
+                return result
+        if end in self.block_of:
+            result.append(self.block_of[end])
+        return result
+
+
+    def written_words(self, block):
+        ''' promoted words a block surely writes, or reads without failing, if it runs to its end '''
+        start, end = self.block_range(block)
+        words = set()
+        for decoded in self.program[start:end]:
+            if decoded is None:
+                break
+            opcode, operands = decoded
+            for k, (mode, value) in enumerate(operands):
+                if opcode in jumps and k == len(operands) - 1:
+                    continue
+                if mode == DIRECT and value in self.promoted:
+                    words.add(value)
+        return words
+
+
+    def initialized_on_entry(self):
+        ''' forward must-analysis: the promoted words written on every path to each block '''
+        n_blocks = len(self.leaders)
+        written = [self.written_words(block) for block in range(n_blocks)]
+        preds = [[] for _ in range(n_blocks)]
+        for block in range(n_blocks):
+            for successor in self.successors(block):
+                preds[successor].append(block)
+        # the entry and the blocks an indirect jump may enter start with nothing known
+        unknown = {0}
+        if self.indirect:
+            unknown = set(range(n_blocks))
+        entry = [set() if block in unknown else None for block in range(n_blocks)] # None: every word
+        changed = True
+        while changed:
+            changed = False
+            for block in range(n_blocks):
+                if block in unknown:
+                    continue
+                known = None
+                for pred in preds[block]:
+                    if entry[pred] is None:
+                        continue
+                    out = entry[pred] | written[pred]
+                    known = out if known is None else known & out
+                if known is None:
+                    continue
+                if entry[block] is None or known != entry[block]:
+                    entry[block] = known
+                    changed = True
+        return [words if words is not None else set() for words in entry]
+
+
+    def local(self, address):
+        return f"v{address}"
+
+
+    def pointer(self, address):
+        if address in self.promoted:
+            return f"({self.local(address)} or 0)"
+        return f"(m[{address}] or 0)"
+
+
+    def guard(self, name):
+        ''' condition that the address in name is a word of m '''
+        if self.promoted:
+            return f"not in promoted and 0 <= {name} < size"
+        return f">= 0 and {name} < size"
+
+
+    def value(self, operand, initialized):
+        mode, value = operand
+        if mode == IMMEDIATE:
+            return repr(value)
+        if mode == INDIRECT:
+            # the common case inline, load() rechecks and raises
+            return f"(m[a] if (a := {self.pointer(value)}) {self.guard('a')} and m[a] is not None else load(a))"
+        if value not in self.promoted:
+            return f"load({value})"
+        name = self.local(value)
+        if value in initialized:
+            return name
+        initialized.add(value)
+        return f"({name} if {name} is not None else uninitialized())"
+
+
+    def jump(self, target, indent):
+        if target < 0:
+            return [f"{indent}raise InvalidCommandError()"]
+        if target >= len(self.program):
+            return [f"{indent}return steps"]
+        return [f"{indent}block = {self.block_of[target]}"]
+
+
+    def translate_block(self, block, initialized, indent):
+        start, end = self.block_range(block)
+        lines = [f"{indent}if steps > max_steps - {end - start}: raise Handoff({start})",
+                 f"{indent}steps += {end - start}"]
+        initialized = set(initialized)
+        for i in range(start, end):
+            first = len(lines)
+            last = self.translate_instruction(i, end, initialized, indent, lines)
+            # the line an error comes from tells which instruction failed
+            lines[first:] = [f"{line}  # {i}" for line in lines[first:]]
+            if last:
+                return lines
+        lines += self.jump(end, indent)
+        return lines
+
+
+    def translate_instruction(self, i, end, initialized, indent, lines):
+        ''' appends the code of instruction i to lines, True if it ends the block '''
+        decoded = self.program[i]
+        if decoded is None:
+            lines.append(f"{indent}raise InvalidCommandError()")
+            return True
+        opcode, operands = decoded
+        if opcode == Opcode.PRINT:
+            lines.append(f"{indent}out({self.value(operands[0], initialized)})")
+        elif opcode == Opcode.JP:
+            mode, target = operands[0]
+            if mode == INDIRECT:
+                lines.append(f"{indent}block = target({self.pointer(target)})")
+            else:
+                lines += self.jump(target, indent)
+            return True
+        elif opcode == Opcode.JPF:
+            mode, target = operands[1]
+            lines.append(f"{indent}if {self.value(operands[0], initialized)} == 0:")
+            if mode == INDIRECT:
+                lines.append(f"{indent}    block = target({self.pointer(target)})")
+            else:
+                lines += self.jump(target, indent + "    ")
+            lines.append(f"{indent}else:")
+            lines += self.jump(end, indent + "    ")
+            return True
+        else:
+            lines += self.translate_op(opcode, operands, initialized, indent)
+        return False
+
+
+    def translate_op(self, opcode, operands, initialized, indent):
+        lines = []
+        sources, (mode, address) = operands[:-1], operands[-1]
+        creates = opcode in creates_result
+        if mode == INDIRECT:
+            if creates:
+                lines.append(f"{indent}d = {self.pointer(address)}")
+                lines.append(f"{indent}if not (d {self.guard('d')} and m[d] is not None): d = create(d)")
+                dest = "m[d]"
+            else:
+                expression = _expressions[opcode].format(*(self.value(source, initialized) for source in sources))
+                return [f"{indent}store({self.pointer(address)}, {expression})"]
+        elif address in self.promoted:
+            dest = self.local(address)
+            if creates and address not in initialized and (DIRECT, address) in sources:
+                lines.append(f"{indent}if {dest} is None: {dest} = 0")
+                initialized.add(address)
+        else:
+            dest = f"m[{address}]"
+            if creates and ((DIRECT, address) in sources or any(source[0] == INDIRECT for source in sources)):
+                lines.append(f"{indent}if {dest} is None: {dest} = 0")
+        expression = _expressions[opcode].format(*(self.value(source, initialized) for source in sources))
+        lines.append(f"{indent}{dest} = {expression}")
+        if address in self.promoted and mode != INDIRECT:
+            initialized.add(address)
+        return lines
+
+
+    def dispatch(self, blocks, entry, indent):
+        ''' binary search over the block ids in blocks, the end block past the last '''
+        if len(blocks) == 1:
+            block = blocks[0]
+            if block == len(self.leaders):
+                return [f"{indent}return steps"]
+            return self.translate_block(block, entry[block], indent)
+        middle = len(blocks) // 2
+        return ([f"{indent}if block < {blocks[middle]}:"] + self.dispatch(blocks[:middle], entry, indent + "    ") +
+                [f"{indent}else:"] + self.dispatch(blocks[middle:], entry, indent + "    "))
+
+
+    def translate(self):
+        self.find_blocks()
+        self.promote()
+        entry = self.initialized_on_entry()
+        lines = ["def program(m, out, max_steps, load, store, create, target, promoted, size):"]
+        if self.promoted:
+            lines.append("    " + " = ".join(self.local(address) for address in sorted(self.promoted)) + " = None")
+        lines += ["    steps = 0",
+                  "    block = 0",
+                  "    try:",
+                  "        while True:"]
+        lines += self.dispatch(list(range(len(self.leaders) + 1)), entry, " " * 12)
+        lines += ["    except (Handoff, VMError) as stop:",
+                  "        stop.steps = steps",
+                  "        raise"]
+        if self.promoted:
+            # promoted words go back to memory however the run ends, the virtual machine
+            # continues with them after a handoff and they are part of the final memory
+            lines += ["    finally:"]
+            lines += [f"        m[{address}] = {self.local(address)}" for address in sorted(self.promoted)]
+        self.pcs = {lineno: int(line.rsplit("  # ", 1)[1])
+                    for lineno, line in enumerate(lines, 1) if "  # " in line}
+        self.source = "\n".join(lines) + "\n"
+        return self.source
+
+
+    def stopped(self, machine, error, code):
+        ''' makes the machine of a run that raised error in the generated code
+            look like the virtual machine stopped at the failing instruction '''
+        traceback = error.__traceback__
+        while traceback.tb_frame.f_code is not code:
+            traceback = traceback.tb_next
+        pc = self.pcs[traceback.tb_lineno]
+        # the block was charged whole on entry, the instructions after pc did not run
+        _, end = self.block_range(bisect_right(self.leaders, pc) - 1)
+        machine.steps = error.steps - (end - pc - 1)
+        opcode, operands = self.program[pc] or (None, ())
+        if opcode in creates_result and operands[-1][0] != INDIRECT and machine.memory[operands[-1][1]] is None:
+            # the virtual machine creates the result word before it reads the operand that failed
+            machine.memory[operands[-1][1]] = 0
+
+
+    def compile(self):
+        ''' the generated function '''
+        namespace = {
+            "VMError": VMError,
+            "Deoptimize": Deoptimize,
+            "InvalidCommandError": InvalidCommandError,
+            "Handoff": Handoff,
+            "uninitialized": _uninitialized,
+        }
+        code = compile(self.translate(), "<translated program>", "exec")
+        exec(code, namespace)
+        return namespace["program"]
+
+
+def run(program_block, max_steps=MAX_STEPS, memory_size=MEMORY_SIZE):
+    ''' runs program_block as translated Python code and returns a finished
+        VirtualMachine with its output, error and step count '''
+    machine = VirtualMachine(program_block, max_steps, memory_size)
+    translator = Translator(program_block, memory_size)
+    if not translator.translatable():
+        machine.run()
+        return machine
+    program = translator.compile()
+    helpers = _memory_access(machine.memory, translator.promoted, translator.block_of, len(translator.program))
+    try:
+        machine.steps = program(machine.memory, machine.output.append, max_steps, *helpers,
+                                translator.promoted, len(machine.memory))
+    except Deoptimize:
+        machine = VirtualMachine(program_block, max_steps, memory_size)
+        machine.run()
+    except Handoff as handoff:
+        machine.pc, machine.steps = handoff.pc, handoff.steps
+        machine.run()
+    except VMError as error:
+        machine.error = error
+        translator.stopped(machine, error, program.__code__)
+    return machine
@@ -0,0 +1,563 @@
+'''
+Virtual machine for the three-address code of CodeGen
+
+Executes CodeGen.program_block in memory, with the semantics of the course
+tester (interpreter/tester_*):
+
+    - memory is a flat list of words indexed by address, None until written;
+      reading a word that was never written is an invalid memory access
+    - ADD, SUB, MULT, LT and ASSIGN create their result word (as 0) before
+      reading their operands, EQ only after, so ADD 100, #1, 100 works on a
+      fresh word 100 and EQ 100, #1, 100 does not
+    - a pointer (the word behind @x, or an indirect jump target) that was
+      never written is 0
+    - arithmetic wraps around at 32 bits, EQ and LT store 1 or 0
+    - JPF jumps when its operand is 0, jumping past the last instruction stops
+      the program
+    - immediates are read like std::stoi reads them from output.txt, so #1.5
+      is 1 and #12abc is 12
+    - PLACEHOLDER and malformed instructions are invalid commands
+    - every error stops the program
+
+The program is pre-decoded into closures (ThreadedCode) with the jump
+targets resolved, and frequent neighbours are fused into superinstructions,
+so most instructions cost no trip through the dispatch loop. The dispatch
+table of VirtualMachine executes single instructions.
+
+Unlike the tester, which only stops when its process is killed, the machine
+has deterministic budgets: max_steps executed instructions and memory_size
+addresses (every address outside [0, memory_size) is an invalid access).
+'''
+
+import re
+
+from code_gen import Opcode, DIRECT, IMMEDIATE, INDIRECT
+
+MAX_STEPS = 10 ** 7
+MEMORY_SIZE = 1 << 20 # addresses, the stack grows up from 10008
+
+INT_MIN, INT_MAX = -2 ** 31, 2 ** 31 - 1
+
+_stoi_pattern = re.compile(r"[ \t\n\v\f\r]*([+-]?[0-9]+)")
+
+
+class VMError(Exception):
+    ''' stops the program, str() is the line the tester prints for it. executed
+        is set by a superinstruction that fails part way: the number of its
+        instructions that ran, the failing one included '''
+
+    executed = None
+
+
+class MemoryAccessError(VMError):
+    def __str__(self):
+        return "ERROR : Invalid access to memory"
+
+
+class InvalidCommandError(VMError):
+    def __str__(self):
+        return "ERROR : Invalid Command"
+
+
+class StepLimitError(VMError):
+    def __str__(self):
+        return "RuntimeError: Execution timed out!"
+
+
+def stoi(value):
+    ''' the int std::stoi makes of the text of value, None where it throws '''
+    match = _stoi_pattern.match(str(value))
+    if match is None:
+        return None
+    result = int(match.group(1))
+    return result if INT_MIN <= result <= INT_MAX else None
+
+
+def wrap(value):
+    return ((value - INT_MIN) & 0xFFFFFFFF) + INT_MIN
+
+
+# number of operands of every opcode the machine executes
+arity = {
+    Opcode.ADD: 3, Opcode.SUB: 3, Opcode.MULT: 3, Opcode.EQ: 3, Opcode.LT: 3,
+    Opcode.ASSIGN: 2, Opcode.JPF: 2, Opcode.JP: 1, Opcode.PRINT: 1,
+}
+
+
+def decode(instruction):
+    ''' (opcode, operands) with int operand values, or None for an invalid command '''
+    if arity.get(instruction.opcode) != len(instruction.operands):
+        return None
+    operands = []
+    for mode, value in instruction.operands:
+        if type(value) is not int or not INT_MIN <= value <= INT_MAX:
+            value = stoi(value)
+            if value is None:
+                return None
+        operands.append((mode, value))
+    return instruction.opcode, tuple(operands)
+
+
+_binary = {
+    Opcode.ADD: lambda x, y: ((x + y - INT_MIN) & 0xFFFFFFFF) + INT_MIN,
+    Opcode.SUB: lambda x, y: ((x - y - INT_MIN) & 0xFFFFFFFF) + INT_MIN,
+    Opcode.MULT: lambda x, y: ((x * y - INT_MIN) & 0xFFFFFFFF) + INT_MIN,
+    Opcode.EQ: lambda x, y: 1 if x == y else 0,
+    Opcode.LT: lambda x, y: 1 if x < y else 0,
+}
+# opcodes that create their result word before reading their operands
+creates_result = frozenset([Opcode.ADD, Opcode.SUB, Opcode.MULT, Opcode.LT, Opcode.ASSIGN])
+
+
+def _invalid_access():
+    raise MemoryAccessError()
+
+
+def _invalid_command():
+    raise InvalidCommandError()
+
+
+class ThreadedCode(object):
+    ''' A program pre-decoded into closures. closures[pc]() executes the code
+        starting at pc and returns the pc to continue at, weights[pc] is the
+        number of instructions it executes. Every instruction has a closure of
+        its own in single, closures holds the superinstructions where adjacent
+        instructions were fused:
+
+            - compare: LT/EQ into t followed by JPF t
+            - address: ADD x, #k, t (one or two of them) followed by an
+              instruction that accesses @t, which gets the address directly
+            - constants: a run of ASSIGN #c, x, like the constant pool setup
+
+        fusions counts the superinstructions of every kind '''
+
+    def __init__(self, program, memory, output):
+        self.program = program
+        self.memory = memory
+        self.size = len(memory)
+        self.print_value = output.append
+        self.single = [self.compile(pc) for pc in range(len(program))]
+        self.closures = list(self.single)
+        self.weights = [1] * len(program)
+        self.fusions = {"compare": 0, "address": 0, "constants": 0}
+        pc = 0
+        while pc < len(program):
+            weight = self.fuse(pc)
+            pc += weight
+
+
+    def in_memory(self, operand):
+        mode, value = operand
+        return mode != INDIRECT and 0 <= value < self.size
+
+
+    def reader(self, operand, pointers):
+        ''' closure that returns the value of a source operand. pointers maps
+            temps whose value was just computed to a box holding it '''
+        m, size = self.memory, self.size
+        mode, value = operand
+        if mode == IMMEDIATE:
+            return lambda: value
+        if mode == DIRECT:
+            if not 0 <= value < size:
+                return _invalid_access
+            def read():
+                result = m[value]
+                if result is None:
+                    raise MemoryAccessError()
+                return result
+            return read
+        if value in pointers:
+            box = pointers[value]
+            def read_through():
+                address = box[0]
+                if 0 <= address < size:
+                    result = m[address]
+                    if result is not None:
+                        return result
+                raise MemoryAccessError()
+            return read_through
+        if not 0 <= value < size:
+            # an unwritten pointer is 0
+            return self.reader((DIRECT, 0), pointers)
+        def read_indirect():
+            address = m[value] or 0
+            if 0 <= address < size:
+                result = m[address]
+                if result is not None:
+                    return result
+            raise MemoryAccessError()
+        return read_indirect
+
+
+    def pointer(self, operand, pointers):
+        ''' closure that returns the address an operand writes to or jumps to '''
+        m, size = self.memory, self.size
+        mode, value = operand
+        if mode != INDIRECT:
+            return lambda: value
+        if value in pointers:
+            box = pointers[value]
+            return lambda: box[0]
+        if not 0 <= value < size:
+            return lambda: 0
+        return lambda: m[value] or 0
+
+
+    def compile(self, pc, pointers={}):
+        ''' closure of the single instruction at pc '''
+        decoded = self.program[pc]
+        if decoded is None:
+            return _invalid_command
+        m, size = self.memory, self.size
+        opcode, operands = decoded
+        following = pc + 1
+
+        if opcode == Opcode.PRINT:
+            read, print_value = self.reader(operands[0], pointers), self.print_value
+            def op_print():
+                print_value(read())
+                return following
+            return op_print
+
+        if opcode == Opcode.JP or opcode == Opcode.JPF:
+            target = operands[-1]
+            if target[0] == INDIRECT:
+                address = self.pointer(target, pointers)
+                def jump():
+                    pc = address()
+                    if pc < 0:
+                        raise InvalidCommandError()
+                    return pc
+            elif target[1] < 0:
+                jump = _invalid_command
+            else:
+                resolved = target[1]
+                jump = lambda: resolved
+            if opcode == Opcode.JP:
+                return jump
+            read = self.reader(operands[0], pointers)
+            def op_jpf():
+                return jump() if read() == 0 else following
+            return op_jpf
+
+        sources = [self.reader(operand, pointers) for operand in operands[:-1]]
+        if opcode == Opcode.ASSIGN:
+            compute = sources[0]
+        else:
+            function, read_a, read_b = _binary[opcode], sources[0], sources[1]
+            compute = lambda: function(read_a(), read_b())
+        dest = operands[-1]
+
+        if dest[0] != INDIRECT:
+            address = dest[1]
+            if not 0 <= address < size:
+                # both orders of creating and reading fail on the same error
+                return _invalid_access
+            if opcode in creates_result:
+                def op_create():
+                    if m[address] is None:
+                        m[address] = 0
+                    m[address] = compute()
+                    return following
+                return op_create
+            def op():
+                m[address] = compute()
+                return following
+            return op
+
+        address_of = self.pointer(dest, pointers)
+        create = opcode in creates_result
+        def op_indirect():
+            address = address_of()
+            if create:
+                if not 0 <= address < size:
+                    raise MemoryAccessError()
+                if m[address] is None:
+                    m[address] = 0
+                m[address] = compute()
+            else:
+                value = compute()
+                if not 0 <= address < size:
+                    raise MemoryAccessError()
+                m[address] = value
+            return following
+        return op_indirect
+
+
+    def fuse(self, pc):
+        ''' installs a superinstruction at pc if one applies, returns its weight '''
+        for fusion in (self.fuse_constants, self.fuse_compare, self.fuse_address):
+            weight = fusion(pc)
+            if weight > 1:
+                self.weights[pc] = weight
+                return weight
+        return 1
+
+
+    def decoded(self, pc):
+        return self.program[pc] if pc < len(self.program) else None
+
+
+    def fuse_constants(self, pc):
+        m = self.memory
+        stores = []
+        while True:
+            decoded = self.decoded(pc + len(stores))
+            if decoded is None or decoded[0] != Opcode.ASSIGN:
+                break
+            (source_mode, value), dest = decoded[1]
+            if source_mode != IMMEDIATE or not self.in_memory(dest):
+                break
+            stores.append((dest[1], value))
+        if len(stores) < 2:
+            return 1
+        following = pc + len(stores)
+        def op_constants():
+            for address, value in stores:
+                m[address] = value
+            return following
+        self.closures[pc] = op_constants
+        self.fusions["constants"] += 1
+        return len(stores)
+
+
+    def fuse_compare(self, pc):
+        m = self.memory
+        compare, branch = self.decoded(pc), self.decoded(pc + 1)
+        if compare is None or branch is None or compare[0] not in (Opcode.LT, Opcode.EQ) or branch[0] != Opcode.JPF:
+            return 1
+        a, b, dest = compare[1]
+        condition, (target_mode, target) = branch[1]
+        if not self.in_memory(dest) or condition != (DIRECT, dest[1]) or target_mode == INDIRECT or target < 0:
+            return 1
+        address = dest[1]
+        read_a, read_b = self.reader(a, {}), self.reader(b, {})
+        create = compare[0] == Opcode.LT
+        following = pc + 2
+        if compare[0] == Opcode.LT:
+            test = lambda: read_a() < read_b()
+        else:
+            test = lambda: read_a() == read_b()
+        def op_compare():
+            if create and m[address] is None:
+                m[address] = 0
+            try:
+                taken = test()
+            except VMError as error:
+                error.executed = 1
+                raise
+            if taken:
+                m[address] = 1
+                return following
+            m[address] = 0
+            return target
+        self.closures[pc] = op_compare
+        self.fusions["compare"] += 1
+        return 2
+
+
+    def fuse_address(self, pc):
+        ''' up to two ADD x, #k, t and the instruction after them that accesses @t '''
+        m = self.memory
+        pointers, steps = {}, []
+        for offset in range(3):
+            decoded = self.decoded(pc + offset)
+            if decoded is None:
+                return 1
+            opcode, operands = decoded
+            if any(mode == INDIRECT and value in pointers for mode, value in operands):
+                break
+            if offset == 2 or opcode != Opcode.ADD:
+                return 1
+            base, (offset_mode, constant), dest = operands
+            if offset_mode != IMMEDIATE or not self.in_memory(dest):
+                return 1
+            box = [0]
+            pointers[dest[1]] = box
+            steps.append((self.reader(base, {}), constant, dest[1], box))
+        else:
+            return 1
+        if not steps or opcode in (Opcode.JP, Opcode.JPF):
+            return 1
+        user = self.compile(pc + len(steps), pointers)
+        def op_address():
+            try:
+                for executed, (read_base, constant, address, box) in enumerate(steps, 1):
+                    if m[address] is None:
+                        m[address] = 0
+                    box[0] = m[address] = ((read_base() + constant - INT_MIN) & 0xFFFFFFFF) + INT_MIN
+            except VMError as error:
+                error.executed = executed
+                raise
+            return user()
+        self.closures[pc] = op_address
+        self.fusions["address"] += 1
+        return len(steps) + 1
+
+
+class VirtualMachine(object):
+    ''' Runs one program. output holds the printed values, error the VMError
+        that stopped the program, if any, and stats the instruction count,
+        the superinstructions of every kind and the dispatches of a run '''
+
+    def __init__(self, program_block, max_steps=MAX_STEPS, memory_size=MEMORY_SIZE):
+        self.program = [decode(instruction) for instruction in program_block]
+        self.max_steps = max_steps
+        self.memory = [None] * memory_size
+        self.pc = 0
+        self.steps = 0
+        self.output = []
+        self.error = None
+        self.stats = {}
+
+
+    def load(self, address):
+        if 0 <= address < len(self.memory):
+            value = self.memory[address]
+            if value is not None:
+                return value
+        raise MemoryAccessError()
+
+
+    def store(self, address, value):
+        if not 0 <= address < len(self.memory):
+            raise MemoryAccessError()
+        self.memory[address] = value
+
+
+    def pointer(self, address):
+        if 0 <= address < len(self.memory):
+            return self.memory[address] or 0
+        return 0
+
+
+    def read(self, operand):
+        mode, value = operand
+        if mode == IMMEDIATE:
+            return value
+        if mode == INDIRECT:
+            value = self.pointer(value)
+        return self.load(value)
+
+
+    def address(self, operand):
+        ''' address an operand writes to or jumps to, the tester ignores a # there '''
+        mode, value = operand
+        if mode == INDIRECT:
+            return self.pointer(value)
+        return value
+
+
+    def result(self, operand):
+        ''' address of a result word, created before the operands are read '''
+        address = self.address(operand)
+        if self.pointer(address) == 0:
+            self.store(address, 0)
+        return address
+
+
+    def step(self):
+        ''' executes the instruction at pc through the dispatch table '''
+        if self.steps == self.max_steps:
+            raise StepLimitError()
+        self.steps += 1
+        instruction = self.program[self.pc]
+        if instruction is None:
+            raise InvalidCommandError()
+        opcode, operands = instruction
+        self.pc += 1
+        self.dispatch[opcode](self, *operands)
+
+
+    def run(self):
+        ''' runs the threaded code until the budget is nearly used up, the
+            last instructions are stepped one by one so that it ends exactly '''
+        code = ThreadedCode(self.program, self.memory, self.output)
+        closures, weights, n = code.closures, code.weights, len(self.program)
+        pc, steps, limit = self.pc, self.steps, self.max_steps
+        dispatches = 0
+        try:
+            try:
+                while pc < n:
+                    weight = weights[pc]
+                    if steps + weight > limit:
+                        break
+                    steps += weight
+                    dispatches += 1
+                    pc = closures[pc]()
+            except VMError as error:
+                if error.executed is not None:
+                    # only part of the superinstruction ran
+                    steps -= weights[pc] - error.executed
+                raise
+            finally:
+                self.pc, self.steps = pc, steps
+            while self.pc < n:
+                self.step()
+                dispatches += 1
+        except VMError as error:
+            self.error = error
+        self.stats = {"instructions": n, "fusions": code.fusions, "dispatches": dispatches}
+        return self.output
+
+
+    def report(self):
+        ''' the lines the tester prints for the run, without its trace '''
+        lines = [f"PRINT    {value}" for value in self.output]
+        if self.error is not None:
+            lines.append(str(self.error))
+        return "\n".join(lines)
+
+
+    def op_add(self, a, b, r):
+        r = self.result(r)
+        self.memory[r] = wrap(self.read(a) + self.read(b))
+
+    def op_sub(self, a, b, r):
+        r = self.result(r)
+        self.memory[r] = wrap(self.read(a) - self.read(b))
+
+    def op_mult(self, a, b, r):
+        r = self.result(r)
+        self.memory[r] = wrap(self.read(a) * self.read(b))
+
+    def op_eq(self, a, b, r):
+        self.store(self.address(r), int(self.read(a) == self.read(b)))
+
+    def op_lt(self, a, b, r):
+        r = self.result(r)
+        self.memory[r] = int(self.read(a) < self.read(b))
+
+    def op_assign(self, a, r):
+        r = self.result(r)
+        self.memory[r] = self.read(a)
+
+    def op_jpf(self, a, target):
+        if self.read(a) == 0:
+            self.jump(self.address(target))
+
+    def op_jp(self, target):
+        self.jump(self.address(target))
+
+    def op_print(self, a):
+        self.output.append(self.read(a))
+
+    def jump(self, target):
+        if target < 0:
+            raise InvalidCommandError()
+        self.pc = target
+
+
+    # Opcode -> handler, filled in once below
+    dispatch = {}
+
+for opcode in arity:
+    VirtualMachine.dispatch[opcode] = getattr(VirtualMachine, "op_" + opcode.name.lower())
+
+
+def run(program_block, max_steps=MAX_STEPS, memory_size=MEMORY_SIZE):
+    ''' runs program_block and returns the finished VirtualMachine '''
+    machine = VirtualMachine(program_block, max_steps, memory_size)
+    machine.run()
+    return machine